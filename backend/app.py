@@ -1,18 +1,96 @@
-from flask import Flask, request, jsonify
-from services.config_service import procesar_configuracion
-from services.consumo_service import procesar_consumo
+import gzip
+import logging
+import os
+import time
+import zlib
+from flask import Flask, Response, g, request, jsonify, send_file
+from services.config_service import procesar_configuracion, procesar_configuracion_stream
+from services.consumo_service import procesar_consumo, procesar_consumo_stream
 from services.facturacion_service import generar_facturas
-from services.report_service import generar_reporte_factura, generar_analisis_ventas
-from database.xml_storage import (
-    reset_database, guardar_recurso, guardar_categoria, guardar_cliente, 
+from services.consulta_service import consultar_pagina, leer_parametros, exportar, PARAMETROS_PAGINACION, FORMATOS_EXPORTACION
+from services.trabajos_service import encolar_reporte, obtener_trabajo, COMPLETADO
+from database.storage import (
+    estadisticas_cache, reset_database, guardar_recurso, guardar_categoria, guardar_cliente, 
     guardar_consumo, guardar_factura, cargar_recursos, cargar_categorias, 
     cargar_clientes, cargar_consumos, cargar_facturas
 )
 from database.models import Recurso, Configuracion, Categoria, Cliente
 from utils.validators import validar_nit
+from utils import metricas, perfilado
+import config
+
+logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# ========== MÉTRICAS ==========
+@app.before_request
+def _iniciar_medicion():
+    request.environ['ipc2.inicio'] = time.perf_counter()
+
+@app.after_request
+def _registrar_peticion(response):
+    # La regla de la ruta (p. ej. /consultar/<tipo>) y no la URL, para no crear una serie por valor
+    ruta = request.url_rule.rule if request.url_rule else 'desconocida'
+    inicio = request.environ.get('ipc2.inicio')
+    if inicio is not None:
+        metricas.observar('ipc2_peticion_segundos', time.perf_counter() - inicio, ruta=ruta)
+    metricas.contar('ipc2_peticiones_total', ruta=ruta, metodo=request.method, codigo=response.status_code)
+    return response
+
+# ========== PERFILADO ==========
+@app.before_request
+def _iniciar_perfil():
+    if not config.PERFILADO_HABILITADO:
+        return
+    modo = perfilado.modo_solicitado(request.headers.get(perfilado.CABECERA, request.args.get(perfilado.PARAMETRO)))
+    if modo is None:
+        return
+    perfil_id = perfilado.id_perfil(request.headers.get('X-Request-Id'))
+    perfilador = perfilado.Perfilador(perfil_id, modo, f'{request.method} {request.path}')
+    if perfilador.iniciar():
+        g.perfilador = perfilador
+
+@app.after_request
+def _anunciar_perfil(response):
+    perfilador = g.get('perfilador')
+    if perfilador is not None:
+        response.headers['X-Perfil-Id'] = perfilador.perfil_id
+    return response
+
+@app.teardown_request
+def _guardar_perfil(_error):
+    # En teardown para que el perfil se guarde también si el handler lanzó una excepción
+    perfilador = g.pop('perfilador', None)
+    if perfilador is not None:
+        perfilador.detener()
+
+def _perfil_trabajo():
+    """(id, modo) para perfilar también el render en el pool, o None si la petición no se perfila"""
+    perfilador = g.get('perfilador')
+    if perfilador is None:
+        return None
+    return f'{perfilador.perfil_id}_trabajo', perfilador.modo
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas del proceso en el formato de texto de Prometheus"""
+    cache = estadisticas_cache()
+    medidores = {
+        'ipc2_cache_lecturas_total': ('counter', 'Lecturas de la caché de almacenamiento por resultado', [
+            ({'resultado': 'acierto'}, cache.get('aciertos', 0)),
+            ({'resultado': 'fallo'}, cache.get('fallos', 0)),
+        ]),
+        'ipc2_cache_invalidaciones_total': ('counter', 'Invalidaciones de la caché de almacenamiento', [
+            ({}, cache.get('invalidaciones', 0)),
+        ]),
+        'ipc2_cache_entradas': ('gauge', 'Entradas en la caché de almacenamiento', [
+            ({}, cache.get('entradas', 0)),
+        ]),
+    }
+    return Response(metricas.exportar_prometheus(medidores), mimetype='text/plain; version=0.0.4')
+
 @app.route('/reset', methods=['POST'])
 def reset_sistema():
     try:
@@ -21,45 +99,114 @@ def reset_sistema():
     except Exception as e:
         return jsonify({"error": str(e)})
 
+def _cuerpo_xml():
+    """
+    Flujo con el XML del cuerpo, sin leerlo completo. Acepta cuerpos enviados
+    por partes (Transfer-Encoding: chunked) y comprimidos con gzip
+    (Content-Encoding: gzip), que se descomprimen a medida que se leen.
+    Devuelve None si la codificación no está soportada.
+    """
+    codificacion = request.headers.get('Content-Encoding', 'identity').strip().lower()
+    if codificacion in ('', 'identity'):
+        return request.stream
+    if codificacion in ('gzip', 'x-gzip'):
+        return gzip.GzipFile(fileobj=request.stream, mode='rb')
+    return None
+
+def _procesar_carga(procesar):
+    fuente = _cuerpo_xml()
+    if fuente is None:
+        return jsonify({"error": "Content-Encoding no soportado, use gzip o identity"}), 415
+    try:
+        # El cuerpo se procesa en streaming, sin cargarlo completo en memoria
+        resultado = procesar(fuente)
+    except (OSError, EOFError, zlib.error) as e:
+        # gzip corrupto o truncado; la configuración se combina por clave, así
+        # que volver a subirla completa no duplica lo que ya quedó guardado
+        return jsonify({"error": f"No se pudo descomprimir el archivo: {e}"}), 400
+    return jsonify(resultado), 400 if 'error' in resultado else 200
+
 @app.route('/configuracion', methods=['POST'])
 def recibir_configuracion():
-    xml_data = request.data.decode('utf-8')
-    resultado = procesar_configuracion(xml_data)
-    return jsonify(resultado)
+    return _procesar_carga(procesar_configuracion_stream)
 
 @app.route('/consumo', methods=['POST'])
 def recibir_consumo():
-    xml_data = request.data.decode('utf-8')
-    resultado = procesar_consumo(xml_data)
-    return jsonify(resultado)
+    return _procesar_carga(procesar_consumo_stream)
 
 @app.route('/facturacion', methods=['POST'])
 def facturar():
     data = request.json
     fecha_inicio = data.get('fecha_inicio')
     fecha_fin = data.get('fecha_fin')
-    resultado = generar_facturas(fecha_inicio, fecha_fin)
+    motor = data.get('motor', 'estandar')
+    resultado = generar_facturas(fecha_inicio, fecha_fin, motor)
     return jsonify(resultado)
 
+# Los reportes se generan en segundo plano: se devuelve el ID del trabajo
+# de inmediato y el PDF se consulta en /reporte/trabajo/<id>
 @app.route('/reporte/factura', methods=['POST'])
 def reporte_factura():
     data = request.json
-    numero_factura = data.get('numero_factura')
-    pdf_path = generar_reporte_factura(numero_factura)
-    return jsonify({"pdf_path": pdf_path})
+    trabajo = encolar_reporte('factura', {'numero_factura': data.get('numero_factura')}, perfil=_perfil_trabajo())
+    return jsonify(_respuesta_trabajo(trabajo)), 202
 
 @app.route('/reporte/ventas', methods=['POST'])
 def reporte_ventas():
     data = request.json
-    tipo = data.get('tipo')
-    fecha_inicio = data.get('fecha_inicio')
-    fecha_fin = data.get('fecha_fin')
-    pdf_path = generar_analisis_ventas(tipo, fecha_inicio, fecha_fin)
-    return jsonify({"pdf_path": pdf_path})
+    trabajo = encolar_reporte('ventas', {
+        'tipo': data.get('tipo'),
+        'fecha_inicio': data.get('fecha_inicio'),
+        'fecha_fin': data.get('fecha_fin')
+    }, perfil=_perfil_trabajo())
+    return jsonify(_respuesta_trabajo(trabajo)), 202
+
+@app.route('/reporte/trabajo/<trabajo_id>', methods=['GET'])
+def estado_reporte(trabajo_id):
+    trabajo = obtener_trabajo(trabajo_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(_respuesta_trabajo(trabajo))
+
+@app.route('/reporte/trabajo/<trabajo_id>/pdf', methods=['GET'])
+def descargar_reporte(trabajo_id):
+    trabajo = obtener_trabajo(trabajo_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    if trabajo['estado'] != COMPLETADO:
+        return jsonify(_respuesta_trabajo(trabajo)), 409
+    # La caché de reportes descarta los PDF menos usados, incluido quizá este
+    if not trabajo.get('pdf_path') or not os.path.exists(trabajo['pdf_path']):
+        return jsonify({"error": "El PDF ya no está disponible, vuelva a solicitar el reporte"}), 410
+    return send_file(trabajo['pdf_path'], mimetype='application/pdf',
+                     as_attachment=True, download_name=os.path.basename(trabajo['pdf_path']))
+
+def _respuesta_trabajo(trabajo):
+    return {
+        "trabajo_id": trabajo['id'],
+        "estado": trabajo['estado'],
+        "error": trabajo.get('error'),
+        "estado_url": f"/reporte/trabajo/{trabajo['id']}",
+        "descarga_url": f"/reporte/trabajo/{trabajo['id']}/pdf"
+    }
 
 @app.route('/consultar/<tipo>', methods=['GET'])
 def consultar_datos(tipo):
-    """Consulta datos desde los archivos separados"""
+    """
+    Consulta datos desde los archivos separados.
+    
+    Sin parámetros devuelve la lista completa, como siempre. Con cualquiera de
+    limite, cursor, nit, instancia, fecha_inicio, fecha_fin, numero o campos
+    devuelve una página {'datos': [...], 'siguiente': cursor}; para la página
+    siguiente se repite la consulta con cursor=<siguiente> y los mismos filtros.
+    """
+    if any(parametro in request.args for parametro in PARAMETROS_PAGINACION):
+        try:
+            filtros, campos, cursor, limite = leer_parametros(request.args)
+            return jsonify(consultar_pagina(tipo, filtros, campos, cursor, limite))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    
     if tipo == 'recursos':
         datos = cargar_recursos()
     elif tipo == 'categorias':
@@ -67,22 +214,40 @@ def consultar_datos(tipo):
     elif tipo == 'clientes':
         datos = cargar_clientes()
     elif tipo == 'consumos':
-        datos = cargar_consumos()
+        datos = [consumo.a_dict() for consumo in cargar_consumos()]
     elif tipo == 'facturas':
         datos = cargar_facturas()
     else:
         datos = []
     
-    print(f"🔍 CONSULTA - Tipo: {tipo}, Elementos encontrados: {len(datos)}")
+    logger.debug("🔍 CONSULTA - Tipo: %s, Elementos encontrados: %s", tipo, len(datos))
     return jsonify(datos)
 
+@app.route('/exportar/<tipo>', methods=['GET'])
+def exportar_datos(tipo):
+    """
+    Exporta todos los elementos de un tipo como NDJSON (por defecto) o como
+    arreglo JSON con ?formato=json. La respuesta se envía mientras se lee el
+    almacenamiento; admite los mismos filtros que /consultar/<tipo>.
+    """
+    formato = request.args.get('formato', 'ndjson')
+    try:
+        filtros = leer_parametros(request.args)[0]
+        bloques = exportar(tipo, formato, filtros)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    extension = 'ndjson' if formato == 'ndjson' else 'json'
+    return Response(bloques, mimetype=FORMATOS_EXPORTACION[formato],
+                    headers={'Content-Disposition': f'attachment; filename={tipo}.{extension}'})
+
 # NUEVAS RUTAS PARA CREAR DATOS
 @app.route('/crear/recurso', methods=['POST'])
 def crear_recurso():
     try:
-        print("🔧 BACKEND - Creando recurso...")
+        logger.debug("🔧 BACKEND - Creando recurso...")
         data = request.json
-        print(f"🔧 BACKEND - Datos recibidos: {data}")
+        logger.debug("🔧 BACKEND - Datos recibidos: %s", data)
         
         if not data:
             return jsonify({"error": "No se recibieron datos"}), 400
@@ -99,7 +264,7 @@ def crear_recurso():
             valor_x_hora=float(data.get('valor'))
         )
         
-        print(f"🔧 BACKEND - Guardando recurso: {nuevo_recurso.nombre}")
+        logger.debug("🔧 BACKEND - Guardando recurso: %s", nuevo_recurso.nombre)
         guardar_recurso(nuevo_recurso)
         
         return jsonify({
@@ -108,13 +273,13 @@ def crear_recurso():
         })
         
     except Exception as e:
-        print(f"🔧 BACKEND - Error: {str(e)}")
+        logger.error("🔧 BACKEND - Error: %s", str(e))
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
 @app.route('/crear/categoria', methods=['POST'])
 def crear_categoria():
     try:
-        print("🔧 BACKEND - Creando categoría...")
+        logger.debug("🔧 BACKEND - Creando categoría...")
         data = request.json
         
         nueva_categoria = Categoria(
@@ -129,12 +294,13 @@ def crear_categoria():
         return jsonify({"mensaje": "Categoría creada exitosamente"})
         
     except Exception as e:
+        logger.error("🔧 BACKEND - Error: %s", str(e))
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
 @app.route('/crear/cliente', methods=['POST'])
 def crear_cliente():
     try:
-        print("🔧 BACKEND - Creando cliente...")
+        logger.debug("🔧 BACKEND - Creando cliente...")
         data = request.json
         
         # Validar NIT
@@ -155,20 +321,21 @@ def crear_cliente():
         return jsonify({"mensaje": "Cliente creado exitosamente"})
         
     except Exception as e:
+        logger.error("🔧 BACKEND - Error: %s", str(e))
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
 @app.route('/crear/configuracion', methods=['POST'])
 def crear_configuracion():
     try:
         data = request.json
-        print(f"🔧 BACKEND - Creando configuración: {data}")
+        logger.debug("🔧 BACKEND - Creando configuración: %s", data)
         
         # Cargar categorías existentes
         categorias = cargar_categorias()
         
-        print(f"🔧 BACKEND - Categorías disponibles:")
+        logger.debug("🔧 BACKEND - Categorías disponibles:")
         for cat in categorias:
-            print(f"  - ID: '{cat['id']}' (tipo: {type(cat['id']).__name__}), Nombre: '{cat.get('nombre', 'N/A')}'")
+            logger.debug("  - ID: '%s' (tipo: %s), Nombre: '%s'", cat['id'], type(cat['id']).__name__, cat.get('nombre', 'N/A'))
         
         # Buscar la categoría donde agregar la configuración
         categoria_id = data.get('categoria_id')
@@ -176,15 +343,16 @@ def crear_configuracion():
         
         for categoria in categorias:
             # Comparar como strings para evitar problemas de tipo
-            print(f"🔧 BACKEND - Comparando: '{categoria['id']}' con '{categoria_id}'")
+            logger.debug("🔧 BACKEND - Comparando: '%s' con '%s'", categoria['id'], categoria_id)
             if str(categoria['id']) == str(categoria_id):
-                categoria_encontrada = categoria
-                print(f"🔧 BACKEND - ✅ Categoría encontrada: {categoria_encontrada['nombre']}")
+                # Copia: las categorías cargadas se comparten con la caché de lectura
+                categoria_encontrada = dict(categoria, configuraciones=list(categoria.get('configuraciones', [])))
+                logger.debug("🔧 BACKEND - ✅ Categoría encontrada: %s", categoria_encontrada['nombre'])
                 break
         
         if not categoria_encontrada:
-            print(f"🔧 BACKEND - ❌ ERROR: No se encontró categoría con ID {categoria_id}")
-            print(f"🔧 BACKEND - IDs disponibles: {[cat['id'] for cat in categorias]}")
+            logger.error("🔧 BACKEND - ❌ ERROR: No se encontró categoría con ID %s", categoria_id)
+            logger.debug("🔧 BACKEND - IDs disponibles: %s", [cat['id'] for cat in categorias])
             return jsonify({"error": f"Categoría con ID {categoria_id} no encontrada. IDs disponibles: {[cat['id'] for cat in categorias]}"}), 400
         
         # Generar ID único para la configuración
@@ -194,7 +362,7 @@ def crear_configuracion():
         recursos_config = {}
         for recurso in data.get('recursos', []):
             recursos_config[int(recurso['id'])] = float(recurso['cantidad'])
-            print(f"🔧 BACKEND - Recurso agregado: ID {recurso['id']}, Cantidad: {recurso['cantidad']}")
+            logger.debug("🔧 BACKEND - Recurso agregado: ID %s, Cantidad: %s", recurso['id'], recurso['cantidad'])
         
         # Crear objeto Configuracion
         nueva_configuracion = Configuracion(
@@ -243,7 +411,7 @@ def crear_configuracion():
         
         guardar_categoria(categoria_obj)
         
-        print(f"🔧 BACKEND - ✅ Configuración creada exitosamente: {config_dict}")
+        logger.debug("🔧 BACKEND - ✅ Configuración creada exitosamente: %s", config_dict)
         
         return jsonify({
             "mensaje": "Configuración creada exitosamente",
@@ -252,9 +420,9 @@ def crear_configuracion():
         })
         
     except Exception as e:
-        print(f"🔧 BACKEND - ❌ Error: {str(e)}")
+        logger.error("🔧 BACKEND - ❌ Error: %s", str(e))
         import traceback
-        print(f"🔧 BACKEND - Traceback: {traceback.format_exc()}")
+        logger.debug("🔧 BACKEND - Traceback: %s", traceback.format_exc())
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
 # FUNCIONES AUXILIARES PARA GENERAR IDs
@@ -262,58 +430,58 @@ def generar_id_recurso():
     try:
         # Usar la nueva función de carga de recursos
         recursos = cargar_recursos()
-        print(f"🔍 GENERAR_ID_RECURSO - Recursos encontrados: {len(recursos)}")
+        logger.debug("🔍 GENERAR_ID_RECURSO - Recursos encontrados: %s", len(recursos))
         
         if recursos:
             ids = []
             for r in recursos:
                 try:
                     ids.append(int(r['id']))
-                    print(f"🔍 Recurso encontrado: ID {r['id']} - {r['nombre']}")
+                    logger.debug("🔍 Recurso encontrado: ID %s - %s", r['id'], r['nombre'])
                 except (ValueError, KeyError) as e:
-                    print(f"⚠️  Error con ID del recurso: {r.get('id')} - {e}")
+                    logger.error("⚠️  Error con ID del recurso: %s - %s", r.get('id'), e)
             
             if ids:
                 max_id = max(ids)
-                print(f"🔍 ID máximo encontrado: {max_id}")
+                logger.debug("🔍 ID máximo encontrado: %s", max_id)
                 nuevo_id = max_id + 1
-                print(f"🔍 Nuevo ID generado: {nuevo_id}")
+                logger.debug("🔍 Nuevo ID generado: %s", nuevo_id)
                 return nuevo_id
         
-        print("🔍 No hay recursos, usando ID: 1")
+        logger.debug("🔍 No hay recursos, usando ID: 1")
         return 1
         
     except Exception as e:
-        print(f"🔴 ERROR en generar_id_recurso: {e}")
+        logger.error("🔴 ERROR en generar_id_recurso: %s", e)
         return 1
 
 def generar_id_categoria():
     try:
         # Usar la nueva función de carga de categorías
         categorias = cargar_categorias()
-        print(f"🔍 GENERAR_ID_CATEGORIA - Categorías encontradas: {len(categorias)}")
+        logger.debug("🔍 GENERAR_ID_CATEGORIA - Categorías encontradas: %s", len(categorias))
         
         if categorias:
             ids = []
             for c in categorias:
                 try:
                     ids.append(int(c['id']))
-                    print(f"🔍 Categoría encontrada: ID {c['id']} - {c['nombre']}")
+                    logger.debug("🔍 Categoría encontrada: ID %s - %s", c['id'], c['nombre'])
                 except (ValueError, KeyError) as e:
-                    print(f"⚠️  Error con ID de categoría: {c.get('id')} - {e}")
+                    logger.error("⚠️  Error con ID de categoría: %s - %s", c.get('id'), e)
             
             if ids:
                 max_id = max(ids)
-                print(f"🔍 ID máximo encontrado: {max_id}")
+                logger.debug("🔍 ID máximo encontrado: %s", max_id)
                 nuevo_id = max_id + 1
-                print(f"🔍 Nuevo ID generado: {nuevo_id}")
+                logger.debug("🔍 Nuevo ID generado: %s", nuevo_id)
                 return nuevo_id
         
-        print("🔍 No hay categorías, usando ID: 1")
+        logger.debug("🔍 No hay categorías, usando ID: 1")
         return 1
         
     except Exception as e:
-        print(f"🔴 ERROR en generar_id_categoria: {e}")
+        logger.error("🔴 ERROR en generar_id_categoria: %s", e)
         return 1
 
 def generar_id_configuracion(categoria):
@@ -331,4 +499,7 @@ def generar_id_configuracion(categoria):
     return max(ids) + 1 if ids else 1
 
 if __name__ == '__main__':
+    from werkzeug.serving import WSGIRequestHandler
+    # HTTP/1.1 mantiene abiertas las conexiones que reutiliza el frontend
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,6 @@
+"""
+Benchmarks de carga, facturación y reportes sobre datos sintéticos.
+
+    python -m benchmarks --escala mediana --almacenamiento xml
+    python -m benchmarks.comparar resultados/antes.json resultados/despues.json
+"""
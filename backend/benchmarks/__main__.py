@@ -0,0 +1,178 @@
+import argparse
+import calendar
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Escalas predefinidas; cada valor se puede cambiar con su opción
+ESCALAS = {
+    'pequena': {'recursos': 10, 'categorias': 3, 'configuraciones': 3, 'clientes': 20, 'instancias': 3, 'consumos': 10_000},
+    'mediana': {'recursos': 40, 'categorias': 8, 'configuraciones': 5, 'clientes': 500, 'instancias': 4, 'consumos': 200_000},
+    'grande': {'recursos': 100, 'categorias': 20, 'configuraciones': 10, 'clientes': 5_000, 'instancias': 5, 'consumos': 2_000_000},
+}
+
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(__file__), 'resultados')
+
+def _leer_argumentos(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Mide carga, facturación y reportes con datos sintéticos')
+    parser.add_argument('--escala', choices=sorted(ESCALAS), default='pequena')
+    for nombre in ESCALAS['pequena']:
+        parser.add_argument(f'--{nombre}', type=int, help=f'cambia la cantidad de {nombre} de la escala')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--almacenamiento', choices=['xml', 'sqlite'], default='xml')
+    parser.add_argument('--motor', choices=['estandar', 'vectorizado', 'paralelo'], default='estandar')
+    parser.add_argument('--salida', help='archivo JSON de resultados (por defecto en benchmarks/resultados/)')
+    parser.add_argument('--sin-memoria', action='store_true', help='no medir el pico de memoria; tracemalloc hace mucho más lentas las etapas')
+    parser.add_argument('--detalle', action='store_true', help='mostrar la salida de los servicios')
+    parser.add_argument('--conservar', action='store_true', help='no borrar el directorio temporal con los datos')
+    return parser.parse_args(argv)
+
+def _rss_max_bytes():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024  # Linux lo da en KB
+
+def _commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Medidor:
+    """Corre cada etapa midiendo su tiempo, su pico de memoria y el RSS máximo del proceso"""
+    def __init__(self, medir_memoria, detalle):
+        self.medir_memoria = medir_memoria
+        self.detalle = detalle
+        self.etapas = []
+    
+    def medir(self, nombre, funcion, resumir=lambda resultado: None):
+        if self.medir_memoria:
+            tracemalloc.start()
+        with open(os.devnull, 'w') as nulo, contextlib.nullcontext() if self.detalle else contextlib.redirect_stdout(nulo):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            segundos = time.perf_counter() - inicio
+        pico = None
+        if self.medir_memoria:
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        
+        etapa = {
+            'nombre': nombre,
+            'segundos': round(segundos, 4),
+            'memoria_pico_bytes': pico,
+            'rss_max_bytes': _rss_max_bytes(),
+            'resultado': resumir(resultado)
+        }
+        self.etapas.append(etapa)
+        memoria = f", pico {pico / 1024 / 1024:.1f} MB" if pico is not None else ''
+        print(f"⏱️ {nombre}: {segundos:.3f} s{memoria}")
+        return resultado
+
+def main(argv=None):
+    args = _leer_argumentos(argv)
+    escala = dict(ESCALAS[args.escala])
+    for nombre in escala:
+        if getattr(args, nombre) is not None:
+            escala[nombre] = getattr(args, nombre)
+    
+    # Todo se escribe en un directorio temporal; los datos reales no se tocan.
+    # La configuración se fija antes de importar cualquier módulo del backend.
+    directorio = tempfile.mkdtemp(prefix='ipc2_benchmark_')
+    os.environ.update({
+        'ALMACENAMIENTO': args.almacenamiento,
+        'XML_DATA_DIR': os.path.join(directorio, 'data'),
+        'SQLITE_PATH': os.path.join(directorio, 'data', 'benchmark.sqlite3'),
+        'REPORTES_CACHE_DIR': os.path.join(directorio, 'reportes'),
+        'TRABAJOS_DIR': os.path.join(directorio, 'trabajos'),
+    })
+    os.makedirs(os.path.join(directorio, 'data'))
+    
+    from benchmarks.generador import generar_configuracion, generar_consumos
+    from database.storage import reset_database, iterar_facturas
+    from services.config_service import procesar_configuracion_stream
+    from services.consumo_service import procesar_consumo_stream
+    from services.facturacion_service import generar_facturas
+    from services.report_service import generar_reporte_factura, generar_analisis_ventas
+    
+    mes, anio = 10, 2024
+    fecha_inicio, fecha_fin = f'01/{mes:02d}/{anio}', f'{calendar.monthrange(anio, mes)[1]:02d}/{mes:02d}/{anio}'
+    ruta_configuracion = os.path.join(directorio, 'configuracion.xml')
+    ruta_consumos = os.path.join(directorio, 'consumos.xml')
+    
+    print(f"📏 Benchmark {args.escala} ({args.almacenamiento}, motor {args.motor}): {escala}")
+    medidor = Medidor(not args.sin_memoria, args.detalle)
+    try:
+        reset_database()
+        instancias = medidor.medir('generar_configuracion', lambda: generar_configuracion(
+            ruta_configuracion, escala['recursos'], escala['categorias'], escala['configuraciones'],
+            escala['clientes'], escala['instancias'], args.semilla, mes, anio))
+        medidor.medir('generar_consumos', lambda: generar_consumos(
+            ruta_consumos, instancias, escala['consumos'], args.semilla, mes, anio))
+        
+        def cargar(ruta, procesar):
+            with open(ruta, 'rb') as f:
+                return procesar(f)
+        medidor.medir('carga_configuracion', lambda: cargar(ruta_configuracion, procesar_configuracion_stream),
+                      lambda r: dict(r, errores=len(r['errores'])))
+        medidor.medir('carga_consumos', lambda: cargar(ruta_consumos, procesar_consumo_stream),
+                      lambda r: {'consumos_procesados': r['consumos_procesados'], 'errores': len(r['errores'])})
+        medidor.medir('facturacion', lambda: generar_facturas(fecha_inicio, fecha_fin, args.motor),
+                      lambda r: {'facturas_generadas': r.get('facturas_generadas'), 'error': r.get('error')})
+        
+        primera = next(iterar_facturas(), (None, None))[1]
+        if primera is not None:
+            medidor.medir('reporte_factura', lambda: generar_reporte_factura(primera['numero']),
+                          lambda r: {'generado': bool(r)})
+        for tipo in ('categorias', 'recursos'):
+            medidor.medir(f'analisis_{tipo}', lambda: generar_analisis_ventas(tipo, fecha_inicio, fecha_fin),
+                          lambda r: {'generado': bool(r)})
+    finally:
+        if args.conservar:
+            print(f"📁 Datos conservados en {directorio}")
+        else:
+            shutil.rmtree(directorio, ignore_errors=True)
+    
+    commit = _commit_actual()
+    resultados = {
+        'fecha': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'escala': args.escala,
+        'parametros': escala,
+        'semilla': args.semilla,
+        'almacenamiento': args.almacenamiento,
+        'motor': args.motor,
+        'memoria_medida': not args.sin_memoria,
+        'etapas': medidor.etapas
+    }
+    
+    salida = args.salida
+    if not salida:
+        os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+        nombre = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{commit or 'sin-commit'}_{args.escala}_{args.almacenamiento}.json"
+        salida = os.path.join(DIRECTORIO_RESULTADOS, nombre)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"💾 Resultados guardados en {salida}")
+    return resultados
+
+if __name__ == '__main__':
+    main()
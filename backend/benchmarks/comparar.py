@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+# ========== COMPARACIÓN ENTRE CORRIDAS ==========
+# Compara dos archivos de resultados etapa por etapa y marca como regresión
+# toda etapa que tardó (o usó memoria) más que el umbral sobre la base.
+
+def _cargar(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+def _variacion(antes, despues):
+    if not antes or despues is None:
+        return None
+    return (despues - antes) / antes
+
+def comparar(base, nuevo, umbral=0.10):
+    """Devuelve [(etapa, medida, antes, después, variación, es_regresión)] de las etapas presentes en ambas corridas"""
+    etapas_base = {etapa['nombre']: etapa for etapa in base['etapas']}
+    filas = []
+    for etapa in nuevo['etapas']:
+        anterior = etapas_base.get(etapa['nombre'])
+        if anterior is None:
+            continue
+        for medida in ('segundos', 'memoria_pico_bytes'):
+            variacion = _variacion(anterior.get(medida), etapa.get(medida))
+            if variacion is None:
+                continue
+            filas.append((etapa['nombre'], medida, anterior[medida], etapa[medida], variacion, variacion > umbral))
+    return filas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.comparar', description='Compara dos corridas de benchmarks')
+    parser.add_argument('base')
+    parser.add_argument('nuevo')
+    parser.add_argument('--umbral', type=float, default=0.10, help='variación relativa tolerada (0.10 = 10%%)')
+    args = parser.parse_args(argv)
+    
+    base, nuevo = _cargar(args.base), _cargar(args.nuevo)
+    for clave in ('escala', 'parametros', 'semilla', 'almacenamiento', 'motor'):
+        if base.get(clave) != nuevo.get(clave):
+            print(f"⚠️ Las corridas difieren en {clave}: {base.get(clave)} vs {nuevo.get(clave)}")
+    
+    print(f"Base: {base.get('commit')} ({base.get('fecha')})  Nuevo: {nuevo.get('commit')} ({nuevo.get('fecha')})")
+    filas = comparar(base, nuevo, args.umbral)
+    for nombre, medida, antes, despues, variacion, regresion in filas:
+        marca = '🔴' if regresion else '✅'
+        print(f"{marca} {nombre:<22} {medida:<20} {antes:>14} -> {despues:>14} ({variacion:+.1%})")
+    
+    regresiones = sum(1 for fila in filas if fila[5])
+    print(f"{regresiones} regresiones sobre el umbral de {args.umbral:.0%}")
+    return 1 if regresiones else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
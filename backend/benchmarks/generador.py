@@ -0,0 +1,98 @@
+import calendar
+import random
+from xml.sax.saxutils import escape
+
+# ========== GENERADOR DE DATOS SINTÉTICOS ==========
+# Escribe archivos con el mismo formato que Pueba_config.xml y
+# prueba_consumo.xml. Con la misma semilla y los mismos parámetros el
+# resultado es idéntico byte a byte, así dos corridas miden lo mismo.
+# Los archivos se escriben a medida que se generan, sin armarlos en memoria.
+
+TIPOS_RECURSO = ('Hardware', 'Software')
+METRICAS = ('núcleos', 'GiB', 'Mbps', 'licencias', 'instancias', 'unidades')
+
+def generar_configuracion(ruta, recursos, categorias, configuraciones, clientes, instancias, semilla=42,
+                          mes=10, anio=2024):
+    """
+    Escribe un archivo de configuración con `recursos` recursos, `categorias`
+    categorías de `configuraciones` configuraciones cada una y `clientes`
+    clientes de `instancias` instancias cada uno. Devuelve
+    {nit: [id_instancia, ...]} para generar consumos de esas instancias.
+    """
+    azar = random.Random(semilla)
+    instancias_por_cliente = {}
+    total_configuraciones = categorias * configuraciones
+    
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0"?>\n<archivoConfiguraciones>\n  <listaRecursos>\n')
+        for id_recurso in range(1, recursos + 1):
+            f.write(f'    <recurso id="{id_recurso}">\n'
+                    f'      <nombre>Recurso {id_recurso}</nombre>\n'
+                    f'      <abreviatura>R{id_recurso}</abreviatura>\n'
+                    f'      <metrica>{escape(azar.choice(METRICAS))}</metrica>\n'
+                    f'      <tipo>{azar.choice(TIPOS_RECURSO)}</tipo>\n'
+                    f'      <valorXhora>{azar.uniform(0.05, 6.0):.2f}</valorXhora>\n'
+                    f'    </recurso>\n')
+        f.write('  </listaRecursos>\n  <listaCategorias>\n')
+        
+        id_configuracion = 0
+        for id_categoria in range(1, categorias + 1):
+            f.write(f'    <categoria id="{id_categoria}">\n'
+                    f'      <nombre>Categoría {id_categoria}</nombre>\n'
+                    f'      <descripcion>Categoría sintética {id_categoria}</descripcion>\n'
+                    f'      <cargaTrabajo>Carga {id_categoria}</cargaTrabajo>\n'
+                    f'      <listaConfiguraciones>\n')
+            for _ in range(configuraciones):
+                id_configuracion += 1
+                f.write(f'        <configuracion id="{id_configuracion}">\n'
+                        f'          <nombre>Configuración {id_configuracion}</nombre>\n'
+                        f'          <descripcion>Configuración sintética {id_configuracion}</descripcion>\n'
+                        f'          <recursosConfiguracion>\n')
+                for id_recurso in sorted(azar.sample(range(1, recursos + 1), min(recursos, azar.randint(2, 6)))):
+                    f.write(f'            <recurso id="{id_recurso}">{azar.randint(1, 64)}</recurso>\n')
+                f.write('          </recursosConfiguracion>\n        </configuracion>\n')
+            f.write('      </listaConfiguraciones>\n    </categoria>\n')
+        f.write('  </listaCategorias>\n  <listaClientes>\n')
+        
+        id_instancia = 0
+        for numero_cliente in range(1, clientes + 1):
+            nit = f'{1000000 + numero_cliente}-{numero_cliente % 10}'
+            f.write(f'    <cliente nit="{nit}">\n'
+                    f'      <nombre>Cliente {numero_cliente}</nombre>\n'
+                    f'      <usuario>cliente{numero_cliente}</usuario>\n'
+                    f'      <clave>clave{numero_cliente}</clave>\n'
+                    f'      <direccion>Dirección {numero_cliente}</direccion>\n'
+                    f'      <correoElectronico>cliente{numero_cliente}@ejemplo.com</correoElectronico>\n'
+                    f'      <listaInstancias>\n')
+            instancias_por_cliente[nit] = []
+            for _ in range(instancias):
+                id_instancia += 1
+                instancias_por_cliente[nit].append(id_instancia)
+                f.write(f'        <instancia id="{id_instancia}">\n'
+                        f'          <idConfiguracion>{azar.randint(1, total_configuraciones)}</idConfiguracion>\n'
+                        f'          <nombre>Instancia {id_instancia}</nombre>\n'
+                        f'          <fechaInicio>{azar.randint(1, 28):02d}/{mes:02d}/{anio - 1}</fechaInicio>\n'
+                        f'          <estado>Vigente</estado>\n'
+                        f'          <fechaFinal></fechaFinal>\n'
+                        f'        </instancia>\n')
+            f.write('      </listaInstancias>\n    </cliente>\n')
+        f.write('  </listaClientes>\n</archivoConfiguraciones>\n')
+    
+    return instancias_por_cliente
+
+def generar_consumos(ruta, instancias_por_cliente, consumos, semilla=42, mes=10, anio=2024):
+    """Escribe `consumos` consumos de las instancias dadas, repartidos en el mes indicado"""
+    azar = random.Random(semilla + 1)
+    pares = [(nit, id_instancia) for nit, ids in instancias_por_cliente.items() for id_instancia in ids]
+    dias = calendar.monthrange(anio, mes)[1]
+    
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0"?>\n<listadoConsumos>\n')
+        for _ in range(consumos):
+            nit, id_instancia = azar.choice(pares)
+            f.write(f'  <consumo nitCliente="{nit}" idInstancia="{id_instancia}">\n'
+                    f'    <tiempo>{azar.randint(1, 96) / 4}</tiempo>\n'
+                    f'    <fechahora>{azar.randint(1, dias):02d}/{mes:02d}/{anio} '
+                    f'{azar.randint(0, 23):02d}:{azar.choice((0, 15, 30, 45)):02d}</fechahora>\n'
+                    f'  </consumo>\n')
+        f.write('</listadoConsumos>\n')
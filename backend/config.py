@@ -0,0 +1,55 @@
+import os
+
+# Configuración del backend. Cada valor se puede sobrescribir con una
+# variable de entorno del mismo nombre.
+
+# Backend de almacenamiento: 'xml' (archivos en database/data) o 'sqlite'
+ALMACENAMIENTO = os.environ.get('ALMACENAMIENTO', 'xml').lower()
+
+# Directorio de los archivos cuando ALMACENAMIENTO = 'xml'
+XML_DATA_DIR = os.environ.get(
+    'XML_DATA_DIR',
+    os.path.join(os.path.dirname(__file__), 'database', 'data')
+)
+
+# Ruta de la base de datos cuando ALMACENAMIENTO = 'sqlite'
+SQLITE_PATH = os.environ.get(
+    'SQLITE_PATH',
+    os.path.join(os.path.dirname(__file__), 'database', 'data', 'ipc2.sqlite3')
+)
+
+# Procesos que renderizan reportes PDF en segundo plano (0 = uno por núcleo)
+REPORTES_WORKERS = int(os.environ.get('REPORTES_WORKERS', '0')) or os.cpu_count() or 1
+
+# Directorio con el estado de los trabajos de reportes, compartido entre workers
+TRABAJOS_DIR = os.environ.get(
+    'TRABAJOS_DIR',
+    os.path.join(os.path.dirname(__file__), 'database', 'data', 'trabajos')
+)
+
+# Caché de reportes PDF ya generados y su tamaño máximo en bytes
+REPORTES_CACHE_DIR = os.environ.get(
+    'REPORTES_CACHE_DIR',
+    os.path.join(os.path.dirname(__file__), 'database', 'data', 'reportes')
+)
+REPORTES_CACHE_MAX_BYTES = int(os.environ.get('REPORTES_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Procesos para la facturación en paralelo (motor 'paralelo'; 0 = uno por núcleo)
+FACTURACION_WORKERS = int(os.environ.get('FACTURACION_WORKERS', '0')) or os.cpu_count() or 1
+
+# Elementos por página en /consultar/<tipo> cuando no se indica límite, y el máximo permitido
+CONSULTA_LIMITE_POR_DEFECTO = int(os.environ.get('CONSULTA_LIMITE_POR_DEFECTO', '100'))
+CONSULTA_LIMITE_MAXIMO = int(os.environ.get('CONSULTA_LIMITE_MAXIMO', '1000'))
+
+# Nivel de los logs del backend (DEBUG muestra el detalle de cada carga y reporte)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+# Perfilado bajo demanda (cabecera X-Perfilar o ?perfilar=cprofile|muestreo).
+# Desactivado por defecto: solo se atiende si PERFILADO=1
+PERFILADO_HABILITADO = os.environ.get('PERFILADO', '0').lower() in ('1', 'true', 'si')
+PERFILES_DIR = os.environ.get(
+    'PERFILES_DIR',
+    os.path.join(os.path.dirname(__file__), 'database', 'data', 'perfiles')
+)
+# Segundos entre muestras en el modo 'muestreo'
+PERFILADO_INTERVALO = float(os.environ.get('PERFILADO_INTERVALO', '0.005'))
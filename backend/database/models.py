@@ -1,58 +1,231 @@
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from utils.date_utils import marca_tiempo
+
+# ========== MODELOS DEL DOMINIO ==========
+# Los mismos tipos los arman el parser XML, los almacenamientos y los servicios.
+# Con slots cada objeto ocupa una fracción de lo que ocupa un dict, y los campos
+# numéricos se convierten una sola vez al crearlo. a_dict() devuelve la forma
+# de diccionario que ya usan la API JSON y las plantillas, y desde_dict() la lee.
+# huella() resume todo lo que se guarda de la entidad, para saber sin reescribirla
+# si cambió respecto a lo almacenado.
+
+def _texto(valor):
+    return '' if valor is None else str(valor)
+
+@dataclass(slots=True)
 class Recurso:
-    def __init__(self, id_recurso, nombre, abreviatura, metrica, tipo, valor_x_hora):
-        self.id_recurso = id_recurso
-        self.nombre = nombre
-        self.abreviatura = abreviatura
-        self.metrica = metrica
-        self.tipo = tipo
-        self.valor_x_hora = float(valor_x_hora)
+    id_recurso: str
+    nombre: str
+    abreviatura: str
+    metrica: str
+    tipo: str
+    valor_x_hora: float
+
+    def __post_init__(self):
+        self.valor_x_hora = float(self.valor_x_hora)
 
+    def a_dict(self):
+        return {
+            'tipo': 'recurso',
+            'id': str(self.id_recurso),
+            'nombre': self.nombre,
+            'abreviatura': self.abreviatura,
+            'metrica': self.metrica,
+            'tipo_recurso': self.tipo,
+            'valor_x_hora': str(self.valor_x_hora)
+        }
+
+    def huella(self):
+        return tuple(map(_texto, (self.id_recurso, self.nombre, self.abreviatura, self.metrica, self.tipo, self.valor_x_hora)))
+
+    @classmethod
+    def desde_dict(cls, dato):
+        return cls(dato['id'], dato['nombre'], dato['abreviatura'], dato['metrica'], dato['tipo_recurso'], dato['valor_x_hora'])
+
+@dataclass(slots=True)
 class Configuracion:
-    def __init__(self, id_configuracion, nombre, descripcion, recursos):
-        self.id_configuracion = id_configuracion
-        self.nombre = nombre
-        self.descripcion = descripcion
-        self.recursos = recursos
+    id_configuracion: str
+    nombre: str
+    descripcion: str
+    recursos: Dict[str, float]
+
+    def a_dict(self):
+        return {
+            'id': str(self.id_configuracion),
+            'nombre': self.nombre,
+            'descripcion': self.descripcion,
+            'recursos': {str(recurso_id): str(cantidad) for recurso_id, cantidad in self.recursos.items()}
+        }
 
+    def huella(self):
+        recursos = tuple((_texto(recurso_id), _texto(cantidad)) for recurso_id, cantidad in self.recursos.items())
+        return (_texto(self.id_configuracion), _texto(self.nombre), _texto(self.descripcion), recursos)
+
+    @classmethod
+    def desde_dict(cls, dato):
+        return cls(dato['id'], dato['nombre'], dato['descripcion'], dict(dato.get('recursos', {})))
+
+@dataclass(slots=True)
 class Categoria:
-    def __init__(self, id_categoria, nombre, descripcion, carga_trabajo, configuraciones):
-        self.id_categoria = id_categoria
-        self.nombre = nombre
-        self.descripcion = descripcion
-        self.carga_trabajo = carga_trabajo
-        self.configuraciones = configuraciones
+    id_categoria: str
+    nombre: str
+    descripcion: str
+    carga_trabajo: str
+    configuraciones: List[Configuracion]
 
-class Cliente:
-    def __init__(self, nit, nombre, usuario, clave, direccion, correo, instancias=None):
-        self.nit = nit
-        self.nombre = nombre
-        self.usuario = usuario
-        self.clave = clave
-        self.direccion = direccion
-        self.correo = correo
-        self.instancias = instancias if instancias is not None else []
+    def a_dict(self):
+        return {
+            'tipo': 'categoria',
+            'id': str(self.id_categoria),
+            'nombre': self.nombre,
+            'descripcion': self.descripcion,
+            'carga_trabajo': self.carga_trabajo,
+            'configuraciones': [c.a_dict() for c in self.configuraciones]
+        }
+
+    def huella(self):
+        configuraciones = tuple(c.huella() for c in self.configuraciones)
+        return tuple(map(_texto, (self.id_categoria, self.nombre, self.descripcion, self.carga_trabajo))) + (configuraciones,)
 
+    @classmethod
+    def desde_dict(cls, dato):
+        configuraciones = [Configuracion.desde_dict(c) for c in dato.get('configuraciones', [])]
+        return cls(dato['id'], dato['nombre'], dato['descripcion'], dato['carga_trabajo'], configuraciones)
+
+@dataclass(slots=True)
 class Instancia:
-    def __init__(self, id_instancia, id_configuracion, nombre, fecha_inicio, estado, fecha_final=None):
-        self.id_instancia = id_instancia
-        self.id_configuracion = id_configuracion
-        self.nombre = nombre
-        self.fecha_inicio = fecha_inicio
-        self.estado = estado
-        self.fecha_final = fecha_final
-        self.consumos = []
+    id_instancia: str
+    id_configuracion: str
+    nombre: str
+    fecha_inicio: str
+    estado: str
+    fecha_final: Optional[str] = None
+    consumos: list = field(default_factory=list, repr=False, compare=False)
+
+    def a_dict(self):
+        return {
+            'id': str(self.id_instancia),
+            'idConfiguracion': str(self.id_configuracion),
+            'nombre': self.nombre,
+            'fechaInicio': self.fecha_inicio,
+            'estado': self.estado,
+            'fechaFinal': self.fecha_final
+        }
+
+    def huella(self):
+        return tuple(map(_texto, (self.id_instancia, self.id_configuracion, self.nombre, self.fecha_inicio, self.estado, self.fecha_final)))
 
+    @classmethod
+    def desde_dict(cls, dato):
+        return cls(dato['id'], dato['idConfiguracion'], dato['nombre'], dato['fechaInicio'], dato['estado'], dato.get('fechaFinal'))
+
+@dataclass(slots=True)
+class Cliente:
+    nit: str
+    nombre: str
+    usuario: str
+    clave: str
+    direccion: str
+    correo: str
+    instancias: List[Instancia] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.instancias is None:
+            self.instancias = []
+
+    def a_dict(self):
+        return {
+            'tipo': 'cliente',
+            'nit': self.nit,
+            'nombre': self.nombre,
+            'usuario': self.usuario,
+            'correo': self.correo,
+            'instancias': [i.a_dict() for i in self.instancias]
+        }
+
+    def huella(self):
+        instancias = tuple(i.huella() for i in self.instancias)
+        return tuple(map(_texto, (self.nit, self.nombre, self.usuario, self.clave, self.direccion, self.correo))) + (instancias,)
+
+    @classmethod
+    def desde_dict(cls, dato):
+        instancias = [Instancia.desde_dict(i) for i in dato.get('instancias', [])]
+        return cls(dato['nit'], dato['nombre'], dato['usuario'], dato.get('clave', ''),
+                   dato.get('direccion', ''), dato.get('correo', ''), instancias)
+
+@dataclass(slots=True)
 class Consumo:
-    def __init__(self, nit_cliente, id_instancia, tiempo, fecha_hora):
-        self.nit_cliente = nit_cliente
-        self.id_instancia = id_instancia
-        self.tiempo = float(tiempo)
+    nit_cliente: str
+    id_instancia: str
+    tiempo: float
+    fecha_hora: str
+    # ID asignado por el almacenamiento; None mientras no se ha guardado
+    id: Optional[str] = None
+    _marca: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Hay pocos clientes e instancias distintos y muchísimos consumos: con
+        # intern todos los consumos de una instancia comparten los mismos textos
+        if self.nit_cliente is not None:
+            self.nit_cliente = sys.intern(self.nit_cliente)
+        self.id_instancia = sys.intern(str(self.id_instancia))
+        self.tiempo = float(self.tiempo)
+
+    @property
+    def marca(self):
+        """AAAAMMDDHHMM de fecha_hora; se calcula la primera vez que se pide"""
+        if self._marca is None:
+            self._marca = marca_tiempo(self.fecha_hora)
+        return self._marca
+
+    def fijar_fecha_hora(self, fecha_hora):
+        """Cambia la fecha y descarta la marca calculada con la anterior"""
         self.fecha_hora = fecha_hora
+        self._marca = None
+
+    def a_dict(self):
+        return {
+            'id': self.id,
+            'nitCliente': self.nit_cliente,
+            'idInstancia': self.id_instancia,
+            'tiempo': str(self.tiempo),
+            'fechahora': self.fecha_hora
+        }
+
+    @classmethod
+    def desde_dict(cls, dato):
+        return cls(dato['nitCliente'], dato['idInstancia'], dato['tiempo'], dato['fechahora'], dato.get('id'))
 
+@dataclass(slots=True)
 class Factura:
-    def __init__(self, numero_factura, nit_cliente, fecha_factura, monto_total, detalles):
-        self.numero_factura = numero_factura
-        self.nit_cliente = nit_cliente
-        self.fecha_factura = fecha_factura
-        self.monto_total = monto_total
-        self.detalles = detalles 
+    numero_factura: str
+    nit_cliente: str
+    fecha_factura: str
+    monto_total: float
+    # [{'id_instancia', 'tiempo_total', 'monto'}]
+    detalles: List[dict]
+
+    def __post_init__(self):
+        self.monto_total = float(self.monto_total)
+
+    def a_dict(self):
+        return {
+            'numero': str(self.numero_factura),
+            'nitCliente': self.nit_cliente,
+            'fechaFactura': self.fecha_factura,
+            'montoTotal': str(self.monto_total),
+            'detalles': [
+                {'idInstancia': str(d['id_instancia']), 'tiempoTotal': str(d['tiempo_total']), 'monto': str(d['monto'])}
+                for d in self.detalles
+            ]
+        }
+
+    @classmethod
+    def desde_dict(cls, dato):
+        detalles = [
+            {'id_instancia': d['idInstancia'], 'tiempo_total': float(d['tiempoTotal']), 'monto': float(d['monto'])}
+            for d in dato.get('detalles', [])
+        ]
+        return cls(dato['numero'], dato['nitCliente'], dato['fechaFactura'], dato['montoTotal'], detalles)
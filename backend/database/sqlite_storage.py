@@ -0,0 +1,815 @@
+"""
+Backend de almacenamiento en SQLite con la misma API que xml_storage.
+
+Las tablas están indexadas por ID/NIT, cada guardar_* es una transacción y la
+base usa modo WAL, de modo que los lectores no se bloquean mientras alguien
+escribe. Los valores se guardan como texto para que cargar_* devuelva
+exactamente los mismos diccionarios que el backend XML.
+
+Migración desde/hacia los archivos XML:
+    python -m database.sqlite_storage importar
+    python -m database.sqlite_storage exportar
+"""
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+import config
+from .models import Recurso, Categoria, Cliente, Consumo, Factura
+from utils.date_utils import marca_tiempo, rango_marcas, dia_de_fecha
+from utils.bloqueos import bloqueo_archivo
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS versiones (
+    tabla TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS secuencias (
+    nombre TEXT PRIMARY KEY,
+    ultimo INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recursos (
+    id TEXT PRIMARY KEY,
+    nombre TEXT,
+    abreviatura TEXT,
+    metrica TEXT,
+    tipo TEXT,
+    valor_x_hora TEXT
+);
+CREATE TABLE IF NOT EXISTS categorias (
+    id TEXT PRIMARY KEY,
+    nombre TEXT,
+    descripcion TEXT,
+    carga_trabajo TEXT
+);
+CREATE TABLE IF NOT EXISTS configuraciones (
+    categoria_id TEXT NOT NULL REFERENCES categorias(id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    posicion INTEGER NOT NULL,
+    nombre TEXT,
+    descripcion TEXT,
+    PRIMARY KEY (categoria_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_configuraciones_id ON configuraciones(id);
+CREATE TABLE IF NOT EXISTS configuracion_recursos (
+    categoria_id TEXT NOT NULL,
+    configuracion_id TEXT NOT NULL,
+    posicion INTEGER NOT NULL,
+    recurso_id TEXT NOT NULL,
+    cantidad TEXT,
+    FOREIGN KEY (categoria_id, configuracion_id) REFERENCES configuraciones(categoria_id, id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_configuracion_recursos ON configuracion_recursos(categoria_id, configuracion_id);
+CREATE TABLE IF NOT EXISTS clientes (
+    nit TEXT PRIMARY KEY,
+    nombre TEXT,
+    usuario TEXT,
+    clave TEXT,
+    direccion TEXT,
+    correo TEXT
+);
+CREATE TABLE IF NOT EXISTS instancias (
+    nit TEXT NOT NULL REFERENCES clientes(nit) ON DELETE CASCADE,
+    posicion INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    id_configuracion TEXT,
+    nombre TEXT,
+    fecha_inicio TEXT,
+    estado TEXT,
+    fecha_final TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_instancias_nit ON instancias(nit);
+CREATE INDEX IF NOT EXISTS idx_instancias_id ON instancias(id);
+CREATE TABLE IF NOT EXISTS consumos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nit TEXT NOT NULL,
+    id_instancia TEXT NOT NULL,
+    tiempo TEXT,
+    fechahora TEXT,
+    marca INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_consumos_marca ON consumos(marca);
+CREATE INDEX IF NOT EXISTS idx_consumos_nit ON consumos(nit, id_instancia);
+CREATE TABLE IF NOT EXISTS consumos_carga (
+    carga TEXT NOT NULL,
+    nit TEXT NOT NULL,
+    id_instancia TEXT NOT NULL,
+    tiempo TEXT,
+    fechahora TEXT,
+    marca INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_consumos_carga ON consumos_carga(carga);
+CREATE TABLE IF NOT EXISTS consumos_facturados (
+    consumo_id TEXT PRIMARY KEY,
+    factura TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS facturas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    numero TEXT NOT NULL,
+    nit TEXT,
+    fecha TEXT,
+    monto_total TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_facturas_numero ON facturas(numero);
+CREATE INDEX IF NOT EXISTS idx_facturas_nit ON facturas(nit);
+CREATE TABLE IF NOT EXISTS factura_detalles (
+    factura_id INTEGER NOT NULL REFERENCES facturas(id) ON DELETE CASCADE,
+    posicion INTEGER NOT NULL,
+    id_instancia TEXT,
+    tiempo_total TEXT,
+    monto TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_factura_detalles ON factura_detalles(factura_id);
+CREATE TABLE IF NOT EXISTS acumulados_dia (
+    dia INTEGER PRIMARY KEY,
+    facturas INTEGER NOT NULL,
+    monto REAL NOT NULL,
+    horas REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS acumulados_instancia (
+    dia INTEGER NOT NULL,
+    id_instancia TEXT NOT NULL,
+    lineas INTEGER NOT NULL,
+    horas REAL NOT NULL,
+    monto REAL NOT NULL,
+    PRIMARY KEY (dia, id_instancia)
+);
+'''
+
+TABLAS = ['recursos', 'categorias', 'clientes', 'consumos', 'consumos_facturados', 'facturas']
+
+# Facturas cuyas líneas de detalle se leen juntas al recorrerlas con iterar_facturas
+FACTURAS_POR_BLOQUE = 200
+
+# ========== CONEXIONES ==========
+# Una conexión por hilo; SQLite no permite compartirlas entre hilos.
+_local = threading.local()
+_esquema_listo = set()
+_esquema_lock = threading.Lock()
+
+def _conexion():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'ruta', None) == config.SQLITE_PATH:
+        return conn
+
+    os.makedirs(os.path.dirname(config.SQLITE_PATH) or '.', exist_ok=True)
+    conn = sqlite3.connect(config.SQLITE_PATH, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+
+    with _esquema_lock:
+        if config.SQLITE_PATH not in _esquema_listo:
+            conn.executescript(ESQUEMA)
+            _esquema_listo.add(config.SQLITE_PATH)
+
+    _local.conn = conn
+    _local.ruta = config.SQLITE_PATH
+    return conn
+
+def _incrementar_version(conn, tabla):
+    conn.execute(
+        'INSERT INTO versiones (tabla, version) VALUES (?, 1) '
+        'ON CONFLICT(tabla) DO UPDATE SET version = version + 1', (tabla,))
+
+# ========== CACHÉ DE LECTURAS ==========
+# Igual que en xml_storage: el resultado de cada tabla se reutiliza mientras
+# su versión (incrementada por cada escritura, de cualquier proceso) no cambie.
+_cache_lecturas = {}
+_estadisticas_cache = {'aciertos': 0, 'fallos': 0, 'invalidaciones': 0}
+_cache_lock = threading.Lock()
+
+def _leer_con_cache(tabla, leer, vista=None):
+    """`vista` distingue varios resultados derivados de la misma tabla"""
+    conn = _conexion()
+    fila = conn.execute('SELECT version FROM versiones WHERE tabla = ?', (tabla,)).fetchone()
+    version = (config.SQLITE_PATH, fila[0] if fila else 0)
+    clave = tabla if vista is None else (tabla, vista)
+    with _cache_lock:
+        entrada = _cache_lecturas.get(clave)
+        if entrada is not None and entrada[0] == version:
+            _estadisticas_cache['aciertos'] += 1
+            return entrada[1]
+        _estadisticas_cache['fallos'] += 1
+
+    resultado = leer(conn)
+    with _cache_lock:
+        _cache_lecturas[clave] = (version, resultado)
+    return resultado
+
+def invalidar_cache(tabla=None):
+    with _cache_lock:
+        if tabla is None:
+            _cache_lecturas.clear()
+        else:
+            for clave in [c for c in _cache_lecturas if c == tabla or (isinstance(c, tuple) and c[0] == tabla)]:
+                del _cache_lecturas[clave]
+        _estadisticas_cache['invalidaciones'] += 1
+
+def estadisticas_cache():
+    with _cache_lock:
+        estadisticas = dict(_estadisticas_cache)
+        estadisticas['entradas'] = len(_cache_lecturas)
+    return estadisticas
+
+def reset_database():
+    conn = _conexion()
+    with conn:
+        for tabla in ['acumulados_instancia', 'acumulados_dia', 'factura_detalles', 'facturas', 'consumos_facturados', 'consumos_carga', 'consumos',
+                      'instancias', 'clientes', 'configuracion_recursos', 'configuraciones',
+                      'categorias', 'recursos']:
+            conn.execute(f'DELETE FROM {tabla}')
+        for tabla in TABLAS:
+            _incrementar_version(conn, tabla)
+    invalidar_cache()
+
+# ========== FUNCIONES PARA RECURSOS ==========
+def guardar_recurso(recurso):
+    guardar_recursos([recurso])
+    logger.debug("💾 Recurso guardado: %s (ID: %s)", recurso.nombre, recurso.id_recurso)
+
+def guardar_recursos(recursos):
+    conn = _conexion()
+    with conn:
+        conn.executemany(
+            'INSERT INTO recursos (id, nombre, abreviatura, metrica, tipo, valor_x_hora) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET nombre = excluded.nombre, abreviatura = excluded.abreviatura, '
+            'metrica = excluded.metrica, tipo = excluded.tipo, valor_x_hora = excluded.valor_x_hora',
+            [(str(r.id_recurso), r.nombre, r.abreviatura, r.metrica, r.tipo, str(r.valor_x_hora)) for r in recursos])
+        _incrementar_version(conn, 'recursos')
+    logger.debug("💾 Recursos guardados: %s", len(recursos))
+
+def _leer_recursos(conn):
+    return [{
+        'tipo': 'recurso',
+        'id': fila[0],
+        'nombre': fila[1],
+        'abreviatura': fila[2],
+        'metrica': fila[3],
+        'tipo_recurso': fila[4],
+        'valor_x_hora': fila[5]
+    } for fila in conn.execute('SELECT id, nombre, abreviatura, metrica, tipo, valor_x_hora FROM recursos ORDER BY rowid')]
+
+def cargar_recursos():
+    try:
+        recursos = _leer_con_cache('recursos', _leer_recursos)
+        logger.debug("🔍 CARGAR_RECURSOS - %s recursos encontrados", len(recursos))
+        return recursos
+    except Exception as e:
+        logger.error("🔴 ERROR cargando recursos: %s", e)
+        return []
+
+# ========== FUNCIONES PARA CATEGORÍAS ==========
+def guardar_categoria(categoria):
+    guardar_categorias([categoria])
+    logger.debug("💾 Categoría guardada: %s (ID: %s)", categoria.nombre, categoria.id_categoria)
+
+def guardar_categorias(categorias):
+    conn = _conexion()
+    with conn:
+        for categoria in categorias:
+            id_categoria = str(categoria.id_categoria)
+            conn.execute(
+                'INSERT INTO categorias (id, nombre, descripcion, carga_trabajo) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET nombre = excluded.nombre, descripcion = excluded.descripcion, '
+                'carga_trabajo = excluded.carga_trabajo',
+                (id_categoria, categoria.nombre, categoria.descripcion, categoria.carga_trabajo))
+            conn.execute('DELETE FROM configuracion_recursos WHERE categoria_id = ?', (id_categoria,))
+            conn.execute('DELETE FROM configuraciones WHERE categoria_id = ?', (id_categoria,))
+
+            for posicion, config_obj in enumerate(categoria.configuraciones):
+                id_config = str(config_obj.id_configuracion)
+                conn.execute(
+                    'INSERT OR REPLACE INTO configuraciones (categoria_id, id, posicion, nombre, descripcion) VALUES (?, ?, ?, ?, ?)',
+                    (id_categoria, id_config, posicion, config_obj.nombre, config_obj.descripcion))
+                conn.executemany(
+                    'INSERT INTO configuracion_recursos (categoria_id, configuracion_id, posicion, recurso_id, cantidad) VALUES (?, ?, ?, ?, ?)',
+                    [(id_categoria, id_config, i, str(recurso_id), str(cantidad))
+                     for i, (recurso_id, cantidad) in enumerate(config_obj.recursos.items())])
+        _incrementar_version(conn, 'categorias')
+    logger.debug("💾 Categorías guardadas: %s", len(categorias))
+
+def _leer_categorias(conn):
+    recursos_por_config = {}
+    for categoria_id, config_id, recurso_id, cantidad in conn.execute(
+            'SELECT categoria_id, configuracion_id, recurso_id, cantidad FROM configuracion_recursos ORDER BY posicion'):
+        recursos_por_config.setdefault((categoria_id, config_id), {})[recurso_id] = cantidad
+
+    configs_por_categoria = {}
+    for categoria_id, config_id, nombre, descripcion in conn.execute(
+            'SELECT categoria_id, id, nombre, descripcion FROM configuraciones ORDER BY posicion'):
+        configs_por_categoria.setdefault(categoria_id, []).append({
+            'id': config_id,
+            'nombre': nombre,
+            'descripcion': descripcion,
+            'recursos': recursos_por_config.get((categoria_id, config_id), {})
+        })
+
+    return [{
+        'tipo': 'categoria',
+        'id': fila[0],
+        'nombre': fila[1],
+        'descripcion': fila[2],
+        'carga_trabajo': fila[3],
+        'configuraciones': configs_por_categoria.get(fila[0], [])
+    } for fila in conn.execute('SELECT id, nombre, descripcion, carga_trabajo FROM categorias ORDER BY rowid')]
+
+def cargar_categorias():
+    try:
+        categorias = _leer_con_cache('categorias', _leer_categorias)
+        logger.debug("🔍 CARGAR_CATEGORIAS - %s categorías encontradas", len(categorias))
+        return categorias
+    except Exception as e:
+        logger.error("🔴 ERROR cargando categorías: %s", e)
+        return []
+
+# ========== FUNCIONES PARA CLIENTES ==========
+def guardar_cliente(cliente):
+    guardar_clientes([cliente])
+    logger.debug("💾 Cliente guardado: %s (NIT: %s)", cliente.nombre, cliente.nit)
+
+def guardar_clientes(clientes):
+    conn = _conexion()
+    with conn:
+        for cliente in clientes:
+            conn.execute(
+                'INSERT INTO clientes (nit, nombre, usuario, clave, direccion, correo) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(nit) DO UPDATE SET nombre = excluded.nombre, usuario = excluded.usuario, '
+                'clave = excluded.clave, direccion = excluded.direccion, correo = excluded.correo',
+                (cliente.nit, cliente.nombre, cliente.usuario, cliente.clave, cliente.direccion, cliente.correo))
+            conn.execute('DELETE FROM instancias WHERE nit = ?', (cliente.nit,))
+            conn.executemany(
+                'INSERT INTO instancias (nit, posicion, id, id_configuracion, nombre, fecha_inicio, estado, fecha_final) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(cliente.nit, i, str(inst.id_instancia), str(inst.id_configuracion), inst.nombre,
+                  inst.fecha_inicio, inst.estado, inst.fecha_final or None)
+                 for i, inst in enumerate(cliente.instancias)])
+        _incrementar_version(conn, 'clientes')
+    logger.debug("💾 Clientes guardados: %s", len(clientes))
+
+def _leer_clientes(conn):
+    instancias_por_nit = {}
+    for fila in conn.execute(
+            'SELECT nit, id, id_configuracion, nombre, fecha_inicio, estado, fecha_final FROM instancias ORDER BY posicion'):
+        instancias_por_nit.setdefault(fila[0], []).append({
+            'id': fila[1],
+            'idConfiguracion': fila[2],
+            'nombre': fila[3],
+            'fechaInicio': fila[4],
+            'estado': fila[5],
+            'fechaFinal': fila[6]
+        })
+
+    return [{
+        'tipo': 'cliente',
+        'nit': fila[0],
+        'nombre': fila[1],
+        'usuario': fila[2],
+        'correo': fila[3],
+        'instancias': instancias_por_nit.get(fila[0], [])
+    } for fila in conn.execute('SELECT nit, nombre, usuario, correo FROM clientes ORDER BY rowid')]
+
+def cargar_clientes():
+    try:
+        clientes = _leer_con_cache('clientes', _leer_clientes)
+        logger.debug("🔍 CARGAR_CLIENTES - %s clientes encontrados", len(clientes))
+        return clientes
+    except Exception as e:
+        logger.error("🔴 ERROR cargando clientes: %s", e)
+        return []
+
+# ========== HUELLAS DE LA CONFIGURACIÓN ==========
+# Para combinar una configuración nueva sin reescribir lo que no cambió
+def _huellas_clientes(conn):
+    credenciales = {nit: (clave, direccion) for nit, clave, direccion in conn.execute('SELECT nit, clave, direccion FROM clientes')}
+    huellas = {}
+    for dato in _leer_clientes(conn):
+        clave, direccion = credenciales.get(dato['nit'], ('', ''))
+        huellas[dato['nit']] = Cliente.desde_dict(dict(dato, clave=clave, direccion=direccion)).huella()
+    return huellas
+
+_HUELLAS = {
+    'recurso': ('recursos', lambda conn: {r['id']: Recurso.desde_dict(r).huella() for r in _leer_recursos(conn)}),
+    'categoria': ('categorias', lambda conn: {c['id']: Categoria.desde_dict(c).huella() for c in _leer_categorias(conn)}),
+    'cliente': ('clientes', _huellas_clientes),
+}
+
+def cargar_huellas(tipo):
+    """{ID o NIT: huella()} de lo guardado de `tipo` ('recurso', 'categoria' o 'cliente')"""
+    tabla, leer = _HUELLAS[tipo]
+    return _leer_con_cache(tabla, leer, vista='huellas')
+
+# ========== FUNCIONES PARA CONSUMOS ==========
+def guardar_consumo(consumo):
+    guardar_consumos([consumo])
+    logger.debug("💾 Consumo guardado - Cliente: %s, Instancia: %s", consumo.nit_cliente, consumo.id_instancia)
+
+def _filas_consumos(consumos):
+    return [(c.nit_cliente, str(c.id_instancia), str(c.tiempo), c.fecha_hora, marca_tiempo(c.fecha_hora)) for c in consumos]
+
+def guardar_consumos(consumos):
+    conn = _conexion()
+    with conn:
+        conn.executemany(
+            'INSERT INTO consumos (nit, id_instancia, tiempo, fechahora, marca) VALUES (?, ?, ?, ?, ?)',
+            _filas_consumos(consumos))
+        _incrementar_version(conn, 'consumos')
+    logger.debug("💾 Lote de consumos guardado: %s registros", len(consumos))
+
+# ========== CARGAS DE CONSUMOS ==========
+# Igual que en xml_storage, un archivo subido se guarda todo o nada: sus lotes
+# van a consumos_carga y pasan a consumos en una sola transacción al confirmar.
+
+def iniciar_carga_consumos():
+    """Abre una carga de consumos y devuelve su ID"""
+    return uuid.uuid4().hex
+
+def agregar_a_carga_consumos(carga_id, consumos):
+    """Anexa un lote a la carga sin que sea visible todavía"""
+    conn = _conexion()
+    with conn:
+        conn.executemany(
+            'INSERT INTO consumos_carga (carga, nit, id_instancia, tiempo, fechahora, marca) VALUES (?, ?, ?, ?, ?, ?)',
+            [(carga_id,) + fila for fila in _filas_consumos(consumos)])
+
+def confirmar_carga_consumos(carga_id):
+    """Pasa los consumos de la carga a la tabla consumos y devuelve cuántos quedaron guardados"""
+    conn = _conexion()
+    with conn:
+        total = conn.execute(
+            'INSERT INTO consumos (nit, id_instancia, tiempo, fechahora, marca) '
+            'SELECT nit, id_instancia, tiempo, fechahora, marca FROM consumos_carga WHERE carga = ? ORDER BY rowid',
+            (carga_id,)).rowcount
+        conn.execute('DELETE FROM consumos_carga WHERE carga = ?', (carga_id,))
+        _incrementar_version(conn, 'consumos')
+    logger.debug("💾 Carga de consumos confirmada: %s registros", total)
+    return total
+
+def descartar_carga_consumos(carga_id):
+    conn = _conexion()
+    with conn:
+        conn.execute('DELETE FROM consumos_carga WHERE carga = ?', (carga_id,))
+
+def cargar_manifiesto_consumos():
+    """Devuelve {'AAAA-MM': registros}, equivalente al manifiesto de particiones XML"""
+    conn = _conexion()
+    filas = conn.execute(
+        "SELECT CASE WHEN marca = 0 THEN 'sin-fecha' ELSE substr(marca, 1, 4) || '-' || substr(marca, 5, 2) END AS mes, "
+        "COUNT(*) FROM consumos GROUP BY mes ORDER BY marca = 0, mes").fetchall()
+    return dict(filas)
+
+def iterar_consumos(despues_de=None, fecha_inicio=None, fecha_fin=None, nit=None, instancia=None):
+    """Recorre los consumos por ID; cada filtro se resuelve con los índices de la tabla"""
+    conn = _conexion()
+    condiciones, parametros = [], []
+    if despues_de is not None:
+        condiciones.append('id > ?')
+        parametros.append(int(despues_de))
+    if fecha_inicio or fecha_fin:
+        condiciones.append('marca BETWEEN ? AND ?')
+        parametros.extend(rango_marcas(fecha_inicio or '01/01/0001', fecha_fin or '31/12/9999'))
+    if nit is not None:
+        condiciones.append('nit = ?')
+        parametros.append(nit)
+    if instancia is not None:
+        condiciones.append('id_instancia = ?')
+        parametros.append(instancia)
+
+    consulta = 'SELECT id, nit, id_instancia, tiempo, fechahora FROM consumos'
+    if condiciones:
+        consulta += ' WHERE ' + ' AND '.join(condiciones)
+    consulta += ' ORDER BY id'
+
+    # El cursor de SQLite entrega las filas a medida que se piden
+    for fila in conn.execute(consulta, parametros):
+        yield Consumo(fila[1], fila[2], fila[3], fila[4], str(fila[0]))
+
+def cargar_consumos(fecha_inicio=None, fecha_fin=None):
+    """Carga los consumos; con fecha_inicio/fecha_fin ('DD/MM/AAAA') usa el índice por fecha"""
+    try:
+        consumos = list(iterar_consumos(fecha_inicio=fecha_inicio, fecha_fin=fecha_fin))
+        logger.debug("🔍 CARGAR_CONSUMOS - %s consumos encontrados", len(consumos))
+        return consumos
+    except Exception as e:
+        logger.error("🔴 ERROR cargando consumos: %s", e)
+        return []
+
+# ========== CONSUMOS FACTURADOS ==========
+def guardar_consumos_facturados(ids_consumo, numero_factura):
+    guardar_consumos_facturados_por_factura({numero_factura: ids_consumo})
+
+def guardar_consumos_facturados_por_factura(ids_por_factura):
+    conn = _conexion()
+    with conn:
+        _insertar_facturados(conn, ids_por_factura)
+
+def _insertar_facturados(conn, ids_por_factura):
+    conn.executemany(
+        'INSERT OR REPLACE INTO consumos_facturados (consumo_id, factura) VALUES (?, ?)',
+        [(str(id_consumo), str(numero_factura))
+         for numero_factura, ids_consumo in ids_por_factura.items() for id_consumo in ids_consumo])
+    _incrementar_version(conn, 'consumos_facturados')
+
+def cargar_consumos_facturados(fecha_inicio=None, fecha_fin=None):
+    """{id_consumo: numero_factura}; con fecha_inicio/fecha_fin solo los consumos del período"""
+    try:
+        if not (fecha_inicio or fecha_fin):
+            return _leer_con_cache('consumos_facturados',
+                                   lambda conn: dict(conn.execute('SELECT consumo_id, factura FROM consumos_facturados')))
+        rango = rango_marcas(fecha_inicio or '01/01/0001', fecha_fin or '31/12/9999')
+        return _leer_con_cache('consumos_facturados', lambda conn: dict(conn.execute(
+            'SELECT f.consumo_id, f.factura FROM consumos c '
+            'JOIN consumos_facturados f ON f.consumo_id = CAST(c.id AS TEXT) '
+            'WHERE c.marca BETWEEN ? AND ?', rango)), vista=rango)
+    except Exception as e:
+        logger.error("🔴 ERROR cargando consumos facturados: %s", e)
+        return {}
+
+# ========== FUNCIONES PARA FACTURAS ==========
+def guardar_factura(factura):
+    guardar_facturas([factura])
+    logger.debug("💾 Factura guardada exitosamente: %s - Monto: Q%.2f", factura.numero_factura, float(factura.monto_total))
+    return True
+
+def guardar_facturas(facturas):
+    conn = _conexion()
+    with conn:
+        _insertar_facturas(conn, facturas)
+
+    logger.debug("💾 Facturas guardadas: %s", len(facturas))
+    return True
+
+def _insertar_facturas(conn, facturas):
+    for factura in facturas:
+        cursor = conn.execute(
+            'INSERT INTO facturas (numero, nit, fecha, monto_total) VALUES (?, ?, ?, ?)',
+            (str(factura.numero_factura), factura.nit_cliente, factura.fecha_factura, str(factura.monto_total)))
+        conn.executemany(
+            'INSERT INTO factura_detalles (factura_id, posicion, id_instancia, tiempo_total, monto) VALUES (?, ?, ?, ?, ?)',
+            [(cursor.lastrowid, i, str(d['id_instancia']), str(d['tiempo_total']), str(d['monto']))
+             for i, d in enumerate(factura.detalles)])
+        _acumular_factura(conn, factura)
+    _incrementar_version(conn, 'facturas')
+
+# ========== CORRIDA DE FACTURACIÓN ==========
+# Una corrida lee los consumos sin facturar y escribe las facturas y los
+# consumos que cubren. El candado evita que dos corridas (en hilos o procesos
+# distintos) lean los mismos consumos pendientes; la transacción única evita
+# que un corte deje facturas sin sus consumos marcados.
+
+def bloqueo_facturacion():
+    """Candado exclusivo entre procesos para toda una corrida de facturación"""
+    return bloqueo_archivo(os.path.abspath(config.SQLITE_PATH) + '.facturacion')
+
+def guardar_facturacion(facturas, ids_por_factura):
+    """Guarda las facturas y sus consumos facturados en una sola transacción"""
+    conn = _conexion()
+    with conn:
+        _insertar_facturas(conn, facturas)
+        _insertar_facturados(conn, ids_por_factura)
+
+    logger.debug("💾 Facturas guardadas: %s", len(facturas))
+    return True
+
+def _leer_facturas(conn):
+    detalles_por_factura = {}
+    for factura_id, id_instancia, tiempo_total, monto in conn.execute(
+            'SELECT factura_id, id_instancia, tiempo_total, monto FROM factura_detalles ORDER BY factura_id, posicion'):
+        detalles_por_factura.setdefault(factura_id, []).append({
+            'idInstancia': id_instancia,
+            'tiempoTotal': tiempo_total,
+            'monto': monto
+        })
+
+    return [{
+        'numero': fila[1],
+        'nitCliente': fila[2],
+        'fechaFactura': fila[3],
+        'montoTotal': fila[4],
+        'detalles': detalles_por_factura.get(fila[0], [])
+    } for fila in conn.execute('SELECT id, numero, nit, fecha, monto_total FROM facturas ORDER BY id')]
+
+def cargar_facturas():
+    try:
+        facturas = _leer_con_cache('facturas', _leer_facturas)
+        logger.debug("🔍 CARGAR_FACTURAS - %s facturas encontradas", len(facturas))
+        return facturas
+    except Exception as e:
+        logger.error("🔴 ERROR cargando facturas: %s", e)
+        return []
+
+def cargar_factura(numero_factura):
+    """Devuelve una sola factura por su número, o None si no existe"""
+    try:
+        conn = _conexion()
+        fila = conn.execute(
+            'SELECT id, numero, nit, fecha, monto_total FROM facturas WHERE numero = ? ORDER BY id LIMIT 1',
+            (str(numero_factura),)).fetchone()
+        if fila is None:
+            return None
+        detalles = [{
+            'idInstancia': id_instancia,
+            'tiempoTotal': tiempo_total,
+            'monto': monto
+        } for id_instancia, tiempo_total, monto in conn.execute(
+            'SELECT id_instancia, tiempo_total, monto FROM factura_detalles WHERE factura_id = ? ORDER BY posicion', (fila[0],))]
+        return {
+            'numero': fila[1],
+            'nitCliente': fila[2],
+            'fechaFactura': fila[3],
+            'montoTotal': fila[4],
+            'detalles': detalles
+        }
+    except Exception as e:
+        logger.error("🔴 ERROR cargando factura %s: %s", numero_factura, e)
+        return None
+
+def cargar_numeros_factura(nit_cliente):
+    """Números de las facturas de un cliente, en orden de emisión"""
+    conn = _conexion()
+    return [fila[0] for fila in conn.execute('SELECT numero FROM facturas WHERE nit = ? ORDER BY id', (nit_cliente,))]
+
+def iterar_facturas(despues_de=None, nit=None):
+    """Pares (id, factura) en orden de emisión, leyendo los detalles de a un bloque de facturas"""
+    conn = _conexion()
+    consulta = 'SELECT id, numero, nit, fecha, monto_total FROM facturas WHERE id > ?'
+    parametros = [int(despues_de) if despues_de is not None else 0]
+    if nit is not None:
+        consulta += ' AND nit = ?'
+        parametros.append(nit)
+    filas = conn.execute(consulta + ' ORDER BY id', parametros)
+
+    while True:
+        bloque = filas.fetchmany(FACTURAS_POR_BLOQUE)
+        if not bloque:
+            return
+        detalles_por_factura = {}
+        marcadores = ', '.join('?' * len(bloque))
+        for factura_id, id_instancia, tiempo_total, monto in conn.execute(
+                'SELECT factura_id, id_instancia, tiempo_total, monto FROM factura_detalles '
+                f'WHERE factura_id IN ({marcadores}) ORDER BY factura_id, posicion', [fila[0] for fila in bloque]):
+            detalles_por_factura.setdefault(factura_id, []).append({
+                'idInstancia': id_instancia,
+                'tiempoTotal': tiempo_total,
+                'monto': monto
+            })
+        for fila in bloque:
+            yield fila[0], {
+                'numero': fila[1],
+                'nitCliente': fila[2],
+                'fechaFactura': fila[3],
+                'montoTotal': fila[4],
+                'detalles': detalles_por_factura.get(fila[0], [])
+            }
+
+# ========== ACUMULADOS DE INGRESOS ==========
+# Ingresos y horas por día y por (día, instancia), actualizados en la misma
+# transacción que guarda cada factura.
+def _acumular_factura(conn, factura):
+    dia = dia_de_fecha(factura.fecha_factura)
+    horas_factura = sum(float(d['tiempo_total']) for d in factura.detalles)
+    conn.execute(
+        'INSERT INTO acumulados_dia (dia, facturas, monto, horas) VALUES (?, 1, ?, ?) '
+        'ON CONFLICT(dia) DO UPDATE SET facturas = facturas + 1, monto = monto + excluded.monto, horas = horas + excluded.horas',
+        (dia, float(factura.monto_total), horas_factura))
+    conn.executemany(
+        'INSERT INTO acumulados_instancia (dia, id_instancia, lineas, horas, monto) VALUES (?, ?, 1, ?, ?) '
+        'ON CONFLICT(dia, id_instancia) DO UPDATE SET lineas = lineas + 1, horas = horas + excluded.horas, monto = monto + excluded.monto',
+        [(dia, str(d['id_instancia']), float(d['tiempo_total']), float(d['monto'])) for d in factura.detalles])
+
+def cargar_acumulados_ingresos(fecha_inicio=None, fecha_fin=None):
+    """Mismo resultado que xml_storage.cargar_acumulados_ingresos, sumando solo los días del rango"""
+    conn = _conexion()
+    condicion, parametros = '', ()
+    if fecha_inicio or fecha_fin:
+        condicion = ' WHERE dia BETWEEN ? AND ?'
+        parametros = (dia_de_fecha(fecha_inicio) if fecha_inicio else 1, dia_de_fecha(fecha_fin) if fecha_fin else 99999999)
+
+    facturas, monto, horas = conn.execute(
+        'SELECT COALESCE(SUM(facturas), 0), COALESCE(SUM(monto), 0.0), COALESCE(SUM(horas), 0.0) FROM acumulados_dia' + condicion,
+        parametros).fetchone()
+    instancias = {
+        id_instancia: {'lineas': lineas, 'horas': horas_inst, 'monto': monto_inst}
+        for id_instancia, lineas, horas_inst, monto_inst in conn.execute(
+            'SELECT id_instancia, SUM(lineas), SUM(horas), SUM(monto) FROM acumulados_instancia' + condicion +
+            ' GROUP BY id_instancia ORDER BY MIN(rowid)', parametros)
+    }
+    return {'facturas': facturas, 'monto': monto, 'horas': horas, 'instancias': instancias}
+
+# ========== SECUENCIAS ==========
+# No se reinician con reset_database para que un número nunca se reutilice.
+def reservar_secuencia(nombre, cantidad=1):
+    """Reserva `cantidad` valores consecutivos y devuelve el primero"""
+    conn = _conexion()
+    with conn:
+        # El INSERT abre la transacción de escritura; nadie más avanza el contador hasta el commit
+        conn.execute('INSERT OR IGNORE INTO secuencias (nombre, ultimo) VALUES (?, 0)', (nombre,))
+        conn.execute('UPDATE secuencias SET ultimo = ultimo + ? WHERE nombre = ?', (cantidad, nombre))
+        fila = conn.execute('SELECT ultimo FROM secuencias WHERE nombre = ?', (nombre,)).fetchone()
+    return fila[0] - cantidad + 1
+
+# ========== VERSIÓN DE LOS DATOS ==========
+def version_datos(*tablas):
+    """Texto que cambia cada vez que cambia alguna de las tablas indicadas"""
+    conn = _conexion()
+    versiones = dict(conn.execute('SELECT tabla, version FROM versiones'))
+    return config.SQLITE_PATH + '|' + '|'.join(f'{tabla}:{versiones.get(tabla, 0)}' for tabla in tablas)
+
+# ========== FUNCIÓN GENERAL PARA CONSULTAS ==========
+def cargar_datos(tipo, subtipo=None):
+    """Función general para compatibilidad con el código existente"""
+    if tipo == 'recursos':
+        return cargar_recursos()
+    elif tipo == 'categorias':
+        return cargar_categorias()
+    elif tipo == 'clientes':
+        return cargar_clientes()
+    elif tipo == 'consumos':
+        return cargar_consumos()
+    elif tipo == 'facturas':
+        return cargar_facturas()
+    else:
+        return []
+
+# ========== IMPORTACIÓN / EXPORTACIÓN XML ==========
+def importar_desde_xml():
+    """Copia todo el contenido de los archivos XML a la base SQLite (reemplaza lo existente)"""
+    from . import xml_storage
+
+    reset_database()
+    guardar_recursos([Recurso.desde_dict(r) for r in xml_storage.cargar_recursos()])
+    guardar_categorias([Categoria.desde_dict(c) for c in xml_storage.cargar_categorias()])
+    guardar_clientes([Cliente.desde_dict(c) for c in xml_storage.cargar_clientes()])
+
+    consumos = xml_storage.cargar_consumos()
+    ids_nuevos = _copiar_consumos(consumos, guardar_consumos, lambda: cargar_consumos()[-len(consumos):] if consumos else [])
+    _copiar_facturados(xml_storage.cargar_consumos_facturados(), ids_nuevos, guardar_consumos_facturados)
+
+    guardar_facturas([Factura.desde_dict(f) for f in xml_storage.cargar_facturas()])
+    _copiar_secuencia('facturas', xml_storage.reservar_secuencia, reservar_secuencia)
+
+    logger.info("✅ Importación XML -> SQLite completada")
+
+def exportar_a_xml():
+    """Escribe el contenido de la base SQLite en los archivos XML (reemplaza lo existente)"""
+    from . import xml_storage
+
+    xml_storage.reset_database()
+    xml_storage.guardar_recursos([Recurso.desde_dict(r) for r in cargar_recursos()])
+    xml_storage.guardar_categorias([Categoria.desde_dict(c) for c in cargar_categorias()])
+    xml_storage.guardar_clientes([Cliente.desde_dict(c) for c in cargar_clientes()])
+
+    consumos = cargar_consumos()
+    ids_nuevos = _copiar_consumos(consumos, xml_storage.guardar_consumos, xml_storage.cargar_consumos)
+    _copiar_facturados(cargar_consumos_facturados(), ids_nuevos, xml_storage.guardar_consumos_facturados)
+
+    xml_storage.guardar_facturas([Factura.desde_dict(f) for f in cargar_facturas()])
+    _copiar_secuencia('facturas', reservar_secuencia, xml_storage.reservar_secuencia)
+
+    logger.info("✅ Exportación SQLite -> XML completada")
+
+def _copiar_consumos(consumos, guardar, cargar_destino):
+    """Copia los consumos y devuelve {id_origen: id_destino} para remapear las facturaciones"""
+    guardar(consumos)
+
+    # Ambos backends asignan IDs nuevos; se emparejan por contenido y orden
+    pendientes = {}
+    for c in consumos:
+        clave = (c.nit_cliente, c.id_instancia, c.fecha_hora, c.tiempo)
+        pendientes.setdefault(clave, []).append(c.id)
+    ids_nuevos = {}
+    for c in cargar_destino():
+        clave = (c.nit_cliente, c.id_instancia, c.fecha_hora, c.tiempo)
+        if pendientes.get(clave):
+            ids_nuevos[pendientes[clave].pop(0)] = c.id
+    return ids_nuevos
+
+def _copiar_facturados(facturados, ids_nuevos, guardar):
+    por_factura = {}
+    for id_consumo, numero in facturados.items():
+        if id_consumo in ids_nuevos:
+            por_factura.setdefault(numero, []).append(ids_nuevos[id_consumo])
+    for numero, ids in por_factura.items():
+        guardar(ids, numero)
+
+def _copiar_secuencia(nombre, reservar_origen, reservar_destino):
+    """Adelanta la secuencia del destino hasta la del origen para no repetir números"""
+    # Reservar 0 valores devuelve el siguiente sin consumirlo
+    faltantes = reservar_origen(nombre, 0) - reservar_destino(nombre, 0)
+    if faltantes > 0:
+        reservar_destino(nombre, faltantes)
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    accion = sys.argv[1] if len(sys.argv) > 1 else ''
+    if accion == 'importar':
+        importar_desde_xml()
+    elif accion == 'exportar':
+        exportar_a_xml()
+    else:
+        print("Uso: python -m database.sqlite_storage [importar|exportar]")
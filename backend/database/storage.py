@@ -0,0 +1,65 @@
+"""
+Punto de acceso único a la persistencia. Expone la misma API guardar_*/cargar_*
+sin importar el backend elegido en config.ALMACENAMIENTO.
+"""
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+if config.ALMACENAMIENTO == 'sqlite':
+    from . import sqlite_storage as _backend
+else:
+    from . import xml_storage as _backend
+
+logger.debug("💾 Almacenamiento: %s", _backend.__name__)
+
+reset_database = _backend.reset_database
+
+guardar_recurso = _backend.guardar_recurso
+guardar_recursos = _backend.guardar_recursos
+cargar_recursos = _backend.cargar_recursos
+
+guardar_categoria = _backend.guardar_categoria
+guardar_categorias = _backend.guardar_categorias
+cargar_categorias = _backend.cargar_categorias
+
+guardar_cliente = _backend.guardar_cliente
+guardar_clientes = _backend.guardar_clientes
+cargar_clientes = _backend.cargar_clientes
+
+cargar_huellas = _backend.cargar_huellas
+
+guardar_consumo = _backend.guardar_consumo
+guardar_consumos = _backend.guardar_consumos
+cargar_consumos = _backend.cargar_consumos
+iterar_consumos = _backend.iterar_consumos
+cargar_manifiesto_consumos = _backend.cargar_manifiesto_consumos
+
+iniciar_carga_consumos = _backend.iniciar_carga_consumos
+agregar_a_carga_consumos = _backend.agregar_a_carga_consumos
+confirmar_carga_consumos = _backend.confirmar_carga_consumos
+descartar_carga_consumos = _backend.descartar_carga_consumos
+
+guardar_consumos_facturados = _backend.guardar_consumos_facturados
+guardar_consumos_facturados_por_factura = _backend.guardar_consumos_facturados_por_factura
+cargar_consumos_facturados = _backend.cargar_consumos_facturados
+
+bloqueo_facturacion = _backend.bloqueo_facturacion
+guardar_facturacion = _backend.guardar_facturacion
+
+guardar_factura = _backend.guardar_factura
+guardar_facturas = _backend.guardar_facturas
+cargar_facturas = _backend.cargar_facturas
+cargar_factura = _backend.cargar_factura
+cargar_numeros_factura = _backend.cargar_numeros_factura
+iterar_facturas = _backend.iterar_facturas
+cargar_acumulados_ingresos = _backend.cargar_acumulados_ingresos
+
+reservar_secuencia = _backend.reservar_secuencia
+
+cargar_datos = _backend.cargar_datos
+version_datos = _backend.version_datos
+
+invalidar_cache = _backend.invalidar_cache
+estadisticas_cache = _backend.estadisticas_cache
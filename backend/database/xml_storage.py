@@ -1,58 +1,182 @@
 import os
+import bisect
+import logging
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from itertools import islice
 import xml.etree.ElementTree as ET
 from datetime import datetime
+import config
 from .models import Recurso, Configuracion, Categoria, Cliente, Instancia, Consumo, Factura
+from utils.date_utils import marca_tiempo, rango_marcas, mes_de_fecha, dia_de_fecha
+from utils.bloqueos import bloqueo_archivo
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+logger = logging.getLogger(__name__)
+
+DATA_DIR = config.XML_DATA_DIR
+CONSUMOS_LOG_DIR = os.path.join(DATA_DIR, 'consumos')
+CONSUMOS_MANIFIESTO = os.path.join(CONSUMOS_LOG_DIR, 'manifiesto.xml')
+PARTICION_SIN_FECHA = 'sin-fecha'
+CARGAS_CONSUMOS_DIR = os.path.join(DATA_DIR, 'cargas_consumos')
+FACTURADOS_LOG_DIR = os.path.join(DATA_DIR, 'consumos_facturados')
+FACTURAS_LOG_DIR = os.path.join(DATA_DIR, 'facturas')
+FACTURAS_INDICE_DIR = os.path.join(DATA_DIR, 'facturas_indice')
+SECUENCIAS_FILE = os.path.join(DATA_DIR, 'secuencias.xml')
+ACUMULADOS_FILE = os.path.join(DATA_DIR, 'acumulados_ingresos.xml')
+FACTURACION_PENDIENTE = os.path.join(DATA_DIR, 'facturacion_pendiente.xml')
+
+# Tamaño a partir del cual el log de consumos abre un segmento nuevo
+TAMANO_MAX_SEGMENTO = 64 * 1024 * 1024
 
 def ensure_data_dir():
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
 
+# ========== ESCRITURA SEGURA ==========
+# Cada archivo tiene un candado entre procesos en "<archivo>.lock" que
+# serializa las escrituras (leer, modificar y volver a escribir). Los archivos
+# completos se escriben en un temporal y se sustituyen con os.replace, así que
+# un lector nunca espera ni ve un archivo a medio escribir: ve el anterior o el
+# nuevo. Las lecturas no toman el candado.
+
+def _escribir_atomico(file_path, datos):
+    """Escribe los bytes en un temporal del mismo directorio y lo sustituye de una vez"""
+    directorio = os.path.dirname(file_path)
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix='.' + os.path.basename(file_path), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, file_path)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    invalidar_cache(file_path)
+
+def _parsear_para_modificar(file_path, etiqueta_raiz):
+    """Árbol actual del archivo para modificarlo; un archivo ilegible se aparta en vez de perderse"""
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return ET.ElementTree(ET.Element(etiqueta_raiz))
+    try:
+        return ET.parse(file_path)
+    except ET.ParseError as e:
+        respaldo = f"{file_path}.corrupto-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        os.replace(file_path, respaldo)
+        logger.error("🔴 ERROR: %s no se pudo leer (%s); se movió a %s", os.path.basename(file_path), e, os.path.basename(respaldo))
+        return ET.ElementTree(ET.Element(etiqueta_raiz))
+
+# ========== CACHÉ DE LECTURAS ==========
+# Guarda el resultado ya parseado de cada archivo junto con su firma
+# (mtime_ns, tamaño). Si la firma no cambió se devuelve el mismo resultado,
+# por lo que las listas devueltas por cargar_* son compartidas y no deben
+# modificarse.
+_cache_lecturas = {}
+_estadisticas_cache = {'aciertos': 0, 'fallos': 0, 'invalidaciones': 0}
+_cache_lock = threading.Lock()
+
+def _firma_archivo(file_path):
+    estado = os.stat(file_path)
+    return (estado.st_mtime_ns, estado.st_size)
+
+def _leer_con_cache(file_path, parsear, vista=None):
+    """Devuelve parsear(file_path), reutilizando el resultado si el archivo no cambió.
+    
+    `vista` distingue varios resultados derivados del mismo archivo (p. ej. un índice).
+    """
+    firma = _firma_archivo(file_path)
+    clave = file_path if vista is None else (file_path, vista)
+    with _cache_lock:
+        entrada = _cache_lecturas.get(clave)
+        if entrada is not None and entrada[0] == firma:
+            _estadisticas_cache['aciertos'] += 1
+            return entrada[1]
+        _estadisticas_cache['fallos'] += 1
+    
+    resultado = parsear(file_path)
+    with _cache_lock:
+        _cache_lecturas[clave] = (firma, resultado)
+    return resultado
+
+def invalidar_cache(file_path=None):
+    """Descarta la entrada de un archivo, o toda la caché si no se indica ninguno"""
+    with _cache_lock:
+        if file_path is None:
+            _cache_lecturas.clear()
+        else:
+            for clave in [c for c in _cache_lecturas if c == file_path or (isinstance(c, tuple) and c[0] == file_path)]:
+                del _cache_lecturas[clave]
+        _estadisticas_cache['invalidaciones'] += 1
+
+def estadisticas_cache():
+    with _cache_lock:
+        estadisticas = dict(_estadisticas_cache)
+        estadisticas['entradas'] = len(_cache_lecturas)
+    return estadisticas
+
 def reset_database():
     ensure_data_dir()
-    archivos = ['recursos.xml', 'categorias.xml', 'clientes.xml', 'consumos.xml', 'facturas.xml']
-    for archivo in archivos:
+    raices = {
+        'recursos.xml': 'recursos',
+        'categorias.xml': 'categorias',
+        'clientes.xml': 'clientes',
+        'consumos.xml': 'consumos',
+        'facturas.xml': 'facturas'
+    }
+    for archivo, etiqueta_raiz in raices.items():
         file_path = os.path.join(DATA_DIR, archivo)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-            if archivo == 'recursos.xml':
-                f.write('<recursos>\n</recursos>')
-            elif archivo == 'categorias.xml':
-                f.write('<categorias>\n</categorias>')
-            elif archivo == 'clientes.xml':
-                f.write('<clientes>\n</clientes>')
-            elif archivo == 'consumos.xml':
-                f.write('<consumos>\n</consumos>')
-            elif archivo == 'facturas.xml':
-                f.write('<facturas>\n</facturas>')
+        with bloqueo_archivo(file_path):
+            _escribir_atomico(file_path, f'<?xml version="1.0" encoding="UTF-8"?>\n<{etiqueta_raiz}>\n</{etiqueta_raiz}>'.encode('utf-8'))
+    
+    # Vaciar los logs por segmentos (incluye las particiones mensuales) y las cargas sin confirmar
+    for directorio in (CONSUMOS_LOG_DIR, CARGAS_CONSUMOS_DIR, FACTURADOS_LOG_DIR, FACTURAS_LOG_DIR, FACTURAS_INDICE_DIR):
+        with bloqueo_archivo(directorio):
+            shutil.rmtree(directorio, ignore_errors=True)
+    for archivo in (ACUMULADOS_FILE, FACTURACION_PENDIENTE):
+        with bloqueo_archivo(archivo):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+    
+    invalidar_cache()
 
-# ========== FUNCIONES PARA RECURSOS ==========
-def guardar_recurso(recurso):
-    """Guarda un recurso en su propio archivo"""
+# ========== ESCRITURA POR LOTES ==========
+def _guardar_lote(nombre_archivo, etiqueta_raiz, etiqueta, atributo_clave, elementos):
+    """Inserta o reemplaza elementos por su clave con un solo parseo y una sola escritura.
+    
+    Los elementos existentes conservan su posición; los nuevos se agregan al final.
+    """
     ensure_data_dir()
-    file_path = os.path.join(DATA_DIR, 'recursos.xml')
+    file_path = os.path.join(DATA_DIR, nombre_archivo)
     
-    try:
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
+    with bloqueo_archivo(file_path):
+        tree = _parsear_para_modificar(file_path, etiqueta_raiz)
+        root = tree.getroot()
+        _reemplazar_por_clave(root, etiqueta, atributo_clave, elementos)
+        indent(root)
+        _escribir_atomico(file_path, ET.tostring(root, encoding='utf-8', xml_declaration=True))
+
+def _reemplazar_por_clave(root, etiqueta, atributo_clave, elementos):
+    otros = []
+    por_clave = {}
+    for elem in list(root):
+        if elem.tag == etiqueta:
+            por_clave[elem.get(atributo_clave)] = elem
         else:
-            root = ET.Element('recursos')
-            tree = ET.ElementTree(root)
-    except Exception as e:
-        print(f"🔴 ERROR cargando recursos: {e}")
-        root = ET.Element('recursos')
-        tree = ET.ElementTree(root)
+            otros.append(elem)
     
-    # Eliminar recurso existente con mismo ID
-    for elem in root.findall('recurso'):
-        if elem.get('id') == str(recurso.id_recurso):
-            root.remove(elem)
-            break
+    for elem in elementos:
+        por_clave[elem.get(atributo_clave)] = elem
     
-    # Agregar nuevo recurso
-    recurso_elem = ET.SubElement(root, 'recurso')
+    root[:] = otros + list(por_clave.values())
+
+# ========== FUNCIONES PARA RECURSOS ==========
+def _recurso_a_elemento(recurso):
+    recurso_elem = ET.Element('recurso')
     recurso_elem.set('id', str(recurso.id_recurso))
     
     ET.SubElement(recurso_elem, 'nombre').text = recurso.nombre
@@ -60,10 +184,34 @@ def guardar_recurso(recurso):
     ET.SubElement(recurso_elem, 'metrica').text = recurso.metrica
     ET.SubElement(recurso_elem, 'tipo').text = recurso.tipo
     ET.SubElement(recurso_elem, 'valorXhora').text = str(recurso.valor_x_hora)
+    return recurso_elem
+
+def guardar_recurso(recurso):
+    """Guarda un recurso en su propio archivo"""
+    _guardar_lote('recursos.xml', 'recursos', 'recurso', 'id', [_recurso_a_elemento(recurso)])
+    logger.debug("💾 Recurso guardado: %s (ID: %s)", recurso.nombre, recurso.id_recurso)
+
+def guardar_recursos(recursos):
+    """Guarda varios recursos con una sola escritura del archivo"""
+    _guardar_lote('recursos.xml', 'recursos', 'recurso', 'id', [_recurso_a_elemento(r) for r in recursos])
+    logger.debug("💾 Recursos guardados: %s", len(recursos))
+
+def _parsear_recursos(file_path):
+    tree = ET.parse(file_path)
+    root = tree.getroot()
     
-    indent(root)
-    tree.write(file_path, encoding='utf-8', xml_declaration=True)
-    print(f"💾 Recurso guardado: {recurso.nombre} (ID: {recurso.id_recurso})")
+    recursos = []
+    for elem in root.findall('recurso'):
+        recursos.append({
+            'tipo': 'recurso',
+            'id': elem.get('id'),
+            'nombre': elem.find('nombre').text if elem.find('nombre') is not None else '',
+            'abreviatura': elem.find('abreviatura').text if elem.find('abreviatura') is not None else '',
+            'metrica': elem.find('metrica').text if elem.find('metrica') is not None else '',
+            'tipo_recurso': elem.find('tipo').text if elem.find('tipo') is not None else '',
+            'valor_x_hora': elem.find('valorXhora').text if elem.find('valorXhora') is not None else '0'
+        })
+    return recursos
 
 def cargar_recursos():
     """Carga todos los recursos desde su archivo"""
@@ -74,54 +222,18 @@ def cargar_recursos():
         return []
     
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        recursos = []
-        for elem in root.findall('recurso'):
-            recursos.append({
-                'tipo': 'recurso',
-                'id': elem.get('id'),
-                'nombre': elem.find('nombre').text if elem.find('nombre') is not None else '',
-                'abreviatura': elem.find('abreviatura').text if elem.find('abreviatura') is not None else '',
-                'metrica': elem.find('metrica').text if elem.find('metrica') is not None else '',
-                'tipo_recurso': elem.find('tipo').text if elem.find('tipo') is not None else '',
-                'valor_x_hora': elem.find('valorXhora').text if elem.find('valorXhora') is not None else '0'
-            })
+        recursos = _leer_con_cache(file_path, _parsear_recursos)
         
-        print(f"🔍 CARGAR_RECURSOS - {len(recursos)} recursos encontrados")
+        logger.debug("🔍 CARGAR_RECURSOS - %s recursos encontrados", len(recursos))
         return recursos
         
     except Exception as e:
-        print(f"🔴 ERROR cargando recursos: {e}")
+        logger.error("🔴 ERROR cargando recursos: %s", e)
         return []
 
 # ========== FUNCIONES PARA CATEGORÍAS ==========
-def guardar_categoria(categoria):
-    """Guarda una categoría en su propio archivo"""
-    ensure_data_dir()
-    file_path = os.path.join(DATA_DIR, 'categorias.xml')
-    
-    try:
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-        else:
-            root = ET.Element('categorias')
-            tree = ET.ElementTree(root)
-    except Exception as e:
-        print(f"🔴 ERROR cargando categorías: {e}")
-        root = ET.Element('categorias')
-        tree = ET.ElementTree(root)
-    
-    # Eliminar categoría existente con mismo ID
-    for elem in root.findall('categoria'):
-        if elem.get('id') == str(categoria.id_categoria):
-            root.remove(elem)
-            break
-    
-    # Agregar nueva categoría
-    categoria_elem = ET.SubElement(root, 'categoria')
+def _categoria_a_elemento(categoria):
+    categoria_elem = ET.Element('categoria')
     categoria_elem.set('id', str(categoria.id_categoria))
     
     ET.SubElement(categoria_elem, 'nombre').text = categoria.nombre
@@ -140,10 +252,50 @@ def guardar_categoria(categoria):
             recurso_elem = ET.SubElement(recursos_elem, 'recurso')
             recurso_elem.set('id', str(recurso_id))
             recurso_elem.text = str(cantidad)
+    return categoria_elem
+
+def guardar_categoria(categoria):
+    """Guarda una categoría en su propio archivo"""
+    _guardar_lote('categorias.xml', 'categorias', 'categoria', 'id', [_categoria_a_elemento(categoria)])
+    logger.debug("💾 Categoría guardada: %s (ID: %s)", categoria.nombre, categoria.id_categoria)
+
+def guardar_categorias(categorias):
+    """Guarda varias categorías con una sola escritura del archivo"""
+    _guardar_lote('categorias.xml', 'categorias', 'categoria', 'id', [_categoria_a_elemento(c) for c in categorias])
+    logger.debug("💾 Categorías guardadas: %s", len(categorias))
+
+def _parsear_categorias(file_path):
+    tree = ET.parse(file_path)
+    root = tree.getroot()
     
-    indent(root)
-    tree.write(file_path, encoding='utf-8', xml_declaration=True)
-    print(f"💾 Categoría guardada: {categoria.nombre} (ID: {categoria.id_categoria})")
+    categorias = []
+    for elem in root.findall('categoria'):
+        configuraciones = []
+        configs_elem = elem.find('configuraciones')
+        if configs_elem is not None:
+            for config in configs_elem.findall('configuracion'):
+                recursos_config = {}
+                recursos_elem = config.find('recursos')
+                if recursos_elem is not None:
+                    for recurso in recursos_elem.findall('recurso'):
+                        recursos_config[recurso.get('id')] = recurso.text
+    
+                configuraciones.append({
+                    'id': config.get('id'),
+                    'nombre': config.find('nombre').text if config.find('nombre') is not None else '',
+                    'descripcion': config.find('descripcion').text if config.find('descripcion') is not None else '',
+                    'recursos': recursos_config
+                })
+    
+        categorias.append({
+            'tipo': 'categoria',
+            'id': elem.get('id'),
+            'nombre': elem.find('nombre').text if elem.find('nombre') is not None else '',
+            'descripcion': elem.find('descripcion').text if elem.find('descripcion') is not None else '',
+            'carga_trabajo': elem.find('cargaTrabajo').text if elem.find('cargaTrabajo') is not None else '',
+            'configuraciones': configuraciones
+        })
+    return categorias
 
 def cargar_categorias():
     """Carga todas las categorías desde su archivo"""
@@ -154,70 +306,18 @@ def cargar_categorias():
         return []
     
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
+        categorias = _leer_con_cache(file_path, _parsear_categorias)
         
-        categorias = []
-        for elem in root.findall('categoria'):
-            configuraciones = []
-            configs_elem = elem.find('configuraciones')
-            if configs_elem is not None:
-                for config in configs_elem.findall('configuracion'):
-                    recursos_config = {}
-                    recursos_elem = config.find('recursos')
-                    if recursos_elem is not None:
-                        for recurso in recursos_elem.findall('recurso'):
-                            recursos_config[recurso.get('id')] = recurso.text
-                    
-                    configuraciones.append({
-                        'id': config.get('id'),
-                        'nombre': config.find('nombre').text if config.find('nombre') is not None else '',
-                        'descripcion': config.find('descripcion').text if config.find('descripcion') is not None else '',
-                        'recursos': recursos_config
-                    })
-            
-            categorias.append({
-                'tipo': 'categoria',
-                'id': elem.get('id'),
-                'nombre': elem.find('nombre').text if elem.find('nombre') is not None else '',
-                'descripcion': elem.find('descripcion').text if elem.find('descripcion') is not None else '',
-                'carga_trabajo': elem.find('cargaTrabajo').text if elem.find('cargaTrabajo') is not None else '',
-                'configuraciones': configuraciones
-            })
-        
-        print(f"🔍 CARGAR_CATEGORIAS - {len(categorias)} categorías encontradas")
+        logger.debug("🔍 CARGAR_CATEGORIAS - %s categorías encontradas", len(categorias))
         return categorias
         
     except Exception as e:
-        print(f"🔴 ERROR cargando categorías: {e}")
+        logger.error("🔴 ERROR cargando categorías: %s", e)
         return []
 
 # ========== FUNCIONES PARA CLIENTES ==========
-def guardar_cliente(cliente):
-    """Guarda un cliente en su propio archivo"""
-    ensure_data_dir()
-    file_path = os.path.join(DATA_DIR, 'clientes.xml')
-    
-    try:
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-        else:
-            root = ET.Element('clientes')
-            tree = ET.ElementTree(root)
-    except Exception as e:
-        print(f"🔴 ERROR cargando clientes: {e}")
-        root = ET.Element('clientes')
-        tree = ET.ElementTree(root)
-    
-    # Eliminar cliente existente con mismo NIT
-    for elem in root.findall('cliente'):
-        if elem.get('nit') == cliente.nit:
-            root.remove(elem)
-            break
-    
-    # Agregar nuevo cliente
-    cliente_elem = ET.SubElement(root, 'cliente')
+def _cliente_a_elemento(cliente):
+    cliente_elem = ET.Element('cliente')
     cliente_elem.set('nit', cliente.nit)
     
     ET.SubElement(cliente_elem, 'nombre').text = cliente.nombre
@@ -237,10 +337,51 @@ def guardar_cliente(cliente):
         ET.SubElement(instancia_elem, 'estado').text = instancia.estado
         if instancia.fecha_final:
             ET.SubElement(instancia_elem, 'fechaFinal').text = instancia.fecha_final
+    return cliente_elem
+
+def guardar_cliente(cliente):
+    """Guarda un cliente en su propio archivo"""
+    _guardar_lote('clientes.xml', 'clientes', 'cliente', 'nit', [_cliente_a_elemento(cliente)])
+    logger.debug("💾 Cliente guardado: %s (NIT: %s)", cliente.nombre, cliente.nit)
+
+def guardar_clientes(clientes):
+    """Guarda varios clientes con una sola escritura del archivo"""
+    _guardar_lote('clientes.xml', 'clientes', 'cliente', 'nit', [_cliente_a_elemento(c) for c in clientes])
+    logger.debug("💾 Clientes guardados: %s", len(clientes))
+
+def _parsear_clientes(file_path, con_credenciales=False):
+    """Con con_credenciales incluye clave y dirección, que la API no expone"""
+    tree = ET.parse(file_path)
+    root = tree.getroot()
+    
+    clientes = []
+    for elem in root.findall('cliente'):
+        instancias = []
+        instancias_elem = elem.find('instancias')
+        if instancias_elem is not None:
+            for instancia in instancias_elem.findall('instancia'):
+                instancias.append({
+                    'id': instancia.get('id'),
+                    'idConfiguracion': instancia.find('idConfiguracion').text if instancia.find('idConfiguracion') is not None else '',
+                    'nombre': instancia.find('nombre').text if instancia.find('nombre') is not None else '',
+                    'fechaInicio': instancia.find('fechaInicio').text if instancia.find('fechaInicio') is not None else '',
+                    'estado': instancia.find('estado').text if instancia.find('estado') is not None else '',
+                    'fechaFinal': instancia.find('fechaFinal').text if instancia.find('fechaFinal') is not None else None
+                })
     
-    indent(root)
-    tree.write(file_path, encoding='utf-8', xml_declaration=True)
-    print(f"💾 Cliente guardado: {cliente.nombre} (NIT: {cliente.nit})")
+        cliente = {
+            'tipo': 'cliente',
+            'nit': elem.get('nit'),
+            'nombre': elem.find('nombre').text if elem.find('nombre') is not None else '',
+            'usuario': elem.find('usuario').text if elem.find('usuario') is not None else '',
+            'correo': elem.find('correoElectronico').text if elem.find('correoElectronico') is not None else '',
+            'instancias': instancias
+        }
+        if con_credenciales:
+            cliente['clave'] = elem.find('clave').text if elem.find('clave') is not None else ''
+            cliente['direccion'] = elem.find('direccion').text if elem.find('direccion') is not None else ''
+        clientes.append(cliente)
+    return clientes
 
 def cargar_clientes():
     """Carga todos los clientes desde su archivo"""
@@ -251,119 +392,478 @@ def cargar_clientes():
         return []
     
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        clientes = []
-        for elem in root.findall('cliente'):
-            instancias = []
-            instancias_elem = elem.find('instancias')
-            if instancias_elem is not None:
-                for instancia in instancias_elem.findall('instancia'):
-                    instancias.append({
-                        'id': instancia.get('id'),
-                        'idConfiguracion': instancia.find('idConfiguracion').text if instancia.find('idConfiguracion') is not None else '',
-                        'nombre': instancia.find('nombre').text if instancia.find('nombre') is not None else '',
-                        'fechaInicio': instancia.find('fechaInicio').text if instancia.find('fechaInicio') is not None else '',
-                        'estado': instancia.find('estado').text if instancia.find('estado') is not None else '',
-                        'fechaFinal': instancia.find('fechaFinal').text if instancia.find('fechaFinal') is not None else None
-                    })
-            
-            clientes.append({
-                'tipo': 'cliente',
-                'nit': elem.get('nit'),
-                'nombre': elem.find('nombre').text if elem.find('nombre') is not None else '',
-                'usuario': elem.find('usuario').text if elem.find('usuario') is not None else '',
-                'correo': elem.find('correoElectronico').text if elem.find('correoElectronico') is not None else '',
-                'instancias': instancias
-            })
+        clientes = _leer_con_cache(file_path, _parsear_clientes)
         
-        print(f"🔍 CARGAR_CLIENTES - {len(clientes)} clientes encontrados")
+        logger.debug("🔍 CARGAR_CLIENTES - %s clientes encontrados", len(clientes))
         return clientes
         
     except Exception as e:
-        print(f"🔴 ERROR cargando clientes: {e}")
+        logger.error("🔴 ERROR cargando clientes: %s", e)
         return []
 
-# ========== FUNCIONES PARA CONSUMOS ==========
-def guardar_consumo(consumo):
+# ========== HUELLAS DE LA CONFIGURACIÓN ==========
+# Para combinar una configuración nueva sin reescribir lo que no cambió
+_HUELLAS = {
+    'recurso': ('recursos.xml', lambda ruta: {r['id']: Recurso.desde_dict(r).huella() for r in _parsear_recursos(ruta)}),
+    'categoria': ('categorias.xml', lambda ruta: {c['id']: Categoria.desde_dict(c).huella() for c in _parsear_categorias(ruta)}),
+    'cliente': ('clientes.xml', lambda ruta: {c['nit']: Cliente.desde_dict(c).huella() for c in _parsear_clientes(ruta, True)}),
+}
+
+def cargar_huellas(tipo):
+    """{ID o NIT: huella()} de lo guardado de `tipo` ('recurso', 'categoria' o 'cliente')"""
     ensure_data_dir()
-    file_path = os.path.join(DATA_DIR, 'consumos.xml')
+    nombre_archivo, parsear = _HUELLAS[tipo]
+    file_path = os.path.join(DATA_DIR, nombre_archivo)
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return {}
+    return _leer_con_cache(file_path, parsear, vista='huellas')
+
+# ========== LOG DE SEGMENTOS (SOLO ANEXAR) ==========
+# Cada segmento es un XML válido: encabezado, un registro por línea y pie.
+# Anexar registros consiste en sobrescribir el pie con los registros nuevos
+# seguidos del pie, en una sola escritura y sin volver a parsear el archivo.
+
+def _encabezado_segmento(etiqueta_raiz):
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<{etiqueta_raiz}>\n'.encode('utf-8')
+
+def _pie_segmento(etiqueta_raiz):
+    return f'</{etiqueta_raiz}>\n'.encode('utf-8')
+
+def _listar_segmentos(directorio):
+    """Devuelve las rutas de los segmentos de un log en orden de escritura"""
+    if not os.path.isdir(directorio):
+        return []
+    nombres = sorted(n for n in os.listdir(directorio) if n.startswith('segmento_') and n.endswith('.xml'))
+    return [os.path.join(directorio, n) for n in nombres]
+
+def _nuevo_segmento(directorio, etiqueta_raiz, numero):
+    file_path = os.path.join(directorio, f'segmento_{numero:06d}.xml')
+    _escribir_atomico(file_path, _encabezado_segmento(etiqueta_raiz) + _pie_segmento(etiqueta_raiz))
+    return file_path
+
+def _posicion_de_anexo(f, etiqueta_raiz):
+    """Ubica dónde escribir el siguiente registro, reparando una cola incompleta"""
+    encabezado = _encabezado_segmento(etiqueta_raiz)
+    pie = _pie_segmento(etiqueta_raiz)
     
-    try:
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
+    f.seek(0, os.SEEK_END)
+    tamano = f.tell()
+    if tamano >= len(encabezado) + len(pie):
+        f.seek(tamano - len(pie))
+        if f.read() == pie:
+            return tamano - len(pie)
+    
+    # El pie no está: una escritura anterior quedó a medias.
+    # Se descarta la última línea incompleta y se conserva lo demás.
+    f.seek(0)
+    contenido = f.read()
+    if not contenido.startswith(encabezado):
+        f.seek(0)
+        f.write(encabezado)
+        return len(encabezado)
+    
+    ultimo_salto = contenido.rfind(b'\n')
+    logger.warning("⚠️ Segmento con cola incompleta, reparando desde el byte %s", ultimo_salto + 1)
+    return ultimo_salto + 1
+
+def _anexar_registros(directorio, etiqueta_raiz, elementos, al_anexar=None):
+    """Anexa elementos al último segmento del log con una única escritura.
+    
+    Devuelve (segmento, [(posición, longitud)]) con el byte donde quedó cada
+    registro. Si se indica, al_anexar recibe lo mismo antes de soltar el candado.
+    """
+    if not elementos:
+        return None, []
+    
+    os.makedirs(directorio, exist_ok=True)
+    lineas = [ET.tostring(elem, encoding='utf-8', xml_declaration=False) for elem in elementos]
+    datos = b''.join(linea + b'\n' for linea in lineas)
+    
+    # El anexo se hace en el lugar (no con os.replace) para no copiar el
+    # segmento completo; los lectores ya toleran una cola incompleta.
+    with bloqueo_archivo(directorio):
+        segmentos = _listar_segmentos(directorio)
+        if not segmentos or os.path.getsize(segmentos[-1]) >= TAMANO_MAX_SEGMENTO:
+            file_path = _nuevo_segmento(directorio, etiqueta_raiz, len(segmentos) + 1)
         else:
-            root = ET.Element('consumos')
-            tree = ET.ElementTree(root)
-    except Exception as e:
-        print(f"🔴 ERROR cargando consumos: {e}")
-        root = ET.Element('consumos')
-        tree = ET.ElementTree(root)
+            file_path = segmentos[-1]
+        
+        with open(file_path, 'r+b') as f:
+            posicion = _posicion_de_anexo(f, etiqueta_raiz)
+            f.seek(posicion)
+            f.write(datos + _pie_segmento(etiqueta_raiz))
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        invalidar_cache(file_path)
+        
+        ubicaciones = []
+        for linea in lineas:
+            ubicaciones.append((posicion, len(linea)))
+            posicion += len(linea) + 1
+        if al_anexar is not None:
+            al_anexar(file_path, ubicaciones)
+    return file_path, ubicaciones
+
+def _leer_segmento(file_path, etiqueta_registro):
+    """Lee los registros de un segmento; tolera una última línea incompleta"""
+    try:
+        return ET.parse(file_path).getroot().findall(etiqueta_registro)
+    except ET.ParseError:
+        pass
     
-    consumo_elem = ET.SubElement(root, 'consumo')
+    # Lectura línea por línea si el segmento quedó sin pie
+    prefijos = (f'<{etiqueta_registro} '.encode('utf-8'), f'<{etiqueta_registro}>'.encode('utf-8'))
+    registros = []
+    with open(file_path, 'rb') as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea.startswith(prefijos):
+                continue
+            try:
+                registros.append(ET.fromstring(linea))
+            except ET.ParseError:
+                logger.warning("⚠️ Registro incompleto ignorado en %s", os.path.basename(file_path))
+    return registros
+
+# ========== FUNCIONES PARA CONSUMOS ==========
+def _consumo_a_elemento(consumo):
+    consumo_elem = ET.Element('consumo')
     consumo_elem.set('nitCliente', consumo.nit_cliente)
     consumo_elem.set('idInstancia', str(consumo.id_instancia))
     
     ET.SubElement(consumo_elem, 'tiempo').text = str(consumo.tiempo)
     ET.SubElement(consumo_elem, 'fechahora').text = consumo.fecha_hora
+    return consumo_elem
+
+def _elemento_a_consumo(elem, id_consumo):
+    tiempo = elem.find('tiempo')
+    fecha_hora = elem.find('fechahora')
+    return Consumo(
+        elem.get('nitCliente'),
+        elem.get('idInstancia'),
+        tiempo.text if tiempo is not None else '0',
+        fecha_hora.text if fecha_hora is not None else '',
+        id_consumo
+    )
+
+def guardar_consumo(consumo):
+    guardar_consumos([consumo])
+    logger.debug("💾 Consumo guardado - Cliente: %s, Instancia: %s", consumo.nit_cliente, consumo.id_instancia)
+
+def _elementos_por_particion(consumos):
+    por_particion = {}
+    for consumo in consumos:
+        particion = mes_de_fecha(consumo.fecha_hora) or PARTICION_SIN_FECHA
+        por_particion.setdefault(particion, []).append(_consumo_a_elemento(consumo))
+    return por_particion
+
+def guardar_consumos(consumos):
+    """Anexa un lote de consumos a la partición de su mes, una escritura por partición"""
+    ensure_data_dir()
+    por_particion = _elementos_por_particion(consumos)
+    
+    # La partición entra al manifiesto antes de recibir registros: un lector
+    # que la vea aún vacía no pierde nada, uno que no la viera sí
+    _actualizar_manifiesto({p: 0 for p in por_particion})
+    for particion, elementos in por_particion.items():
+        _anexar_registros(os.path.join(CONSUMOS_LOG_DIR, particion), 'consumos', elementos)
     
-    indent(root)
-    tree.write(file_path, encoding='utf-8', xml_declaration=True)
-    print(f"💾 Consumo guardado - Cliente: {consumo.nit_cliente}, Instancia: {consumo.id_instancia}")
+    _actualizar_manifiesto({p: len(e) for p, e in por_particion.items()})
+    logger.debug("💾 Lote de consumos guardado: %s registros en %s particiones", len(consumos), len(por_particion))
+
+# ========== CARGAS DE CONSUMOS ==========
+# Un archivo subido se guarda todo o nada. Sus lotes se anexan a segmentos de
+# preparación en cargas_consumos/<carga>/<partición>/, fuera del log, así que
+# ningún lector los ve. Solo cuando el documento termina bien se confirman:
+# cada segmento preparado pasa al log de su partición (renombrado si es
+# grande, o anexado al último segmento si es pequeño). Si la carga falla se
+# descarta el directorio completo.
+
+# Segmentos preparados menores que esto se anexan en vez de sumar un archivo al log
+TAMANO_MIN_SEGMENTO_CARGA = 1024 * 1024
 
-def cargar_consumos():
+def iniciar_carga_consumos():
+    """Abre una carga de consumos y devuelve su ID"""
     ensure_data_dir()
-    file_path = os.path.join(DATA_DIR, 'consumos.xml')
+    carga_id = uuid.uuid4().hex
+    os.makedirs(os.path.join(CARGAS_CONSUMOS_DIR, carga_id))
+    return carga_id
+
+def agregar_a_carga_consumos(carga_id, consumos):
+    """Anexa un lote a la carga sin que sea visible todavía"""
+    for particion, elementos in _elementos_por_particion(consumos).items():
+        _anexar_registros(os.path.join(CARGAS_CONSUMOS_DIR, carga_id, particion), 'consumos', elementos)
+
+def confirmar_carga_consumos(carga_id):
+    """Pasa los consumos de la carga al log y devuelve cuántos quedaron guardados"""
+    directorio_carga = os.path.join(CARGAS_CONSUMOS_DIR, carga_id)
+    particiones = sorted(n for n in os.listdir(directorio_carga) if os.path.isdir(os.path.join(directorio_carga, n)))
     
-    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-        return []
+    _actualizar_manifiesto({p: 0 for p in particiones})
+    registros = {}
+    for particion in particiones:
+        destino = os.path.join(CONSUMOS_LOG_DIR, particion)
+        registros[particion] = 0
+        for preparado in _listar_segmentos(os.path.join(directorio_carga, particion)):
+            registros[particion] += _mover_segmento_preparado(preparado, destino)
+    _actualizar_manifiesto(registros)
     
-    try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        consumos = []
-        for elem in root.findall('consumo'):
-            consumos.append({
-                'nitCliente': elem.get('nitCliente'),
-                'idInstancia': elem.get('idInstancia'),
-                'tiempo': elem.find('tiempo').text if elem.find('tiempo') is not None else '0',
-                'fechahora': elem.find('fechahora').text if elem.find('fechahora') is not None else ''
-            })
+    shutil.rmtree(directorio_carga, ignore_errors=True)
+    total = sum(registros.values())
+    logger.debug("💾 Carga de consumos confirmada: %s registros en %s particiones", total, len(particiones))
+    return total
+
+def descartar_carga_consumos(carga_id):
+    shutil.rmtree(os.path.join(CARGAS_CONSUMOS_DIR, carga_id), ignore_errors=True)
+
+def _mover_segmento_preparado(preparado, destino):
+    """Pasa un segmento preparado al log de la partición y devuelve cuántos registros tenía"""
+    if os.path.getsize(preparado) < TAMANO_MIN_SEGMENTO_CARGA:
+        elementos = _leer_segmento(preparado, 'consumo')
+        _anexar_registros(destino, 'consumos', elementos)
+        return len(elementos)
+    
+    with open(preparado, 'rb') as f:
+        registros = sum(1 for linea in f if linea.startswith(b'<consumo '))
+    os.makedirs(destino, exist_ok=True)
+    with bloqueo_archivo(destino):
+        segmentos = _listar_segmentos(destino)
+        file_path = os.path.join(destino, f'segmento_{len(segmentos) + 1:06d}.xml')
+        os.replace(preparado, file_path)
+        invalidar_cache(file_path)
+    return registros
+
+# ========== MANIFIESTO DE PARTICIONES ==========
+# consumos/manifiesto.xml lista las particiones mensuales y cuántos registros
+# tiene cada una, para decidir qué particiones abrir sin recorrer directorios.
+
+def _parsear_manifiesto(file_path):
+    return {elem.get('mes'): int(elem.get('registros', '0')) for elem in ET.parse(file_path).getroot().findall('particion')}
+
+def cargar_manifiesto_consumos():
+    """Devuelve {particion: registros} ordenado por mes"""
+    if os.path.exists(CONSUMOS_MANIFIESTO):
+        try:
+            particiones = _leer_con_cache(CONSUMOS_MANIFIESTO, _parsear_manifiesto)
+        except Exception as e:
+            logger.error("🔴 ERROR cargando manifiesto de consumos: %s", e)
+            particiones = _particiones_en_disco()
+    else:
+        particiones = _particiones_en_disco()
+    return dict(sorted(particiones.items(), key=lambda p: (p[0] == PARTICION_SIN_FECHA, p[0])))
+
+def _particiones_en_disco():
+    if not os.path.isdir(CONSUMOS_LOG_DIR):
+        return {}
+    return {n: 0 for n in os.listdir(CONSUMOS_LOG_DIR) if os.path.isdir(os.path.join(CONSUMOS_LOG_DIR, n))}
+
+def _actualizar_manifiesto(nuevos_por_particion):
+    """Suma registros a cada partición, agregando las que falten; no reescribe si nada cambia"""
+    with bloqueo_archivo(CONSUMOS_MANIFIESTO):
+        particiones = dict(cargar_manifiesto_consumos())
+        if all(particion in particiones and not cantidad for particion, cantidad in nuevos_por_particion.items()):
+            return
+        for particion, cantidad in nuevos_por_particion.items():
+            particiones[particion] = particiones.get(particion, 0) + cantidad
         
-        print(f"🔍 CARGAR_CONSUMOS - {len(consumos)} consumos encontrados")
-        return consumos
+        root = ET.Element('manifiestoConsumos')
+        for particion, registros in sorted(particiones.items()):
+            elem = ET.SubElement(root, 'particion')
+            elem.set('mes', particion)
+            elem.set('registros', str(registros))
         
-    except Exception as e:
-        print(f"🔴 ERROR cargando consumos: {e}")
-        return []
+        indent(root)
+        _escribir_atomico(CONSUMOS_MANIFIESTO, ET.tostring(root, encoding='utf-8', xml_declaration=True))
+
+# El log solo crece, así que "<segmento>:<posición>" identifica cada consumo
+# de forma estable y sin guardar un contador aparte.
+def _parsear_consumos_archivo(file_path):
+    tree = ET.parse(file_path)
+    nombre = os.path.basename(file_path)
+    return [_elemento_a_consumo(elem, f"{nombre}:{i}") for i, elem in enumerate(tree.getroot().findall('consumo'))]
+
+def _parsear_segmento_consumos(file_path):
+    nombre = os.path.relpath(file_path, CONSUMOS_LOG_DIR).replace(os.sep, '/')
+    return [_elemento_a_consumo(elem, f"{nombre}:{i}") for i, elem in enumerate(_leer_segmento(file_path, 'consumo'))]
+
+def _particion_en_rango(particion, mes_inicio, mes_fin):
+    if particion == PARTICION_SIN_FECHA:
+        return False
+    return (mes_inicio is None or particion >= mes_inicio) and (mes_fin is None or particion <= mes_fin)
+
+def _archivos_consumos(fecha_inicio=None, fecha_fin=None):
+    """[(nombre, ruta, parsear)] de los archivos de consumos en orden, sin las particiones fuera del período"""
+    file_path = os.path.join(DATA_DIR, 'consumos.xml')
+    mes_inicio = mes_de_fecha(fecha_inicio) if fecha_inicio else None
+    mes_fin = mes_de_fecha(fecha_fin) if fecha_fin else None
+    
+    # Archivos sin partición: consumos.xml y segmentos anteriores a las particiones
+    archivos = []
+    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+        archivos.append(('consumos.xml', file_path, _parsear_consumos_archivo))
+    for segmento in _listar_segmentos(CONSUMOS_LOG_DIR):
+        archivos.append((os.path.basename(segmento), segmento, _parsear_segmento_consumos))
+    
+    # Particiones mensuales en orden cronológico
+    for particion in cargar_manifiesto_consumos():
+        if (fecha_inicio or fecha_fin) and not _particion_en_rango(particion, mes_inicio, mes_fin):
+            continue
+        for segmento in _listar_segmentos(os.path.join(CONSUMOS_LOG_DIR, particion)):
+            archivos.append((f'{particion}/{os.path.basename(segmento)}', segmento, _parsear_segmento_consumos))
+    return archivos
+
+def iterar_consumos(despues_de=None, fecha_inicio=None, fecha_fin=None, nit=None, instancia=None):
+    """
+    Recorre los consumos en orden de escritura sin armar la lista completa.
+    Con despues_de (el ID de un consumo) continúa justo después de ese consumo;
+    fecha_inicio/fecha_fin ('DD/MM/AAAA'), nit e instancia filtran los resultados.
+    """
+    ensure_data_dir()
+    archivos = _archivos_consumos(fecha_inicio, fecha_fin)
+    
+    # El ID "<archivo>:<posición>" dice en qué archivo y registro retomar
+    desde = 0
+    if despues_de is not None:
+        nombre, _, posicion = str(despues_de).rpartition(':')
+        nombres = [n for n, _, _ in archivos]
+        if nombre not in nombres or not posicion.isdigit():
+            return
+        archivos = archivos[nombres.index(nombre):]
+        desde = int(posicion) + 1
+    
+    marca_inicio = marca_fin = None
+    if fecha_inicio or fecha_fin:
+        marca_inicio, marca_fin = rango_marcas(fecha_inicio or '01/01/0001', fecha_fin or '31/12/9999')
+    
+    for _, archivo, parsear in archivos:
+        try:
+            consumos = _leer_con_cache(archivo, parsear)
+        except Exception as e:
+            logger.error("🔴 ERROR cargando %s: %s", os.path.basename(archivo), e)
+            continue
+        for consumo in consumos[desde:]:
+            if nit is not None and consumo.nit_cliente != nit:
+                continue
+            if instancia is not None and consumo.id_instancia != instancia:
+                continue
+            if marca_inicio is not None and not marca_inicio <= consumo.marca <= marca_fin:
+                continue
+            yield consumo
+        desde = 0
+
+def cargar_consumos(fecha_inicio=None, fecha_fin=None):
+    """
+    Carga los consumos. Con fecha_inicio/fecha_fin ('DD/MM/AAAA') solo abre las
+    particiones mensuales que se traslapan con el período y devuelve únicamente
+    los consumos dentro de él.
+    """
+    consumos = list(iterar_consumos(fecha_inicio=fecha_inicio, fecha_fin=fecha_fin))
+    logger.debug("🔍 CARGAR_CONSUMOS - %s consumos encontrados", len(consumos))
+    return consumos
+
+# ========== CONSUMOS FACTURADOS ==========
+def guardar_consumos_facturados(ids_consumo, numero_factura):
+    """Registra en el log qué factura cubrió cada consumo"""
+    guardar_consumos_facturados_por_factura({numero_factura: ids_consumo})
+
+def guardar_consumos_facturados_por_factura(ids_por_factura):
+    """Registra {numero_factura: [ids_consumo]} de varias facturas con un anexo por partición"""
+    ensure_data_dir()
+    _anexar_facturados(_elementos_facturados(ids_por_factura))
+
+def _elementos_facturados(ids_por_factura):
+    elementos = []
+    for numero_factura, ids_consumo in ids_por_factura.items():
+        for id_consumo in ids_consumo:
+            elem = ET.Element('facturado')
+            elem.set('consumo', id_consumo)
+            elem.set('factura', str(numero_factura))
+            elementos.append(elem)
+    return elementos
+
+# Los consumos facturados se parten por el mes del consumo, que ya viene en su
+# ID ("AAAA-MM/segmento_...:N"), para que una corrida lea solo los meses que
+# factura. Los IDs sin partición (consumos.xml y segmentos anteriores) y los
+# registros escritos antes de partir el log quedan en la raíz y se leen siempre.
+
+def _directorio_facturados(id_consumo):
+    particion, separador, _ = id_consumo.partition('/')
+    return os.path.join(FACTURADOS_LOG_DIR, particion) if separador else FACTURADOS_LOG_DIR
+
+def _anexar_facturados(elementos):
+    por_directorio = {}
+    for elem in elementos:
+        por_directorio.setdefault(_directorio_facturados(elem.get('consumo')), []).append(elem)
+    for directorio, elementos_directorio in por_directorio.items():
+        _anexar_registros(directorio, 'consumosFacturados', elementos_directorio)
+
+def _parsear_segmento_facturados(file_path):
+    return [(elem.get('consumo'), elem.get('factura')) for elem in _leer_segmento(file_path, 'facturado')]
+
+def cargar_consumos_facturados(fecha_inicio=None, fecha_fin=None):
+    """
+    Devuelve {id_consumo: numero_factura} de los consumos ya facturados. Con
+    fecha_inicio/fecha_fin ('DD/MM/AAAA') solo abre las particiones del período.
+    """
+    ensure_data_dir()
+    segmentos = _listar_segmentos(FACTURADOS_LOG_DIR)
+    if os.path.isdir(FACTURADOS_LOG_DIR):
+        mes_inicio = mes_de_fecha(fecha_inicio) if fecha_inicio else None
+        mes_fin = mes_de_fecha(fecha_fin) if fecha_fin else None
+        for particion in sorted(os.listdir(FACTURADOS_LOG_DIR)):
+            directorio = os.path.join(FACTURADOS_LOG_DIR, particion)
+            if not os.path.isdir(directorio):
+                continue
+            if (fecha_inicio or fecha_fin) and not _particion_en_rango(particion, mes_inicio, mes_fin):
+                continue
+            segmentos.extend(_listar_segmentos(directorio))
+    
+    facturados = {}
+    for segmento in segmentos:
+        try:
+            facturados.update(_leer_con_cache(segmento, _parsear_segmento_facturados))
+        except Exception as e:
+            logger.error("🔴 ERROR cargando segmento %s: %s", os.path.basename(segmento), e)
+    return facturados
 
 # ========== FUNCIONES PARA FACTURAS ==========
+# Las facturas se anexan a un log por segmentos (una por línea), igual que
+# los consumos, en lugar de reescribir facturas.xml completo. facturas.xml se
+# sigue leyendo para las facturas emitidas antes del cambio.
+#
+# El índice facturas_indice/ guarda por cada factura su NIT, el segmento y la
+# posición en bytes de su línea, así cargar_factura lee un solo registro.
+# Se anexa bajo el mismo candado que la factura. Si un corte deja facturas sin
+# indexar, las lecturas las toman directamente del log (sin candado ni
+# escrituras) hasta que el siguiente guardado las agrega al índice.
+
 def guardar_factura(factura):
+    guardar_facturas([factura])
+    logger.debug("💾 Factura guardada exitosamente: %s - Monto: Q%.2f", factura.numero_factura, factura.monto_total)
+    return True
+
+def guardar_facturas(facturas):
+    """Anexa varias facturas al log con una única escritura y actualiza el índice"""
     ensure_data_dir()
-    file_path = os.path.join(DATA_DIR, 'facturas.xml')
+    if not facturas:
+        return True
     
-    try:
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-            try:
-                tree = ET.parse(file_path)
-                root = tree.getroot()
-            except ET.ParseError:
-                # Si el archivo está corrupto, crear uno nuevo
-                root = ET.Element('facturas')
-                tree = ET.ElementTree(root)
-        else:
-            root = ET.Element('facturas')
-            tree = ET.ElementTree(root)
-    except Exception as e:
-        print(f"🔴 ERROR cargando facturas: {e}")
-        root = ET.Element('facturas')
-        tree = ET.ElementTree(root)
+    def indexar(file_path, ubicaciones):
+        # Con el candado del log tomado se indexa todo lo pendiente: las
+        # facturas nuevas y las que un corte anterior dejó sin índice
+        faltantes = _entradas_pendientes(_leer_indice())
+        if len(faltantes) > len(facturas):
+            logger.warning("⚠️ Índice de facturas incompleto, agregando %s entradas", len(faltantes) - len(facturas))
+        _anexar_registros(FACTURAS_INDICE_DIR, 'indiceFacturas', [_entrada_indice(*entrada) for entrada in faltantes])
+        _ponerse_al_dia_acumulados()
     
-    # Crear elemento factura
-    factura_elem = ET.SubElement(root, 'factura')
+    _anexar_registros(FACTURAS_LOG_DIR, 'facturas', [_factura_a_elemento(f) for f in facturas], al_anexar=indexar)
+    logger.debug("💾 Facturas guardadas: %s", len(facturas))
+    return True
+
+def _factura_a_elemento(factura):
+    factura_elem = ET.Element('factura')
     factura_elem.set('numero', str(factura.numero_factura))
     
     ET.SubElement(factura_elem, 'nitCliente').text = factura.nit_cliente
@@ -376,56 +876,419 @@ def guardar_factura(factura):
         ET.SubElement(detalle_elem, 'idInstancia').text = str(detalle['id_instancia'])
         ET.SubElement(detalle_elem, 'tiempoTotal').text = str(detalle['tiempo_total'])
         ET.SubElement(detalle_elem, 'monto').text = str(detalle['monto'])
+    return factura_elem
+
+def _elemento_a_factura(elem):
+    detalles = []
+    detalles_elem = elem.find('detalles')
+    if detalles_elem is not None:
+        for detalle in detalles_elem.findall('detalle'):
+            detalles.append({
+                'idInstancia': detalle.find('idInstancia').text if detalle.find('idInstancia') is not None else '',
+                'tiempoTotal': detalle.find('tiempoTotal').text if detalle.find('tiempoTotal') is not None else '0',
+                'monto': detalle.find('monto').text if detalle.find('monto') is not None else '0'
+            })
     
-    # Aplicar formato y guardar
-    indent(root)
-    
-    # Escribir con declaración XML correctamente
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        tree.write(f, encoding='unicode')
-    
-    print(f"💾 Factura guardada exitosamente: {factura.numero_factura} - Monto: Q{factura.monto_total:.2f}")
-    return True
+    return {
+        'numero': elem.get('numero'),
+        'nitCliente': elem.find('nitCliente').text if elem.find('nitCliente') is not None else '',
+        'fechaFactura': elem.find('fechaFactura').text if elem.find('fechaFactura') is not None else '',
+        'montoTotal': elem.find('montoTotal').text if elem.find('montoTotal') is not None else '0',
+        'detalles': detalles
+    }
 
-def cargar_facturas():
-    ensure_data_dir()
+def _parsear_facturas(file_path):
+    return [_elemento_a_factura(elem) for elem in ET.parse(file_path).getroot().findall('factura')]
+
+def _parsear_segmento_facturas(file_path):
+    return [_elemento_a_factura(elem) for elem in _leer_segmento(file_path, 'factura')]
+
+def _facturas_legado():
     file_path = os.path.join(DATA_DIR, 'facturas.xml')
-    
     if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
         return []
-    
+    return _leer_con_cache(file_path, _parsear_facturas)
+
+def cargar_facturas():
+    ensure_data_dir()
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
+        facturas = list(_facturas_legado())
+        for segmento in _listar_segmentos(FACTURAS_LOG_DIR):
+            facturas.extend(_leer_con_cache(segmento, _parsear_segmento_facturas))
         
-        facturas = []
-        for elem in root.findall('factura'):
-            detalles = []
-            detalles_elem = elem.find('detalles')
-            if detalles_elem is not None:
-                for detalle in detalles_elem.findall('detalle'):
-                    detalles.append({
-                        'idInstancia': detalle.find('idInstancia').text if detalle.find('idInstancia') is not None else '',
-                        'tiempoTotal': detalle.find('tiempoTotal').text if detalle.find('tiempoTotal') is not None else '0',
-                        'monto': detalle.find('monto').text if detalle.find('monto') is not None else '0'
-                    })
-            
-            facturas.append({
-                'numero': elem.get('numero'),
-                'nitCliente': elem.find('nitCliente').text if elem.find('nitCliente') is not None else '',
-                'fechaFactura': elem.find('fechaFactura').text if elem.find('fechaFactura') is not None else '',
-                'montoTotal': elem.find('montoTotal').text if elem.find('montoTotal') is not None else '0',
-                'detalles': detalles
-            })
-        
-        print(f"🔍 CARGAR_FACTURAS - {len(facturas)} facturas encontradas")
+        logger.debug("🔍 CARGAR_FACTURAS - %s facturas encontradas", len(facturas))
         return facturas
         
     except Exception as e:
-        print(f"🔴 ERROR cargando facturas: {e}")
+        logger.error("🔴 ERROR cargando facturas: %s", e)
         return []
 
+# ========== ÍNDICE DE FACTURAS ==========
+def _entrada_indice(numero, nit, file_path, posicion, longitud):
+    elem = ET.Element('entrada')
+    elem.set('numero', str(numero))
+    elem.set('nit', nit or '')
+    elem.set('segmento', os.path.basename(file_path))
+    elem.set('posicion', str(posicion))
+    elem.set('longitud', str(longitud))
+    return elem
+
+def _parsear_segmento_indice(file_path):
+    return [
+        (elem.get('numero'), elem.get('nit'), elem.get('segmento'), int(elem.get('posicion')), int(elem.get('longitud')))
+        for elem in _leer_segmento(file_path, 'entrada')
+    ]
+
+def _lineas_de_segmento(file_path, desde):
+    """Recorre las líneas completas del segmento a partir de un byte: (posición, longitud, elemento)"""
+    with open(file_path, 'rb') as f:
+        f.seek(desde)
+        posicion = desde
+        for linea in f:
+            longitud = len(linea.rstrip(b'\r\n'))
+            if linea.endswith(b'\n') and linea.startswith(b'<factura'):
+                try:
+                    yield posicion, longitud, ET.fromstring(linea[:longitud])
+                except ET.ParseError:
+                    pass
+            posicion += len(linea)
+
+def _fin_indexado(entradas):
+    fin = {}
+    for _, _, segmento, posicion, longitud in entradas:
+        fin[segmento] = max(fin.get(segmento, 0), posicion + longitud + 1)
+    return fin
+
+def _segmentos_pendientes(fin_por_segmento):
+    """[(segmento, byte desde el que falta procesar)] de los segmentos con facturas posteriores a fin_por_segmento"""
+    inicio = len(_encabezado_segmento('facturas'))
+    pie = _pie_segmento('facturas')
+    pendientes = []
+    for file_path in _listar_segmentos(FACTURAS_LOG_DIR):
+        desde = fin_por_segmento.get(os.path.basename(file_path), inicio)
+        if os.path.getsize(file_path) > desde + len(pie):
+            pendientes.append((file_path, desde))
+    return pendientes
+
+def _leer_indice():
+    entradas = []
+    for segmento in _listar_segmentos(FACTURAS_INDICE_DIR):
+        entradas.extend(_leer_con_cache(segmento, _parsear_segmento_indice))
+    return entradas
+
+def _entradas_pendientes(entradas):
+    """Entradas de las facturas completas del log que el índice aún no tiene; ignora una cola incompleta"""
+    pendientes = []
+    for file_path, desde in _segmentos_pendientes(_fin_indexado(entradas)):
+        for posicion, longitud, elem in _lineas_de_segmento(file_path, desde):
+            pendientes.append((elem.get('numero'), elem.findtext('nitCliente'), os.path.basename(file_path), posicion, longitud))
+    return pendientes
+
+def _cargar_indice_facturas():
+    """Devuelve ({numero: (segmento, posicion, longitud)}, {nit: [numeros]})"""
+    entradas = _leer_indice()
+    entradas.extend(_entradas_pendientes(entradas))
+    
+    por_numero = {}
+    por_nit = {}
+    for numero, nit, segmento, posicion, longitud in entradas:
+        if numero in por_numero:
+            continue  # ante números repetidos gana la primera factura
+        por_numero[numero] = (segmento, posicion, longitud)
+        por_nit.setdefault(nit, []).append(numero)
+    return por_numero, por_nit
+
+def _indexar_facturas(file_path):
+    """{numero: posición} de las facturas del archivo anterior al log"""
+    indice = {}
+    for posicion, factura in enumerate(_leer_con_cache(file_path, _parsear_facturas)):
+        indice.setdefault(factura['numero'], posicion)
+    return indice
+
+def cargar_factura(numero_factura):
+    """Devuelve una sola factura por su número leyendo solo su registro, o None si no existe"""
+    ensure_data_dir()
+    try:
+        legado = os.path.join(DATA_DIR, 'facturas.xml')
+        if os.path.exists(legado) and os.path.getsize(legado) > 0:
+            posicion = _leer_con_cache(legado, _indexar_facturas, vista='indice').get(numero_factura)
+            if posicion is not None:
+                return _facturas_legado()[posicion]
+        
+        ubicacion = _cargar_indice_facturas()[0].get(numero_factura)
+        if ubicacion is None:
+            return None
+        
+        segmento, posicion, longitud = ubicacion
+        with open(os.path.join(FACTURAS_LOG_DIR, segmento), 'rb') as f:
+            f.seek(posicion)
+            return _elemento_a_factura(ET.fromstring(f.read(longitud)))
+    except Exception as e:
+        logger.error("🔴 ERROR cargando factura %s: %s", numero_factura, e)
+        return None
+
+def cargar_numeros_factura(nit_cliente):
+    """Números de las facturas de un cliente, en orden de emisión"""
+    ensure_data_dir()
+    numeros = [f['numero'] for f in _facturas_legado() if f['nitCliente'] == nit_cliente]
+    return numeros + _cargar_indice_facturas()[1].get(nit_cliente, [])
+
+def iterar_facturas(despues_de=None, nit=None):
+    """
+    Recorre las facturas en orden de emisión leyendo cada una desde su posición
+    en el índice, sin parsear los segmentos completos. Devuelve pares
+    (posición, factura); con despues_de continúa tras esa posición y con nit
+    recorre solo las facturas de ese cliente.
+    """
+    ensure_data_dir()
+    desde = 0 if despues_de is None else int(despues_de) + 1
+    
+    legado = _facturas_legado()
+    if nit is not None:
+        legado = [f for f in legado if f['nitCliente'] == nit]
+    for posicion in range(desde, len(legado)):
+        yield posicion, legado[posicion]
+    
+    # El índice solo crece, así que la posición de cada factura no cambia entre páginas
+    por_numero, por_nit = _cargar_indice_facturas()
+    posicion = max(desde, len(legado))
+    if nit is None:
+        ubicaciones = islice(por_numero.values(), posicion - len(legado), None)
+    else:
+        ubicaciones = (por_numero[numero] for numero in por_nit.get(nit, [])[posicion - len(legado):])
+    
+    archivo, abierto = None, None
+    try:
+        for segmento, inicio, longitud in ubicaciones:
+            if segmento != abierto:
+                if archivo is not None:
+                    archivo.close()
+                archivo, abierto = open(os.path.join(FACTURAS_LOG_DIR, segmento), 'rb'), segmento
+            archivo.seek(inicio)
+            yield posicion, _elemento_a_factura(ET.fromstring(archivo.read(longitud)))
+            posicion += 1
+    finally:
+        if archivo is not None:
+            archivo.close()
+
+# ========== ACUMULADOS DE INGRESOS ==========
+# acumulados_ingresos.xml resume las facturas por día: cantidad, monto y horas
+# del día, y por cada instancia facturada ese día sus líneas, horas y monto.
+# Los reportes de ventas suman solo los días del rango pedido. El elemento
+# <cobertura> indica hasta qué byte de cada segmento ya está acumulado, así
+# que se mantiene igual que el índice: se pone al día al guardar facturas y,
+# si quedó atrás por un corte, las lecturas suman al vuelo lo que falta.
+
+def _nuevo_dia():
+    return {'facturas': 0, 'monto': 0.0, 'horas': 0.0, 'instancias': {}}
+
+def _acumular_factura(dias, factura):
+    dia = dias.setdefault(dia_de_fecha(factura['fechaFactura']), _nuevo_dia())
+    dia['facturas'] += 1
+    dia['monto'] += float(factura['montoTotal'])
+    for detalle in factura['detalles']:
+        horas = float(detalle['tiempoTotal'])
+        instancia = dia['instancias'].setdefault(detalle['idInstancia'], [0, 0.0, 0.0])
+        instancia[0] += 1
+        instancia[1] += horas
+        instancia[2] += float(detalle['monto'])
+        dia['horas'] += horas
+
+def _parsear_acumulados(file_path):
+    """Devuelve (cobertura {segmento: byte}, {dia: acumulado}, dias ordenados)"""
+    root = ET.parse(file_path).getroot()
+    cobertura = {elem.get('segmento'): int(elem.get('hasta')) for elem in root.findall('cobertura')}
+    dias = {}
+    for elem in root.findall('dia'):
+        dia = _nuevo_dia()
+        dia['facturas'] = int(elem.get('facturas'))
+        dia['monto'] = float(elem.get('monto'))
+        dia['horas'] = float(elem.get('horas'))
+        for inst in elem.findall('instancia'):
+            dia['instancias'][inst.get('id')] = [int(inst.get('lineas')), float(inst.get('horas')), float(inst.get('monto'))]
+        dias[int(elem.get('fecha'))] = dia
+    return cobertura, dias, sorted(dias)
+
+def _leer_acumulados():
+    if not os.path.exists(ACUMULADOS_FILE):
+        return {}, {}, []
+    return _leer_con_cache(ACUMULADOS_FILE, _parsear_acumulados)
+
+def _ponerse_al_dia_acumulados():
+    """Acumula las facturas del log que aún no lo están; quien llama tiene el candado del log"""
+    with bloqueo_archivo(ACUMULADOS_FILE):
+        # Se parsea de nuevo (no desde la caché) porque el resultado se modifica
+        cobertura, dias, _ = _parsear_acumulados(ACUMULADOS_FILE) if os.path.exists(ACUMULADOS_FILE) else ({}, {}, [])
+        pendientes = _segmentos_pendientes(cobertura)
+        if not pendientes:
+            return
+        
+        for file_path, desde in pendientes:
+            for posicion, longitud, elem in _lineas_de_segmento(file_path, desde):
+                _acumular_factura(dias, _elemento_a_factura(elem))
+                cobertura[os.path.basename(file_path)] = posicion + longitud + 1
+        
+        root = ET.Element('acumuladosIngresos')
+        for segmento, hasta in sorted(cobertura.items()):
+            elem = ET.SubElement(root, 'cobertura')
+            elem.set('segmento', segmento)
+            elem.set('hasta', str(hasta))
+        for fecha in sorted(dias):
+            dia = dias[fecha]
+            dia_elem = ET.SubElement(root, 'dia')
+            dia_elem.set('fecha', str(fecha))
+            dia_elem.set('facturas', str(dia['facturas']))
+            dia_elem.set('monto', repr(dia['monto']))
+            dia_elem.set('horas', repr(dia['horas']))
+            for id_instancia, (lineas, horas, monto) in dia['instancias'].items():
+                inst_elem = ET.SubElement(dia_elem, 'instancia')
+                inst_elem.set('id', id_instancia)
+                inst_elem.set('lineas', str(lineas))
+                inst_elem.set('horas', repr(horas))
+                inst_elem.set('monto', repr(monto))
+        
+        indent(root)
+        _escribir_atomico(ACUMULADOS_FILE, ET.tostring(root, encoding='utf-8', xml_declaration=True))
+
+def cargar_acumulados_ingresos(fecha_inicio=None, fecha_fin=None):
+    """
+    Suma los acumulados de los días entre fecha_inicio y fecha_fin ('DD/MM/AAAA',
+    inclusivas; sin fechas, todos). Devuelve {'facturas', 'monto', 'horas',
+    'instancias': {id_instancia: {'lineas', 'horas', 'monto'}}}.
+    """
+    ensure_data_dir()
+    cobertura, dias, orden = _leer_acumulados()
+    
+    # Se acumulan al vuelo las facturas de facturas.xml (anteriores al log) y
+    # las del log que los acumulados aún no cubren
+    sueltas = list(_facturas_legado())
+    for file_path, desde in _segmentos_pendientes(cobertura):
+        sueltas.extend(_elemento_a_factura(elem) for _, _, elem in _lineas_de_segmento(file_path, desde))
+    
+    if fecha_inicio or fecha_fin:
+        desde = dia_de_fecha(fecha_inicio) if fecha_inicio else 1
+        hasta = dia_de_fecha(fecha_fin) if fecha_fin else 99999999
+        en_rango = orden[bisect.bisect_left(orden, desde):bisect.bisect_right(orden, hasta)]
+        sueltas = [f for f in sueltas if desde <= dia_de_fecha(f['fechaFactura']) <= hasta]
+    else:
+        en_rango = orden
+    
+    resultado = {'facturas': 0, 'monto': 0.0, 'horas': 0.0, 'instancias': {}}
+    dias_sueltas = {}
+    for factura in sueltas:
+        _acumular_factura(dias_sueltas, factura)
+    
+    for dia in [dias[fecha] for fecha in en_rango] + list(dias_sueltas.values()):
+        resultado['facturas'] += dia['facturas']
+        resultado['monto'] += dia['monto']
+        resultado['horas'] += dia['horas']
+        for id_instancia, (lineas, horas, monto) in dia['instancias'].items():
+            acumulado = resultado['instancias'].setdefault(id_instancia, {'lineas': 0, 'horas': 0.0, 'monto': 0.0})
+            acumulado['lineas'] += lineas
+            acumulado['horas'] += horas
+            acumulado['monto'] += monto
+    return resultado
+
+# ========== CORRIDA DE FACTURACIÓN ==========
+# Las facturas y sus consumos facturados van a logs distintos, así que no se
+# pueden escribir de una vez. Antes de escribirlos se deja todo en
+# facturacion_pendiente.xml; si un corte ocurre entre las dos escrituras, la
+# siguiente corrida lo encuentra al tomar el candado y completa lo que falte.
+# Volver a anexar un consumo facturado ya registrado no cambia nada.
+
+@contextmanager
+def bloqueo_facturacion():
+    """Candado exclusivo entre procesos para toda una corrida de facturación"""
+    ensure_data_dir()
+    with bloqueo_archivo(os.path.join(DATA_DIR, 'facturacion')):
+        _completar_facturacion_pendiente()
+        yield
+
+def guardar_facturacion(facturas, ids_por_factura):
+    """Guarda las facturas y sus consumos facturados; se recupera de un corte entre ambas escrituras"""
+    ensure_data_dir()
+    if not facturas:
+        return True
+    
+    pendiente = ET.Element('facturacionPendiente')
+    for factura in facturas:
+        pendiente.append(_factura_a_elemento(factura))
+    for elem in _elementos_facturados(ids_por_factura):
+        pendiente.append(elem)
+    _escribir_atomico(FACTURACION_PENDIENTE, ET.tostring(pendiente, encoding='utf-8', xml_declaration=True))
+    
+    guardar_facturas(facturas)
+    guardar_consumos_facturados_por_factura(ids_por_factura)
+    os.remove(FACTURACION_PENDIENTE)
+    return True
+
+def _completar_facturacion_pendiente():
+    if not os.path.exists(FACTURACION_PENDIENTE):
+        return
+    try:
+        raiz = ET.parse(FACTURACION_PENDIENTE).getroot()
+    except ET.ParseError:
+        # _escribir_atomico no deja archivos a medias: uno ilegible no es de esta corrida
+        _parsear_para_modificar(FACTURACION_PENDIENTE, 'facturacionPendiente')
+        return
+    
+    facturas = [Factura.desde_dict(_elemento_a_factura(elem)) for elem in raiz.findall('factura')]
+    faltantes = [f for f in facturas if cargar_factura(f.numero_factura) is None]
+    facturados = raiz.findall('facturado')
+    logger.warning("⚠️ Completando facturación interrumpida: %s facturas y %s consumos facturados", len(faltantes), len(facturados))
+    guardar_facturas(faltantes)
+    _anexar_facturados(facturados)
+    os.remove(FACTURACION_PENDIENTE)
+
+# ========== SECUENCIAS ==========
+# Contadores persistentes (p. ej. el número de factura). Se reservan en bloque
+# bajo el candado del archivo, así que dos procesos nunca reciben el mismo valor.
+# No se reinician con reset_database para que un número nunca se reutilice.
+
+def reservar_secuencia(nombre, cantidad=1):
+    """Reserva `cantidad` valores consecutivos y devuelve el primero"""
+    ensure_data_dir()
+    with bloqueo_archivo(SECUENCIAS_FILE):
+        root = _parsear_para_modificar(SECUENCIAS_FILE, 'secuencias').getroot()
+        elem = next((e for e in root.findall('secuencia') if e.get('nombre') == nombre), None)
+        if elem is None:
+            elem = ET.SubElement(root, 'secuencia')
+            elem.set('nombre', nombre)
+            elem.set('ultimo', '0')
+        
+        primero = int(elem.get('ultimo', '0')) + 1
+        elem.set('ultimo', str(primero + cantidad - 1))
+        
+        indent(root)
+        _escribir_atomico(SECUENCIAS_FILE, ET.tostring(root, encoding='utf-8', xml_declaration=True))
+    return primero
+
+# ========== VERSIÓN DE LOS DATOS ==========
+def _archivos_de_tabla(tabla):
+    if tabla == 'consumos':
+        archivos = [os.path.join(DATA_DIR, 'consumos.xml'), CONSUMOS_MANIFIESTO] + _listar_segmentos(CONSUMOS_LOG_DIR)
+        for particion in cargar_manifiesto_consumos():
+            archivos += _listar_segmentos(os.path.join(CONSUMOS_LOG_DIR, particion))
+        return archivos
+    if tabla == 'consumos_facturados':
+        return _listar_segmentos(FACTURADOS_LOG_DIR)
+    if tabla == 'facturas':
+        return [os.path.join(DATA_DIR, 'facturas.xml')] + _listar_segmentos(FACTURAS_LOG_DIR)
+    if tabla == 'acumulados_ingresos':
+        return [ACUMULADOS_FILE]
+    return [os.path.join(DATA_DIR, f'{tabla}.xml')]
+
+def version_datos(*tablas):
+    """Texto que cambia cada vez que cambia alguna de las tablas indicadas"""
+    firmas = []
+    for tabla in tablas:
+        for file_path in _archivos_de_tabla(tabla):
+            try:
+                firmas.append(f'{os.path.basename(file_path)}:{_firma_archivo(file_path)}')
+            except FileNotFoundError:
+                firmas.append(f'{os.path.basename(file_path)}:-')
+    return '|'.join(firmas)
+
 # ========== FUNCIÓN GENERAL PARA CONSULTAS ==========
 def cargar_datos(tipo, subtipo=None):
     """Función general para compatibilidad con el código existente"""
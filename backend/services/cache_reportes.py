@@ -0,0 +1,82 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import config
+from utils import metricas
+
+logger = logging.getLogger(__name__)
+
+# Segundos tras los cuales un temporal huérfano se considera abandonado
+ANTIGUEDAD_TEMPORALES = 3600
+
+# ========== CACHÉ DE REPORTES PDF ==========
+# Cada PDF se guarda con un nombre derivado del tipo de reporte, sus
+# parámetros y la versión de los datos que leyó. Si nada cambió, la misma
+# clave apunta al mismo archivo y no hace falta volver a renderizarlo.
+# Un acierto actualiza la fecha de modificación del archivo, que es lo que
+# usa el desalojo LRU cuando el directorio supera REPORTES_CACHE_MAX_BYTES.
+
+def buscar(prefijo, parametros, version):
+    """Devuelve (ruta, en_cache) del PDF que corresponde a la clave"""
+    contenido = json.dumps([prefijo, parametros, version], sort_keys=True, ensure_ascii=False)
+    huella = hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:16]
+    filepath = os.path.join(config.REPORTES_CACHE_DIR, f'{_nombre_seguro(prefijo)}_{huella}.pdf')
+
+    if os.path.exists(filepath):
+        try:
+            os.utime(filepath)
+            logger.debug("📄 Reporte en caché: %s", os.path.basename(filepath))
+            metricas.contar('ipc2_reportes_cache_total', resultado='acierto')
+            return filepath, True
+        except FileNotFoundError:
+            pass  # otro proceso lo desalojó justo ahora
+    metricas.contar('ipc2_reportes_cache_total', resultado='fallo')
+    return filepath, False
+
+def ruta_temporal(filepath):
+    """Ruta donde renderizar antes de publicar el PDF con registrar()"""
+    os.makedirs(config.REPORTES_CACHE_DIR, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=config.REPORTES_CACHE_DIR, prefix='.', suffix='.tmp')
+    os.close(descriptor)
+    return temporal
+
+def registrar(temporal, filepath):
+    """Publica el PDF renderizado de una vez y aplica el límite de tamaño"""
+    os.replace(temporal, filepath)
+    desalojar(conservar=filepath)
+    return filepath
+
+def desalojar(conservar=None):
+    """Borra los PDF usados hace más tiempo hasta quedar bajo el límite"""
+    entradas = []
+    limite_temporales = time.time() - ANTIGUEDAD_TEMPORALES
+    for nombre in os.listdir(config.REPORTES_CACHE_DIR):
+        file_path = os.path.join(config.REPORTES_CACHE_DIR, nombre)
+        try:
+            estado = os.stat(file_path)
+            # Temporales de renders que fallaron a medias
+            if nombre.endswith('.tmp') and estado.st_mtime < limite_temporales:
+                os.remove(file_path)
+        except FileNotFoundError:
+            continue
+        if nombre.endswith('.pdf'):
+            entradas.append((estado.st_mtime_ns, estado.st_size, file_path))
+
+    total = sum(tamano for _, tamano, _ in entradas)
+    for _, tamano, file_path in sorted(entradas):
+        if total <= config.REPORTES_CACHE_MAX_BYTES:
+            break
+        if file_path == conservar:
+            continue
+        try:
+            os.remove(file_path)
+            logger.debug("🗑️ Reporte desalojado de la caché: %s", os.path.basename(file_path))
+        except FileNotFoundError:
+            pass
+        total -= tamano
+
+def _nombre_seguro(texto):
+    return ''.join(c if c.isalnum() or c in '-_' else '-' for c in str(texto))
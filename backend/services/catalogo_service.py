@@ -0,0 +1,98 @@
+import logging
+from database.storage import cargar_recursos, cargar_categorias, cargar_clientes
+
+logger = logging.getLogger(__name__)
+
+class CatalogoPrecios:
+    """
+    Índices en memoria para resolver instancia -> configuración -> recursos -> precio.
+    Se construye una sola vez a partir de los datos cargados y lo comparten
+    la facturación y los reportes. Todos los IDs se normalizan a str sin espacios.
+    """
+    def __init__(self, clientes, categorias, recursos):
+        self.clientes = {}
+        self.instancias = {}
+        self.config_por_instancia = {}
+        self.recursos = {}
+        self.configuraciones = {}
+        self.categoria_por_configuracion = {}
+        self.recursos_por_configuracion = {}
+        self.tarifas_por_configuracion = {}
+
+        # Ante IDs repetidos gana el primero, igual que en la búsqueda lineal
+        for recurso in recursos:
+            self.recursos.setdefault(_clave(recurso['id']), recurso)
+
+        for cliente in clientes:
+            self.clientes.setdefault(cliente['nit'], cliente)
+            for instancia in cliente.get('instancias', []):
+                id_instancia = _clave(instancia['id'])
+                if id_instancia not in self.instancias:
+                    self.instancias[id_instancia] = instancia
+                    self.config_por_instancia[id_instancia] = _clave(instancia['idConfiguracion'])
+
+        for categoria in categorias:
+            for config in categoria.get('configuraciones', []):
+                id_config = _clave(config['id'])
+                if id_config in self.configuraciones:
+                    continue
+                self.configuraciones[id_config] = config
+                self.categoria_por_configuracion[id_config] = categoria
+
+                # (recurso, cantidad, valor por hora) de cada recurso existente
+                recursos_config = []
+                tarifas = []
+                for recurso_id, cantidad in config.get('recursos', {}).items():
+                    recurso_info = self.recursos.get(_clave(recurso_id))
+                    if recurso_info is None:
+                        logger.warning("⚠️ Recurso %s de la configuración %s no existe", recurso_id, id_config)
+                        continue
+                    try:
+                        valor_hora = float(recurso_info['valor_x_hora'])
+                        cant = float(cantidad)
+                    except (ValueError, TypeError) as e:
+                        logger.error("✗ Error leyendo recurso %s de la configuración %s: %s", recurso_id, id_config, e)
+                        continue
+                    recursos_config.append((recurso_info, cant, valor_hora))
+                    tarifas.append(valor_hora * cant)
+
+                self.recursos_por_configuracion[id_config] = recursos_config
+                self.tarifas_por_configuracion[id_config] = tarifas
+
+    def configuracion_de_instancia(self, id_instancia):
+        return self.config_por_instancia.get(_clave(id_instancia))
+
+    def tarifas_instancia(self, id_instancia):
+        """Costo por hora de cada recurso de la instancia, o None si no se puede resolver"""
+        id_config = self.configuracion_de_instancia(id_instancia)
+        if id_config is None:
+            return None
+        return self.tarifas_por_configuracion.get(id_config)
+
+    def costo(self, id_config, horas):
+        """Suma recurso por recurso valor_x_hora * cantidad * horas, en el orden de la configuración"""
+        # Multiplicar la suma de tarifas por las horas redondea distinto y puede
+        # mover un centavo el monto; así se reproduce el cálculo de siempre
+        costo = 0
+        for tarifa in self.tarifas_por_configuracion[id_config]:
+            costo += tarifa * horas
+        return costo
+
+def _clave(valor):
+    return str(valor).strip()
+
+# El catálogo se reconstruye solo si alguna de las listas cargadas cambió;
+# con la caché de lectura, datos sin cambios devuelven las mismas listas.
+_catalogo_actual = None
+_fuentes_catalogo = None
+
+def obtener_catalogo():
+    global _catalogo_actual, _fuentes_catalogo
+
+    fuentes = (cargar_clientes(), cargar_categorias(), cargar_recursos())
+    if _fuentes_catalogo is not None and all(a is b for a, b in zip(fuentes, _fuentes_catalogo)):
+        return _catalogo_actual
+
+    catalogo = CatalogoPrecios(*fuentes)
+    _catalogo_actual, _fuentes_catalogo = catalogo, fuentes
+    return catalogo
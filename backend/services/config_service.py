@@ -1,29 +1,35 @@
-from database.xml_storage import guardar_recurso, guardar_categoria, guardar_cliente, cargar_datos
-from database.models import Recurso, Configuracion, Categoria, Cliente, Instancia
-from utils.xml_parser import parsear_xml_configuracion
-from database.xml_storage import guardar_recurso, guardar_categoria, guardar_cliente, cargar_recursos, cargar_categorias, cargar_clientes
+import logging
+from database.storage import guardar_recursos, guardar_categorias, guardar_clientes, cargar_huellas
+from utils.xml_parser import parsear_xml_configuracion, iterar_xml_configuracion
 from utils.validators import validar_nit, extraer_fecha
+import xml.etree.ElementTree as ET
+import time
+from utils import metricas
+
+logger = logging.getLogger(__name__)
+
+# Entidades de cada tipo que se acumulan antes de escribirlas
+TAMANO_LOTE_CONFIGURACION = 5000
+
+TIPOS_CONFIGURACION = ('recurso', 'categoria', 'cliente')
+
+# Atributo que identifica a cada tipo de entidad (el mismo que usa el almacenamiento)
+ATRIBUTO_CLAVE = {'recurso': 'id_recurso', 'categoria': 'id_categoria', 'cliente': 'nit'}
 
 def procesar_configuracion(xml_data):
     try:
-        # Cargar datos existentes desde los archivos separados
-        recursos_existentes = cargar_recursos()
-        categorias_existentes = cargar_categorias()
-        clientes_existentes = cargar_clientes()
+        # Huellas de lo ya guardado: bastan para saber qué cambió
+        with metricas.medir('configuracion', 'carga'):
+            huellas = {tipo: _cargar_huellas(tipo) for tipo in TIPOS_CONFIGURACION}
         
-        print(f"🔍 EXISTENTES - Recursos: {len(recursos_existentes)}, Categorías: {len(categorias_existentes)}, Clientes: {len(clientes_existentes)}")
+        logger.debug("🔍 EXISTENTES - Recursos: %s, Categorías: %s, Clientes: %s", len(huellas['recurso']), len(huellas['categoria']), len(huellas['cliente']))
         
         # Parsear el nuevo XML
-        recursos_nuevos, categorias_nuevas, clientes_nuevos = parsear_xml_configuracion(xml_data)
-        
-        print(f"🔍 NUEVOS - Recursos: {len(recursos_nuevos)}, Categorías: {len(categorias_nuevas)}, Clientes: {len(clientes_nuevos)}")
+        with metricas.medir('configuracion', 'parseo'):
+            recursos_nuevos, categorias_nuevas, clientes_nuevos = parsear_xml_configuracion(xml_data)
         
-        # Combinar datos (usar la función combinar_datos que ya tienes)
-        recursos_combinados = combinar_datos(recursos_existentes, recursos_nuevos, 'recurso')
-        categorias_combinadas = combinar_datos(categorias_existentes, categorias_nuevas, 'categoria')
-        clientes_combinados = combinar_datos(clientes_existentes, clientes_nuevos, 'cliente')
+        logger.debug("🔍 NUEVOS - Recursos: %s, Categorías: %s, Clientes: %s", len(recursos_nuevos), len(categorias_nuevas), len(clientes_nuevos))
         
-        # CUARTO: Guardar los datos COMBINADOS
         resultados = {
             'recursos_creados': len(recursos_nuevos),
             'categorias_creadas': len(categorias_nuevas),
@@ -31,164 +37,165 @@ def procesar_configuracion(xml_data):
             'instancias_creadas': sum(len(cliente.instancias) for cliente in clientes_nuevos),
             'errores': []
         }
-
-        # Guardar todos los recursos combinados
-        for recurso in recursos_combinados:
-            try:
-                guardar_recurso(recurso)
-                print(f"✅ Recurso guardado: {recurso.nombre} (ID: {recurso.id_recurso})")
-            except Exception as e:
-                resultados['errores'].append(f"Error guardando recurso {recurso.id_recurso}: {str(e)}")
         
-        # Guardar todas las categorías combinadas
-        for categoria in categorias_combinadas:
-            try:
-                guardar_categoria(categoria)
-                print(f"✅ Categoría guardada: {categoria.nombre} (ID: {categoria.id_categoria})")
-            except Exception as e:
-                resultados['errores'].append(f"Error guardando categoria {categoria.id_categoria}: {str(e)}")
-        
-        # Guardar todos los clientes combinados
-        for cliente in clientes_combinados:
+        # Los clientes se validan y normalizan antes de compararlos con lo guardado
+        clientes_validos = []
+        for cliente in clientes_nuevos:
             try:
                 if not validar_nit(cliente.nit):
                     resultados['errores'].append(f"NIT inválido: {cliente.nit}")
                     continue
-                
-                for instancia in cliente.instancias:
-                    instancia.fecha_inicio = extraer_fecha(instancia.fecha_inicio)
-                    if instancia.fecha_final:
-                        instancia.fecha_final = extraer_fecha(instancia.fecha_final)
-                
-                guardar_cliente(cliente)
-                print(f"✅ Cliente guardado: {cliente.nombre} (NIT: {cliente.nit})")
+                _normalizar_fechas(cliente)
+                clientes_validos.append(cliente)
             except Exception as e:
                 resultados['errores'].append(f"Error guardando cliente {cliente.nit}: {str(e)}")
         
-        print(f"🎯 RESULTADO FINAL - Recursos totales: {len(recursos_combinados)}, Categorías totales: {len(categorias_combinadas)}, Clientes totales: {len(clientes_combinados)}")
+        with metricas.medir('configuracion', 'calculo'):
+            diferencias = {
+                'recurso': combinar_datos(huellas['recurso'], recursos_nuevos, 'recurso'),
+                'categoria': combinar_datos(huellas['categoria'], categorias_nuevas, 'categoria'),
+                'cliente': combinar_datos(huellas['cliente'], clientes_validos, 'cliente')
+            }
+        
+        # Solo se escribe lo agregado o actualizado (una escritura por tipo)
+        guardar = {'recurso': guardar_recursos, 'categoria': guardar_categorias, 'cliente': guardar_clientes}
+        for tipo in TIPOS_CONFIGURACION:
+            cambios = diferencias[tipo]['agregados'] + diferencias[tipo]['actualizados']
+            if not cambios:
+                continue
+            try:
+                with metricas.medir('configuracion', 'escritura'):
+                    guardar[tipo](cambios)
+                metricas.contar('ipc2_registros_total', len(cambios), operacion='configuracion', tipo=tipo)
+            except Exception as e:
+                resultados['errores'].append(f"Error guardando {tipo}s: {str(e)}")
+        
+        resultados['diferencias'] = {tipo: _resumen(diferencias[tipo]) for tipo in TIPOS_CONFIGURACION}
+        logger.info("🎯 RESULTADO FINAL - Recursos totales: %s, Categorías totales: %s, Clientes totales: %s",
+                    *(len(huellas[tipo]) + len(diferencias[tipo]['agregados']) for tipo in TIPOS_CONFIGURACION))
+        logger.info("🔁 Diferencias: %s", resultados['diferencias'])
         
         return resultados
         
     except Exception as e:
-        print(f"ERROR en procesar_configuracion: {str(e)}")
+        logger.error("ERROR en procesar_configuracion: %s", str(e))
         return {'error': f"Error procesando configuración: {str(e)}"}
 
-def combinar_datos(datos_existentes, datos_nuevos, tipo_dato):
-    """Combina datos existentes con nuevos datos, evitando duplicados"""
-    combinados = []
+def procesar_configuracion_stream(fuente, tamano_lote=TAMANO_LOTE_CONFIGURACION):
+    """
+    Igual que procesar_configuracion, pero lee el XML de un flujo binario y
+    guarda las entidades en lotes acotados. Cada entidad se compara por su
+    huella con lo ya guardado y solo se escriben las agregadas o actualizadas.
+    """
+    resultados = {
+        'recursos_creados': 0,
+        'categorias_creadas': 0,
+        'clientes_creados': 0,
+        'instancias_creadas': 0,
+        'errores': []
+    }
+    contadores = {'recurso': 'recursos_creados', 'categoria': 'categorias_creadas', 'cliente': 'clientes_creados'}
+    guardar = {'recurso': guardar_recursos, 'categoria': guardar_categorias, 'cliente': guardar_clientes}
+    lotes = {'recurso': [], 'categoria': [], 'cliente': []}
+    diferencias = {tipo: {'agregados': 0, 'actualizados': 0, 'sin_cambios': 0} for tipo in TIPOS_CONFIGURACION}
     
-    # Convertir datos existentes a objetos del tipo correcto
-    if tipo_dato == 'recurso':
-        # Agregar recursos existentes
-        for dato in datos_existentes:
-            if dato.get('tipo') == 'recurso':
-                recurso = Recurso(
-                    id_recurso=int(dato['id']),
-                    nombre=dato['nombre'],
-                    abreviatura=dato['abreviatura'],
-                    metrica=dato['metrica'],
-                    tipo=dato['tipo_recurso'],
-                    valor_x_hora=float(dato['valor_x_hora'])
-                )
-                combinados.append(recurso)
-        
-        # Agregar recursos nuevos (sobrescribiendo si hay mismo ID)
-        for nuevo in datos_nuevos:
-            # Buscar si ya existe un recurso con el mismo ID
-            existe = False
-            for i, existente in enumerate(combinados):
-                if existente.id_recurso == nuevo.id_recurso:
-                    combinados[i] = nuevo  # Reemplazar el existente
-                    existe = True
-                    print(f"🔄 Actualizando recurso existente ID: {nuevo.id_recurso}")
-                    break
-            
-            if not existe:
-                combinados.append(nuevo)
-                print(f"✅ Agregando nuevo recurso ID: {nuevo.id_recurso}")
+    inicio = time.perf_counter()
+    with metricas.medir('configuracion', 'carga'):
+        huellas = {tipo: _cargar_huellas(tipo) for tipo in TIPOS_CONFIGURACION}
     
-    elif tipo_dato == 'categoria':
-        # Lógica similar para categorías
-        for dato in datos_existentes:
-            if dato.get('tipo') == 'categoria':
-                # Convertir datos de categoría existente a objeto Categoria
-                configuraciones = []
-                for config_data in dato.get('configuraciones', []):
-                    recursos_config = {}
-                    for recurso_id, cantidad in config_data.get('recursos', {}).items():
-                        recursos_config[int(recurso_id)] = float(cantidad)
-                    
-                    config = Configuracion(
-                        id_configuracion=int(config_data['id']),
-                        nombre=config_data['nombre'],
-                        descripcion=config_data['descripcion'],
-                        recursos=recursos_config
-                    )
-                    configuraciones.append(config)
-                
-                categoria = Categoria(
-                    id_categoria=int(dato['id']),
-                    nombre=dato['nombre'],
-                    descripcion=dato['descripcion'],
-                    carga_trabajo=dato['carga_trabajo'],
-                    configuraciones=configuraciones
-                )
-                combinados.append(categoria)
-        
-        # Agregar categorías nuevas
-        for nuevo in datos_nuevos:
-            existe = False
-            for i, existente in enumerate(combinados):
-                if existente.id_categoria == nuevo.id_categoria:
-                    combinados[i] = nuevo
-                    existe = True
-                    print(f"🔄 Actualizando categoría existente ID: {nuevo.id_categoria}")
-                    break
-            
-            if not existe:
-                combinados.append(nuevo)
-                print(f"✅ Agregando nueva categoría ID: {nuevo.id_categoria}")
+    def guardar_lote(tipo):
+        try:
+            with metricas.medir('configuracion', 'escritura'):
+                guardar[tipo](lotes[tipo])
+            metricas.contar('ipc2_registros_total', len(lotes[tipo]), operacion='configuracion', tipo=tipo)
+        except Exception as e:
+            resultados['errores'].append(f"Error guardando {tipo}s: {str(e)}")
+        lotes[tipo] = []
     
-    elif tipo_dato == 'cliente':
-        # Lógica similar para clientes
-        for dato in datos_existentes:
-            if dato.get('tipo') == 'cliente':
-                # Convertir datos de cliente existente a objeto Cliente
-                instancias = []
-                for inst_data in dato.get('instancias', []):
-                    instancia = Instancia(
-                        id_instancia=int(inst_data['id']),
-                        id_configuracion=int(inst_data['idConfiguracion']),
-                        nombre=inst_data['nombre'],
-                        fecha_inicio=inst_data['fechaInicio'],
-                        estado=inst_data['estado'],
-                        fecha_final=inst_data.get('fechaFinal')
-                    )
-                    instancias.append(instancia)
-                
-                cliente = Cliente(
-                    nit=dato['nit'],
-                    nombre=dato['nombre'],
-                    usuario=dato['usuario'],
-                    clave=dato.get('clave', ''),
-                    direccion=dato.get('direccion', ''),
-                    correo=dato.get('correo', ''),
-                    instancias=instancias
-                )
-                combinados.append(cliente)
-        
-        # Agregar clientes nuevos
-        for nuevo in datos_nuevos:
-            existe = False
-            for i, existente in enumerate(combinados):
-                if existente.nit == nuevo.nit:
-                    combinados[i] = nuevo
-                    existe = True
-                    print(f"🔄 Actualizando cliente existente NIT: {nuevo.nit}")
-                    break
+    try:
+        for tipo, entidad in iterar_xml_configuracion(fuente):
+            resultados[contadores[tipo]] += 1
             
-            if not existe:
-                combinados.append(nuevo)
-                print(f"✅ Agregando nuevo cliente NIT: {nuevo.nit}")
+            if tipo == 'cliente':
+                resultados['instancias_creadas'] += len(entidad.instancias)
+                if not validar_nit(entidad.nit):
+                    resultados['errores'].append(f"NIT inválido: {entidad.nit}")
+                    continue
+                _normalizar_fechas(entidad)
+            
+            cambio = _clasificar(huellas[tipo], entidad, tipo)
+            diferencias[tipo][cambio] += 1
+            if cambio == 'sin_cambios':
+                continue
+            
+            lotes[tipo].append(entidad)
+            if len(lotes[tipo]) >= tamano_lote:
+                guardar_lote(tipo)
+    except ET.ParseError as e:
+        logger.error("ERROR parseando XML: %s", e)
+        resultados['errores'].append(f"XML inválido: {str(e)}")
     
-    return combinados
\ No newline at end of file
+    for tipo in lotes:
+        if lotes[tipo]:
+            guardar_lote(tipo)
+    metricas.observar('ipc2_etapa_segundos', time.perf_counter() - inicio, operacion='configuracion', etapa='total')
+    
+    resultados['diferencias'] = diferencias
+    logger.info("🎯 RESULTADO FINAL - Recursos: %s, Categorías: %s, Clientes: %s", resultados['recursos_creados'], resultados['categorias_creadas'], resultados['clientes_creados'])
+    logger.info("🔁 Diferencias: %s", diferencias)
+    return resultados
+
+# ========== COMBINACIÓN CON LO GUARDADO ==========
+def combinar_datos(huellas_existentes, datos_nuevos, tipo_dato):
+    """
+    Compara las entidades nuevas con las guardadas, indexadas por ID/NIT en
+    `huellas_existentes` (ver cargar_huellas). Devuelve
+    {'agregados': [...], 'actualizados': [...], 'sin_cambios': [...]} con las
+    entidades nuevas de cada grupo. Si un ID se repite, gana la última aparición
+    en la posición de la primera; guardar agregados y actualizados deja el mismo
+    orden que reemplazar en su lugar y anexar al final.
+    """
+    ultimas = {}
+    for nuevo in datos_nuevos:
+        ultimas[_clave(nuevo, tipo_dato)] = nuevo
+    
+    diferencias = {'agregados': [], 'actualizados': [], 'sin_cambios': []}
+    for nuevo in ultimas.values():
+        cambio = _clasificar(huellas_existentes, nuevo, tipo_dato)
+        diferencias[cambio].append(nuevo)
+    return diferencias
+
+def _clasificar(huellas, entidad, tipo_dato):
+    """'agregados', 'actualizados' o 'sin_cambios'; registra la huella nueva en `huellas`"""
+    clave = _clave(entidad, tipo_dato)
+    huella = entidad.huella()
+    anterior = huellas.get(clave)
+    huellas[clave] = huella
+    if anterior is None:
+        logger.debug("✅ Agregando %s %s", tipo_dato, clave)
+        return 'agregados'
+    if anterior != huella:
+        logger.debug("🔄 Actualizando %s %s", tipo_dato, clave)
+        return 'actualizados'
+    return 'sin_cambios'
+
+def _clave(entidad, tipo_dato):
+    return str(getattr(entidad, ATRIBUTO_CLAVE[tipo_dato]))
+
+def _cargar_huellas(tipo):
+    # Una copia: _clasificar la actualiza y lo cargado puede venir de la caché
+    try:
+        return dict(cargar_huellas(tipo))
+    except Exception as e:
+        # Sin huellas todo se trata como nuevo y se reescribe, como antes
+        logger.warning("⚠️ No se pudieron leer las huellas de %s: %s", tipo, e)
+        return {}
+
+def _normalizar_fechas(cliente):
+    for instancia in cliente.instancias:
+        instancia.fecha_inicio = extraer_fecha(instancia.fecha_inicio)
+        if instancia.fecha_final:
+            instancia.fecha_final = extraer_fecha(instancia.fecha_final)
+
+def _resumen(diferencias):
+    return {grupo: len(entidades) for grupo, entidades in diferencias.items()}
@@ -0,0 +1,180 @@
+import base64
+import json
+import logging
+import config
+from database.storage import cargar_recursos, cargar_categorias, cargar_clientes, cargar_factura, iterar_consumos, iterar_facturas
+from utils.date_utils import marca_tiempo, rango_marcas, normalizar_fecha
+
+logger = logging.getLogger(__name__)
+
+TIPOS = ('recursos', 'categorias', 'clientes', 'consumos', 'facturas')
+
+# Parámetros de /consultar/<tipo> que piden una respuesta paginada
+PARAMETROS_PAGINACION = ('limite', 'cursor', 'nit', 'instancia', 'fecha_inicio', 'fecha_fin', 'numero', 'campos')
+
+# ========== CURSORES ==========
+# El cursor es opaco para el cliente: guarda la posición del último elemento
+# entregado según el almacenamiento (ID de consumo, posición o ID de factura),
+# así la página siguiente retoma ahí sin recorrer las anteriores.
+
+def _codificar_cursor(posicion):
+    return base64.urlsafe_b64encode(json.dumps(posicion).encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decodificar_cursor(cursor):
+    try:
+        posicion = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Cursor inválido')
+    # Solo _codificar_cursor arma cursores: una posición entera o un ID de texto
+    es_entero = isinstance(posicion, int) and not isinstance(posicion, bool) and posicion >= 0
+    if not (es_entero or isinstance(posicion, str)):
+        raise ValueError('Cursor inválido')
+    return posicion
+
+# ========== RECORRIDOS POR TIPO ==========
+# Cada recorrido devuelve pares (posición, elemento) a partir del cursor y
+# aplica los filtros que el almacenamiento no resuelve por sí mismo.
+
+def _recorrer_lista(elementos, despues_de):
+    desde = 0 if despues_de is None else int(despues_de) + 1
+    for posicion in range(desde, len(elementos)):
+        yield posicion, elementos[posicion]
+
+def _recorrer_clientes(despues_de, filtros):
+    clientes = cargar_clientes()
+    if filtros.get('nit') is not None:
+        clientes = [c for c in clientes if c['nit'] == filtros['nit']]
+    if filtros.get('instancia') is not None:
+        clientes = [c for c in clientes if any(str(i['id']) == filtros['instancia'] for i in c.get('instancias', []))]
+    return _recorrer_lista(clientes, despues_de)
+
+def _recorrer_consumos(despues_de, filtros):
+    for consumo in iterar_consumos(despues_de, filtros.get('fecha_inicio'), filtros.get('fecha_fin'),
+                                   filtros.get('nit'), filtros.get('instancia')):
+        yield consumo.id, consumo.a_dict()
+
+def _recorrer_facturas(despues_de, filtros):
+    if filtros.get('numero') is not None:
+        # Búsqueda puntual por el índice de números; a lo sumo una página de un elemento
+        factura = cargar_factura(filtros['numero']) if despues_de is None else None
+        facturas = iter([(0, factura)] if factura else [])
+    else:
+        facturas = iterar_facturas(despues_de, filtros.get('nit'))
+    
+    marca_inicio = marca_fin = None
+    if filtros.get('fecha_inicio') or filtros.get('fecha_fin'):
+        marca_inicio, marca_fin = rango_marcas(filtros.get('fecha_inicio') or '01/01/0001', filtros.get('fecha_fin') or '31/12/9999')
+    
+    for posicion, factura in facturas:
+        if filtros.get('nit') is not None and factura['nitCliente'] != filtros['nit']:
+            continue
+        if filtros.get('instancia') is not None and not any(d['idInstancia'] == filtros['instancia'] for d in factura['detalles']):
+            continue
+        if marca_inicio is not None and not marca_inicio <= marca_tiempo(factura['fechaFactura'][:10] + ' 00:00') <= marca_fin:
+            continue
+        yield posicion, factura
+
+def _recorrer(tipo, despues_de, filtros):
+    if tipo == 'recursos':
+        return _recorrer_lista(cargar_recursos(), despues_de)
+    if tipo == 'categorias':
+        return _recorrer_lista(cargar_categorias(), despues_de)
+    if tipo == 'clientes':
+        return _recorrer_clientes(despues_de, filtros)
+    if tipo == 'consumos':
+        return _recorrer_consumos(despues_de, filtros)
+    return _recorrer_facturas(despues_de, filtros)
+
+# ========== CONSULTA PAGINADA ==========
+def leer_parametros(argumentos):
+    """Convierte los parámetros de la URL en (filtros, campos, cursor, limite); ValueError si alguno no es válido"""
+    try:
+        limite = int(argumentos.get('limite') or config.CONSULTA_LIMITE_POR_DEFECTO)
+    except ValueError:
+        raise ValueError('El límite debe ser un número entero')
+    if limite < 1:
+        raise ValueError('El límite debe ser mayor que cero')
+    limite = min(limite, config.CONSULTA_LIMITE_MAXIMO)
+    
+    filtros = {}
+    for nombre in ('nit', 'instancia', 'numero'):
+        if argumentos.get(nombre):
+            filtros[nombre] = argumentos.get(nombre).strip()
+    for nombre in ('fecha_inicio', 'fecha_fin'):
+        if argumentos.get(nombre):
+            fecha = normalizar_fecha(argumentos.get(nombre).strip())
+            if not marca_tiempo(fecha[:10] + ' 00:00'):
+                raise ValueError(f'Fecha inválida en {nombre}: use DD/MM/AAAA o AAAA-MM-DD')
+            filtros[nombre] = fecha
+    
+    campos = [c.strip() for c in (argumentos.get('campos') or '').split(',') if c.strip()] or None
+    return filtros, campos, argumentos.get('cursor') or None, limite
+
+def consultar_pagina(tipo, filtros=None, campos=None, cursor=None, limite=None):
+    """
+    Devuelve {'datos': [...], 'siguiente': cursor o None} con a lo sumo `limite`
+    elementos. Solo se leen los elementos de la página pedida (más uno para
+    saber si hay otra), por lo que la memoria no depende del total guardado.
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f'Tipo de consulta desconocido: {tipo}')
+    limite = limite or config.CONSULTA_LIMITE_POR_DEFECTO
+    despues_de = _decodificar_cursor(cursor) if cursor else None
+    
+    datos = []
+    ultima_posicion = None
+    hay_mas = False
+    for posicion, elemento in _recorrer(tipo, despues_de, filtros or {}):
+        if len(datos) == limite:
+            hay_mas = True
+            break
+        datos.append({c: elemento[c] for c in campos if c in elemento} if campos else elemento)
+        ultima_posicion = posicion
+    
+    logger.debug("🔍 CONSULTA PAGINADA - Tipo: %s, Filtros: %s, Elementos: %s", tipo, filtros, len(datos))
+    return {'datos': datos, 'siguiente': _codificar_cursor(ultima_posicion) if hay_mas else None}
+
+# ========== EXPORTACIÓN COMPLETA ==========
+# Tamaño aproximado de cada bloque enviado al cliente
+TAMANO_BLOQUE_EXPORTACION = 64 * 1024
+
+FORMATOS_EXPORTACION = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+
+def exportar(tipo, formato='ndjson', filtros=None):
+    """
+    Genera todos los elementos de `tipo` ya serializados, en bloques de texto.
+    'ndjson' escribe un elemento JSON por línea; 'json' un único arreglo.
+    Los elementos se leen y se serializan a medida que se envían, así que
+    nunca está en memoria la exportación completa.
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f'Tipo de exportación desconocido: {tipo}')
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f'Formato de exportación desconocido: {formato}')
+    
+    # Se valida todo aquí, antes de que la respuesta empiece a enviarse
+    elementos = _recorrer(tipo, None, filtros or {})
+    
+    def bloques():
+        separador = '\n' if formato == 'ndjson' else ','
+        bloque = ['['] if formato == 'json' else []
+        tamano = 0
+        total = 0
+        for _, elemento in elementos:
+            linea = json.dumps(elemento, ensure_ascii=False)
+            if formato == 'ndjson':
+                bloque.append(linea + separador)
+            else:
+                bloque.append(linea if total == 0 else separador + linea)
+            tamano += len(linea) + 1
+            total += 1
+            if tamano >= TAMANO_BLOQUE_EXPORTACION:
+                yield ''.join(bloque)
+                bloque, tamano = [], 0
+        if formato == 'json':
+            bloque.append(']')
+        if bloque:
+            yield ''.join(bloque)
+        logger.debug("📤 EXPORTACIÓN - Tipo: %s, Formato: %s, Elementos: %s", tipo, formato, total)
+    
+    return bloques()
@@ -1,28 +1,105 @@
-from database.xml_storage import guardar_consumo
-from utils.xml_parser import parsear_xml_consumo
+import logging
+import time
+import zlib
+import xml.etree.ElementTree as ET
+from database.storage import (
+    guardar_consumos, iniciar_carga_consumos, agregar_a_carga_consumos,
+    confirmar_carga_consumos, descartar_carga_consumos
+)
+from utils.xml_parser import parsear_xml_consumo, iterar_xml_consumo
 from utils.validators import extraer_fecha_hora
+from utils import metricas
+
+logger = logging.getLogger(__name__)
+
+# Consumos que se acumulan en memoria antes de anexarlos al log
+TAMANO_LOTE_CONSUMOS = 5000
 
 def procesar_consumo(xml_data):
     try:
-        consumos = parsear_xml_consumo(xml_data)
+        with metricas.medir('consumo', 'parseo'):
+            consumos = parsear_xml_consumo(xml_data)
         
         resultados = {
             'consumos_procesados': len(consumos),
             'errores': []
         }
 
-        print(f"RESULTADOS CONSUMO: {resultados}")
+        logger.info("RESULTADOS CONSUMO: %s", resultados)
         
+        consumos_validos = []
         for consumo in consumos:
             try:
-                consumo.fecha_hora = extraer_fecha_hora(consumo.fecha_hora)
-                guardar_consumo(consumo)
-                print(f"Consumo guardado: {consumo.nit_cliente} - Instancia {consumo.id_instancia}")
+                consumo.fijar_fecha_hora(extraer_fecha_hora(consumo.fecha_hora))
+                consumos_validos.append(consumo)
             except Exception as e:
                 resultados['errores'].append(f"Error procesando consumo: {str(e)}")
         
+        # Un solo anexo al log para todo el lote
+        try:
+            with metricas.medir('consumo', 'escritura'):
+                guardar_consumos(consumos_validos)
+            metricas.contar('ipc2_registros_total', len(consumos_validos), operacion='consumo', tipo='consumos')
+            logger.info("Consumos guardados: %s", len(consumos_validos))
+        except Exception as e:
+            resultados['errores'].append(f"Error guardando consumos: {str(e)}")
+        
         return resultados
         
     except Exception as e:
-        print(f"ERROR en procesar_consumo: {str(e)}")
-        return {'error': f"Error procesando consumo: {str(e)}"}
\ No newline at end of file
+        logger.error("ERROR en procesar_consumo: %s", str(e))
+        return {'error': f"Error procesando consumo: {str(e)}"}
+
+def procesar_consumo_stream(fuente, tamano_lote=TAMANO_LOTE_CONSUMOS):
+    """
+    Igual que procesar_consumo, pero lee el XML de un flujo binario y guarda
+    los consumos en lotes acotados a medida que se leen. Los lotes quedan en
+    una carga que solo se confirma si el documento termina bien: un archivo
+    inválido o cortado no guarda nada y se puede volver a subir completo.
+    """
+    resultados = {
+        'consumos_procesados': 0,
+        'consumos_guardados': 0,
+        'errores': []
+    }
+    lote = []
+    carga = iniciar_carga_consumos()
+    
+    def guardar_lote():
+        with metricas.medir('consumo', 'escritura'):
+            agregar_a_carga_consumos(carga, lote)
+        lote.clear()
+    
+    inicio = time.perf_counter()
+    try:
+        for consumo in iterar_xml_consumo(fuente):
+            resultados['consumos_procesados'] += 1
+            try:
+                consumo.fijar_fecha_hora(extraer_fecha_hora(consumo.fecha_hora))
+                lote.append(consumo)
+            except Exception as e:
+                resultados['errores'].append(f"Error procesando consumo: {str(e)}")
+            
+            if len(lote) >= tamano_lote:
+                guardar_lote()
+        if lote:
+            guardar_lote()
+        with metricas.medir('consumo', 'escritura'):
+            resultados['consumos_guardados'] = confirmar_carga_consumos(carga)
+        metricas.contar('ipc2_registros_total', resultados['consumos_guardados'], operacion='consumo', tipo='consumos')
+    except Exception as e:
+        descartar_carga_consumos(carga)
+        if isinstance(e, ET.ParseError):
+            resultados['error'] = f"XML inválido: {str(e)}"
+        elif isinstance(e, (OSError, EOFError, zlib.error)):
+            # gzip corrupto o truncado, o el cuerpo se cortó
+            resultados['error'] = f"No se pudo leer el archivo: {str(e)}"
+        else:
+            resultados['error'] = f"Error guardando consumos: {str(e)}"
+        resultados['error'] += '. No se guardó ningún consumo del archivo'
+        logger.error("ERROR en carga de consumos: %s", resultados['error'])
+    metricas.observar('ipc2_etapa_segundos', time.perf_counter() - inicio, operacion='consumo', etapa='total')
+    
+    logger.info("RESULTADOS CONSUMO: %s procesados, %s guardados, %s errores",
+                resultados['consumos_procesados'], resultados['consumos_guardados'], len(resultados['errores']))
+    return resultados
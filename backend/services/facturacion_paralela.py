@@ -0,0 +1,60 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Particiones por proceso: más de una para repartir mejor la carga cuando
+# unos clientes tienen muchos más consumos que otros
+PARTICIONES_POR_PROCESO = 4
+
+# Catálogo de precios de solo lectura, instalado una vez en cada proceso
+_catalogo_proceso = None
+
+def _instalar_catalogo(catalogo):
+    global _catalogo_proceso
+    _catalogo_proceso = catalogo
+
+def _calcular_particion(consumos):
+    # Importación diferida: facturacion_service importa este módulo
+    from services.facturacion_service import calcular_cuentas_clientes
+    return calcular_cuentas_clientes(consumos, _catalogo_proceso)
+
+def particionar_por_cliente(consumos, partes):
+    """
+    Reparte los consumos en a lo sumo `partes` listas contiguas sin separar a
+    ningún cliente, con una cantidad de consumos parecida en cada una. Los
+    clientes quedan en orden de primera aparición, igual que en el motor estándar.
+    """
+    consumos_por_cliente = {}
+    for consumo in consumos:
+        consumos_por_cliente.setdefault(consumo.nit_cliente, []).append(consumo)
+
+    objetivo = max(1, -(-len(consumos) // max(1, partes)))
+    particiones = [[]]
+    for consumos_cliente in consumos_por_cliente.values():
+        if len(particiones[-1]) >= objetivo:
+            particiones.append([])
+        particiones[-1].extend(consumos_cliente)
+    return [p for p in particiones if p]
+
+def calcular_cuentas_paralelo(consumos, catalogo, procesos):
+    """
+    Mismo resultado que calcular_cuentas_clientes, calculando grupos de clientes
+    en un pool de procesos. Devuelve [(nit_cliente, total_factura, detalles_factura)].
+    """
+    particiones = particionar_por_cliente(consumos, procesos * PARTICIONES_POR_PROCESO)
+    if procesos <= 1 or len(particiones) <= 1:
+        return _calcular_en_proceso_actual(consumos, catalogo)
+
+    procesos = min(procesos, len(particiones))
+    logger.debug("Motor paralelo: %s consumos en %s particiones, %s procesos", len(consumos), len(particiones), procesos)
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_instalar_catalogo, initargs=(catalogo,)) as pool:
+        # map conserva el orden de las particiones, y con él el de los clientes
+        resultados = list(pool.map(_calcular_particion, particiones))
+
+    return [cuenta for cuentas in resultados for cuenta in cuentas]
+
+def _calcular_en_proceso_actual(consumos, catalogo):
+    from services.facturacion_service import calcular_cuentas_clientes
+    return calcular_cuentas_clientes(consumos, catalogo)
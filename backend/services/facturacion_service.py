@@ -1,27 +1,38 @@
-from database.xml_storage import guardar_factura, cargar_recursos, cargar_categorias, cargar_clientes, cargar_consumos
+import logging
+from database.storage import (
+    guardar_facturacion, bloqueo_facturacion, cargar_recursos, cargar_categorias,
+    cargar_clientes, cargar_consumos, cargar_consumos_facturados, cargar_manifiesto_consumos, reservar_secuencia
+)
 from database.models import Factura
+from services.catalogo_service import obtener_catalogo
+from services.facturacion_vectorizada import calcular_cuentas_vectorizado, NUMPY_DISPONIBLE
+from services.facturacion_paralela import calcular_cuentas_paralelo
 from datetime import datetime
+from config import FACTURACION_WORKERS
+from utils import metricas
 
-def generar_facturas(fecha_inicio, fecha_fin):
+logger = logging.getLogger(__name__)
+
+def generar_facturas(fecha_inicio, fecha_fin, motor='estandar'):
     try:
-        print(f"=== INICIANDO FACTURACIÓN: {fecha_inicio} a {fecha_fin} ===")
+        logger.info("=== INICIANDO FACTURACIÓN: %s a %s (motor: %s) ===", fecha_inicio, fecha_fin, motor)
         
         # Convertir formato YYYY-MM-DD a DD/MM/YYYY si es necesario
         if fecha_inicio and '-' in str(fecha_inicio):
             try:
                 fecha_obj = datetime.strptime(fecha_inicio, '%Y-%m-%d')
                 fecha_inicio = fecha_obj.strftime('%d/%m/%Y')
-                print(f"Fecha inicio convertida: {fecha_inicio}")
+                logger.debug("Fecha inicio convertida: %s", fecha_inicio)
             except Exception as e:
-                print(f"Error convirtiendo fecha inicio: {e}")
+                logger.error("Error convirtiendo fecha inicio: %s", e)
         
         if fecha_fin and '-' in str(fecha_fin):
             try:
                 fecha_obj = datetime.strptime(fecha_fin, '%Y-%m-%d')
                 fecha_fin = fecha_obj.strftime('%d/%m/%Y')
-                print(f"Fecha fin convertida: {fecha_fin}")
+                logger.debug("Fecha fin convertida: %s", fecha_fin)
             except Exception as e:
-                print(f"Error convirtiendo fecha fin: {e}")
+                logger.error("Error convirtiendo fecha fin: %s", e)
         
         # Si aún son None, usar fechas por defecto
         if not fecha_inicio:
@@ -29,243 +40,240 @@ def generar_facturas(fecha_inicio, fecha_fin):
         if not fecha_fin:
             fecha_fin = "31/10/2025"
         
-        print(f"Fechas finales: {fecha_inicio} a {fecha_fin}")
+        logger.debug("Fechas finales: %s a %s", fecha_inicio, fecha_fin)
         
-        facturas_generadas = []
+        # Una corrida a la vez: otra que leyera los mismos consumos pendientes
+        # antes de que esta los marque los facturaría dos veces
+        with bloqueo_facturacion():
+            return _facturar_periodo(fecha_inicio, fecha_fin, motor)
         
-        # Cargar datos
-        consumos = cargar_consumos()
+    except Exception as e:
+        logger.error("ERROR en facturación: %s", str(e))
+        import traceback
+        logger.debug("Traceback: %s", traceback.format_exc())
+        return {'error': f"Error en facturación: {str(e)}"}
+
+def _facturar_periodo(fecha_inicio, fecha_fin, motor):
+    """Factura los consumos pendientes del período; se llama con el candado de facturación tomado"""
+    facturas_generadas = []
+    
+    # Cargar datos: solo las particiones del período y los consumos aún no facturados
+    with metricas.medir('facturacion', 'carga'):
+        facturados = cargar_consumos_facturados(fecha_inicio, fecha_fin)
+        consumos = [
+            consumo for consumo in cargar_consumos(fecha_inicio, fecha_fin)
+            if consumo.id not in facturados
+        ]
         clientes = cargar_clientes()
         categorias = cargar_categorias()
         recursos = cargar_recursos()
+        catalogo = obtener_catalogo()
+    metricas.contar('ipc2_registros_total', len(consumos), operacion='facturacion', tipo='consumos')
+    
+    # Un consumo con fecha ilegible no cae en ningún período: se avisa en vez de omitirlo en silencio
+    sin_fecha = cargar_manifiesto_consumos().get('sin-fecha', 0)
+    if sin_fecha:
+        logger.warning("⚠️ %s consumos sin fecha válida no entran en ninguna facturación por período", sin_fecha)
+        metricas.contar('ipc2_registros_total', sin_fecha, operacion='facturacion', tipo='consumos_sin_fecha')
+    
+    logger.debug("Consumos por facturar en el período: %s (ya facturados: %s)", len(consumos), len(facturados))
+    logger.debug("Clientes cargados: %s", len(clientes))
+    logger.debug("Categorías cargadas: %s", len(categorias))
+    logger.debug("Recursos cargados: %s", len(recursos))
+    
+    # El detalle completo recorre todos los consumos; solo se arma con nivel DEBUG
+    if logger.isEnabledFor(logging.DEBUG):
+        _registrar_estructura(clientes, categorias, recursos, consumos)
+    
+    # Si no hay consumos, retornar vacío
+    if not consumos:
+        logger.warning("⚠️ No hay consumos para facturar")
+        return {
+            'facturas_generadas': 0,
+            'detalles': [],
+            'consumos_sin_fecha': sin_fecha
+        }
+    
+    # Calcular el detalle de cada cliente con el motor solicitado
+    if motor == 'vectorizado' and not NUMPY_DISPONIBLE:
+        logger.warning("⚠️ numpy no está instalado, se usa el motor estándar")
+        motor = 'estandar'
+    with metricas.medir('facturacion', 'calculo'):
+        if motor == 'vectorizado':
+            cuentas_clientes = calcular_cuentas_vectorizado(consumos, catalogo)
+        elif motor == 'paralelo':
+            cuentas_clientes = calcular_cuentas_paralelo(consumos, catalogo, FACTURACION_WORKERS)
+        else:
+            cuentas_clientes = calcular_cuentas_clientes(consumos, catalogo)
+    
+    # IDs de consumo por (cliente, instancia) para registrar qué factura los cubre
+    ids_por_instancia = {}
+    for consumo in consumos:
+        ids_por_instancia.setdefault((consumo.nit_cliente, consumo.id_instancia), []).append(consumo.id)
+    
+    # Un solo bloque de números para toda la corrida
+    facturables = sum(1 for _, total_factura, _ in cuentas_clientes if total_factura > 0)
+    siguiente_numero = reservar_secuencia('facturas', facturables) if facturables else None
+    fecha_emision = datetime.now()
+    
+    facturas = []
+    ids_por_factura = {}
+    for nit_cliente, total_factura, detalles_factura in cuentas_clientes:
+        if total_factura > 0:
+            # NÚMERO DE FACTURA ÚNICO
+            numero_factura = generar_numero_factura(siguiente_numero, fecha_emision)
+            siguiente_numero += 1
+            
+            facturas.append(Factura(
+                numero_factura=numero_factura,
+                nit_cliente=nit_cliente,
+                fecha_factura=fecha_fin,
+                monto_total=round(total_factura, 2),
+                detalles=detalles_factura
+            ))
+            ids_por_factura[numero_factura] = [
+                id_consumo for detalle in detalles_factura
+                for id_consumo in ids_por_instancia[(nit_cliente, detalle['id_instancia'])]
+            ]
+            facturas_generadas.append({
+                'numero_factura': numero_factura,
+                'nit_cliente': nit_cliente,
+                'monto_total': round(total_factura, 2)
+            })
+            
+            logger.debug("✓ Factura %s generada: Q%.2f", numero_factura, total_factura)
+        else:
+            logger.warning("⚠️ Cliente %s no tiene consumos facturables (total: Q%.2f)", nit_cliente, total_factura)
+    
+    # GUARDAR TODAS LAS FACTURAS Y MARCAR SUS CONSUMOS en una sola operación recuperable
+    if facturas:
+        with metricas.medir('facturacion', 'escritura'):
+            guardar_facturacion(facturas, ids_por_factura)
+    metricas.contar('ipc2_registros_total', len(facturas), operacion='facturacion', tipo='facturas')
+    
+    resultado = {
+        'facturas_generadas': len(facturas_generadas),
+        'detalles': facturas_generadas,
+        'consumos_sin_fecha': sin_fecha
+    }
+    
+    logger.info("=== FACTURACIÓN COMPLETADA: %s facturas ===", resultado['facturas_generadas'])
+    return resultado
+
+def _registrar_estructura(clientes, categorias, recursos, consumos):
+    """Vuelca al log (DEBUG) los datos con los que se factura"""
+    logger.debug("CLIENTES:")
+    for cliente in clientes:
+        logger.debug("  NIT: %s, Nombre: %s", cliente['nit'], cliente.get('nombre', 'N/A'))
+        for instancia in cliente.get('instancias', []):
+            logger.debug("    Instancia ID: %s, Config: %s", instancia['id'], instancia['idConfiguracion'])
+    
+    logger.debug("CATEGORÍAS Y CONFIGURACIONES:")
+    for categoria in categorias:
+        logger.debug("  Categoría: %s (ID: %s)", categoria['nombre'], categoria['id'])
+        for config in categoria.get('configuraciones', []):
+            logger.debug("    Configuración ID: %s, Nombre: %s", config['id'], config.get('nombre', 'N/A'))
+            recursos_config = config.get('recursos', {})
+            logger.debug("      Recursos: %s", recursos_config)
+            if recursos_config:
+                for recurso_id, cantidad in recursos_config.items():
+                    logger.debug("        Recurso ID: %s, Cantidad: %s", recurso_id, cantidad)
+            else:
+                logger.warning("        ⚠️ NO HAY RECURSOS EN ESTA CONFIGURACIÓN")
+    
+    logger.debug("RECURSOS DISPONIBLES:")
+    for recurso in recursos:
+        logger.debug("  ID: %s, Nombre: %s, Valor/hora: Q%s", recurso['id'], recurso['nombre'], recurso['valor_x_hora'])
+    
+    logger.debug("CONSUMOS:")
+    for consumo in consumos:
+        logger.debug("  NIT: %s, Instancia: %s, Tiempo: %s horas", consumo.nit_cliente, consumo.id_instancia, consumo.tiempo)
+
+def calcular_cuentas_clientes(consumos, catalogo):
+    """
+    Agrupa los consumos por cliente e instancia y calcula el costo de cada instancia.
+    Devuelve [(nit_cliente, total_factura, detalles_factura)] en el orden en que
+    aparece cada cliente; los clientes que no existen en el sistema se omiten.
+    """
+    # Agrupar consumos por cliente
+    consumos_por_cliente = {}
+    for consumo in consumos:
+        nit_cliente = consumo.nit_cliente
+        if nit_cliente not in consumos_por_cliente:
+            consumos_por_cliente[nit_cliente] = []
+        consumos_por_cliente[nit_cliente].append(consumo)
+    
+    logger.debug("Clientes con consumos: %s", list(consumos_por_cliente.keys()))
+    
+    cuentas = []
+    for nit_cliente, consumos_cliente in consumos_por_cliente.items():
+        logger.debug("Procesando cliente: %s", nit_cliente)
         
-        print(f"Consumos cargados: {len(consumos)}")
-        print(f"Clientes cargados: {len(clientes)}")
-        print(f"Categorías cargadas: {len(categorias)}")
-        print(f"Recursos cargados: {len(recursos)}")
-        
-        # DEBUG: Mostrar estructura completa
-        print("\n=== DEBUG ESTRUCTURA COMPLETA ===")
-        print("CLIENTES:")
-        for cliente in clientes:
-            print(f"  NIT: {cliente['nit']}, Nombre: {cliente.get('nombre', 'N/A')}")
-            for instancia in cliente.get('instancias', []):
-                print(f"    Instancia ID: {instancia['id']}, Config: {instancia['idConfiguracion']}")
-        
-        print("\nCATEGORÍAS Y CONFIGURACIONES:")
-        for categoria in categorias:
-            print(f"  Categoría: {categoria['nombre']} (ID: {categoria['id']})")
-            for config in categoria.get('configuraciones', []):
-                print(f"    Configuración ID: {config['id']}, Nombre: {config.get('nombre', 'N/A')}")
-                recursos_config = config.get('recursos', {})
-                print(f"      Recursos: {recursos_config}")
-                if recursos_config:
-                    for recurso_id, cantidad in recursos_config.items():
-                        print(f"        Recurso ID: {recurso_id}, Cantidad: {cantidad}")
-                else:
-                    print(f"        ⚠️ NO HAY RECURSOS EN ESTA CONFIGURACIÓN")
-        
-        print("\nRECURSOS DISPONIBLES:")
-        for recurso in recursos:
-            print(f"  ID: {recurso['id']}, Nombre: {recurso['nombre']}, Valor/hora: Q{recurso['valor_x_hora']}")
-        
-        print("\nCONSUMOS:")
-        for consumo in consumos:
-            print(f"  NIT: {consumo['nitCliente']}, Instancia: {consumo['idInstancia']}, Tiempo: {consumo['tiempo']} horas")
-        
-        # Si no hay consumos, retornar vacío
-        if not consumos:
-            print("⚠️ No hay consumos para facturar")
-            return {
-                'facturas_generadas': 0,
-                'detalles': []
-            }
+        # Verificar si el cliente existe en el sistema
+        if nit_cliente not in catalogo.clientes:
+            logger.warning("⚠️ Cliente %s no existe en el sistema, saltando...", nit_cliente)
+            continue
         
-        # Agrupar consumos por cliente
-        consumos_por_cliente = {}
-        for consumo in consumos:
-            nit_cliente = consumo['nitCliente']
-            if nit_cliente not in consumos_por_cliente:
-                consumos_por_cliente[nit_cliente] = []
-            consumos_por_cliente[nit_cliente].append(consumo)
+        total_factura = 0
+        detalles_factura = []
         
-        print(f"Clientes con consumos: {list(consumos_por_cliente.keys())}")
+        # Agrupar consumos por instancia
+        consumos_por_instancia = {}
+        for consumo in consumos_cliente:
+            id_instancia = consumo.id_instancia
+            if id_instancia not in consumos_por_instancia:
+                consumos_por_instancia[id_instancia] = []
+            consumos_por_instancia[id_instancia].append(consumo)
         
-        for nit_cliente, consumos_cliente in consumos_por_cliente.items():
-            print(f"\nProcesando cliente: {nit_cliente}")
+        # Calcular costos por instancia
+        for id_instancia, consumos_instancia in consumos_por_instancia.items():
+            tiempo_total = sum(consumo.tiempo for consumo in consumos_instancia)
+            logger.debug("  Procesando instancia %s - Tiempo total: %s horas", id_instancia, tiempo_total)
             
-            # Verificar si el cliente existe en el sistema
-            cliente_existe = any(cliente['nit'] == nit_cliente for cliente in clientes)
-            if not cliente_existe:
-                print(f"⚠️ Cliente {nit_cliente} no existe en el sistema, saltando...")
-                continue
+            costo_instancia = calcular_costo_instancia(id_instancia, tiempo_total, catalogo)
             
-            total_factura = 0
-            detalles_factura = []
-            
-            # Agrupar consumos por instancia
-            consumos_por_instancia = {}
-            for consumo in consumos_cliente:
-                id_instancia = consumo['idInstancia']
-                if id_instancia not in consumos_por_instancia:
-                    consumos_por_instancia[id_instancia] = []
-                consumos_por_instancia[id_instancia].append(consumo)
-            
-            # Calcular costos por instancia
-            for id_instancia, consumos_instancia in consumos_por_instancia.items():
-                tiempo_total = sum(float(consumo['tiempo']) for consumo in consumos_instancia)
-                print(f"  Procesando instancia {id_instancia} - Tiempo total: {tiempo_total} horas")
-                
-                costo_instancia = calcular_costo_instancia(id_instancia, tiempo_total, clientes, categorias, recursos)
-                
-                if costo_instancia > 0:
-                    total_factura += costo_instancia
-                    detalles_factura.append({
-                        'id_instancia': id_instancia,
-                        'tiempo_total': tiempo_total,
-                        'monto': costo_instancia
-                    })
-                    print(f"  ✓ Instancia {id_instancia}: {tiempo_total} horas = Q{costo_instancia:.2f}")
-                else:
-                    print(f"  ⚠️ Instancia {id_instancia}: {tiempo_total} horas = Q0.00 (no facturable)")
-            
-            if total_factura > 0:
-                # NÚMERO DE FACTURA ÚNICO
-                numero_factura = generar_numero_factura(nit_cliente)
-                
-                factura = Factura(
-                    numero_factura=numero_factura,
-                    nit_cliente=nit_cliente,
-                    fecha_factura=fecha_fin,
-                    monto_total=round(total_factura, 2),
-                    detalles=detalles_factura
-                )
-                
-                # GUARDAR LA FACTURA
-                guardar_factura(factura)
-                facturas_generadas.append({
-                    'numero_factura': numero_factura,
-                    'nit_cliente': nit_cliente,
-                    'monto_total': round(total_factura, 2)
+            if costo_instancia > 0:
+                total_factura += costo_instancia
+                detalles_factura.append({
+                    'id_instancia': id_instancia,
+                    'tiempo_total': tiempo_total,
+                    'monto': costo_instancia
                 })
-                
-                print(f"✓ Factura {numero_factura} generada: Q{total_factura:.2f}")
+                logger.debug("  ✓ Instancia %s: %s horas = Q%.2f", id_instancia, tiempo_total, costo_instancia)
             else:
-                print(f"⚠️ Cliente {nit_cliente} no tiene consumos facturables (total: Q{total_factura:.2f})")
+                logger.warning("  ⚠️ Instancia %s: %s horas = Q0.00 (no facturable)", id_instancia, tiempo_total)
         
-        resultado = {
-            'facturas_generadas': len(facturas_generadas),
-            'detalles': facturas_generadas
-        }
-        
-        print(f"\n=== FACTURACIÓN COMPLETADA: {resultado} ===")
-        return resultado
-        
-    except Exception as e:
-        print(f"ERROR en facturación: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        return {'error': f"Error en facturación: {str(e)}"}
+        cuentas.append((nit_cliente, total_factura, detalles_factura))
+    
+    return cuentas
 
-def generar_numero_factura(nit_cliente):
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    # Incluir parte del NIT para hacer único por cliente
-    nit_short = nit_cliente.replace('-', '')[:4]
-    return f"FACT-{timestamp}-{nit_short}"
+def generar_numero_factura(secuencia, fecha_emision=None):
+    """FACT-AAAAMMDD-NNNNNNNN; la secuencia viene de reservar_secuencia('facturas'), así que es única y creciente"""
+    fecha_emision = fecha_emision or datetime.now()
+    return f"FACT-{fecha_emision.strftime('%Y%m%d')}-{secuencia:08d}"
 
-def calcular_costo_instancia(id_instancia, tiempo_total, clientes, categorias, recursos):
+def calcular_costo_instancia(id_instancia, tiempo_total, catalogo):
     try:
-        costo_total = 0
-        
-        print(f"    Buscando instancia {id_instancia}...")
-        
-        # Buscar la instancia en los clientes
-        instancia_encontrada = False
-        configuracion_encontrada = False
-        id_configuracion = None
-        
-        for cliente in clientes:
-            for instancia in cliente.get('instancias', []):
-                # Comparar como strings para evitar problemas de tipo
-                instancia_id_str = str(instancia['id']).strip()
-                id_instancia_str = str(id_instancia).strip()
-                
-                if instancia_id_str == id_instancia_str:
-                    id_configuracion = instancia['idConfiguracion']
-                    print(f"    ✓ Instancia encontrada: ID {id_instancia}, Configuración: {id_configuracion}")
-                    instancia_encontrada = True
-                    break
-            if instancia_encontrada:
-                break
-        
-        if not instancia_encontrada:
-            print(f"    ⚠️ Instancia {id_instancia} no encontrada en ningún cliente")
+        id_configuracion = catalogo.configuracion_de_instancia(id_instancia)
+        if id_configuracion is None:
+            logger.warning("    ⚠️ Instancia %s no encontrada en ningún cliente", id_instancia)
             return 0
         
-        # Buscar la configuración en las categorías
-        print(f"    Buscando configuración {id_configuracion}...")
-        
-        for categoria in categorias:
-            for config in categoria.get('configuraciones', []):
-                # Comparar como strings
-                config_id_str = str(config['id']).strip()
-                id_configuracion_str = str(id_configuracion).strip()
-                
-                if config_id_str == id_configuracion_str:
-                    print(f"    ✓ Configuración {id_configuracion} encontrada en categoría {categoria['nombre']}")
-                    configuracion_encontrada = True
-                    
-                    # Verificar si la configuración tiene recursos
-                    recursos_config = config.get('recursos', {})
-                    if not recursos_config:
-                        print(f"    ⚠️ CRÍTICO: La configuración {id_configuracion} NO TIENE RECURSOS ASIGNADOS")
-                        print(f"    ℹ️  Revisa el archivo XML de categorías en backend/data/categorias.xml")
-                        print(f"    ℹ️  La configuración debe tener recursos dentro de <recursos>")
-                        return 0
-                    
-                    print(f"    Recursos en configuración: {recursos_config}")
-                    
-                    # Calcular costo por cada recurso en la configuración
-                    for recurso_id, cantidad in recursos_config.items():
-                        recurso_id_str = str(recurso_id).strip()
-                        print(f"      Procesando recurso {recurso_id_str}, cantidad: {cantidad}")
-                        
-                        recurso_info = obtener_recurso_info(recurso_id_str, recursos)
-                        if recurso_info:
-                            try:
-                                valor_hora = float(recurso_info['valor_x_hora'])
-                                cant = float(cantidad)
-                                costo_recurso = valor_hora * cant * tiempo_total
-                                costo_total += costo_recurso
-                                print(f"      ✓ Recurso {recurso_id_str}: {cant} unidades x {tiempo_total} horas x Q{valor_hora}/hora = Q{costo_recurso:.2f}")
-                            except (ValueError, TypeError) as e:
-                                print(f"      ✗ Error calculando costo recurso {recurso_id_str}: {e}")
-                        else:
-                            print(f"      ⚠️ Recurso {recurso_id_str} no encontrado en recursos disponibles")
-                    
-                    break
-            if configuracion_encontrada:
-                break
+        if id_configuracion not in catalogo.configuraciones:
+            logger.warning("    ⚠️ Configuración %s no encontrada en categorías", id_configuracion)
+            return 0
         
-        if not configuracion_encontrada:
-            print(f"    ⚠️ Configuración {id_configuracion} no encontrada en categorías")
+        if not catalogo.recursos_por_configuracion[id_configuracion]:
+            logger.warning("    ⚠️ CRÍTICO: La configuración %s NO TIENE RECURSOS ASIGNADOS", id_configuracion)
+            logger.debug("    ℹ️  Revisa el archivo XML de categorías en backend/data/categorias.xml")
             return 0
         
-        print(f"    Costo total para instancia {id_instancia}: Q{costo_total:.2f}")
+        costo_total = catalogo.costo(id_configuracion, tiempo_total)
+        logger.debug("    Instancia %s (configuración %s): %s horas = Q%.2f", id_instancia, id_configuracion, tiempo_total, costo_total)
         return round(costo_total, 2)
         
     except Exception as e:
-        print(f"Error calculando costo para instancia {id_instancia}: {e}")
+        logger.error("Error calculando costo para instancia %s: %s", id_instancia, e)
         import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.debug("Traceback: %s", traceback.format_exc())
         return 0
-
-def obtener_recurso_info(id_recurso, recursos):
-    for recurso in recursos:
-        recurso_id_str = str(recurso['id']).strip()
-        id_recurso_str = str(id_recurso).strip()
-        
-        if recurso_id_str == id_recurso_str:
-            return recurso
-    
-    return None
\ No newline at end of file
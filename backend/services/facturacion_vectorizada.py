@@ -0,0 +1,95 @@
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # dependencia opcional, solo la usa el motor vectorizado
+    np = None
+
+NUMPY_DISPONIBLE = np is not None
+
+logger = logging.getLogger(__name__)
+
+class ColumnasConsumo:
+    """
+    Consumos en forma columnar. Cada fila tiene el código del cliente, el código
+    del grupo (cliente, instancia), las horas y una marca de tiempo entera
+    AAAAMMDDHHMM. Los códigos se asignan en orden de primera aparición, igual que
+    el agrupamiento con diccionarios del motor estándar.
+    """
+    def __init__(self, consumos):
+        self._consumos = consumos
+        self._marca = None
+
+        nits_fila = [c.nit_cliente for c in consumos]
+        grupos_fila = list(zip(nits_fila, (c.id_instancia for c in consumos)))
+
+        # Factorización: el dict conserva el orden de primera aparición
+        self.nits = list(dict.fromkeys(nits_fila))
+        self.grupos = list(dict.fromkeys(grupos_fila))
+        codigos_nit = {nit: i for i, nit in enumerate(self.nits)}
+        codigos_grupo = {grupo: i for i, grupo in enumerate(self.grupos)}
+
+        self.nit = np.fromiter(map(codigos_nit.__getitem__, nits_fila), dtype=np.int64, count=len(consumos))
+        self.grupo = np.fromiter(map(codigos_grupo.__getitem__, grupos_fila), dtype=np.int64, count=len(consumos))
+        self.horas = np.fromiter((c.tiempo for c in consumos), dtype=np.float64, count=len(consumos))
+
+    @property
+    def marca(self):
+        """Marca de tiempo por fila; se calcula solo si alguien la necesita"""
+        if self._marca is None:
+            self._marca = np.fromiter(
+                (c.marca for c in self._consumos),
+                dtype=np.int64, count=len(self._consumos))
+        return self._marca
+
+def calcular_cuentas_vectorizado(consumos, catalogo):
+    """
+    Mismo resultado que calcular_cuentas_clientes, pero sumando las horas de cada
+    (cliente, instancia) con una reducción agrupada y multiplicando por el vector
+    de tarifas por hora. Devuelve [(nit_cliente, total_factura, detalles_factura)].
+    """
+    columnas = ColumnasConsumo(consumos)
+    total_grupos = len(columnas.grupos)
+
+    # bincount acumula en el orden de las filas, igual que sum() sobre la lista
+    horas_grupo = np.bincount(columnas.grupo, weights=columnas.horas, minlength=total_grupos)
+
+    # Tarifa de cada recurso por grupo, rellenada con ceros (sumar 0.0 no cambia
+    # el resultado). Se acumula columna por columna para sumar en el mismo orden
+    # que calcular_costo_instancia y obtener exactamente los mismos montos.
+    tarifas_grupo = [_tarifas_o_nan(catalogo, id_instancia) for _, id_instancia in columnas.grupos]
+    columnas_tarifa = max((len(t) for t in tarifas_grupo), default=0)
+    tarifas = np.zeros((total_grupos, columnas_tarifa))
+    for g, tarifas_instancia in enumerate(tarifas_grupo):
+        tarifas[g, :len(tarifas_instancia)] = tarifas_instancia
+    costos_grupo = np.zeros(total_grupos)
+    for k in range(columnas_tarifa):
+        costos_grupo += tarifas[:, k] * horas_grupo
+
+    logger.debug("Motor vectorizado: %s consumos, %s clientes, %s instancias", len(consumos), len(columnas.nits), total_grupos)
+
+    cuentas = {}
+    for g, (nit_cliente, id_instancia) in enumerate(columnas.grupos):
+        if nit_cliente not in catalogo.clientes:
+            continue
+        cuenta = cuentas.setdefault(nit_cliente, [0, []])
+
+        costo = float(costos_grupo[g])
+        costo_instancia = round(costo, 2) if costo == costo else 0
+        if costo_instancia > 0:
+            cuenta[0] += costo_instancia
+            cuenta[1].append({
+                'id_instancia': id_instancia,
+                'tiempo_total': float(horas_grupo[g]),
+                'monto': costo_instancia
+            })
+
+    for nit_cliente in columnas.nits:
+        if nit_cliente not in catalogo.clientes:
+            logger.warning("⚠️ Cliente %s no existe en el sistema, saltando...", nit_cliente)
+
+    return [(nit_cliente, total, detalles) for nit_cliente, (total, detalles) in cuentas.items()]
+
+def _tarifas_o_nan(catalogo, id_instancia):
+    tarifas = catalogo.tarifas_instancia(id_instancia)
+    return [float('nan')] if tarifas is None else tarifas
@@ -1,3 +1,4 @@
+import logging
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -5,50 +6,48 @@ from reportlab.lib import colors
 from reportlab.lib.units import inch
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 from reportlab.pdfgen import canvas
-from database.xml_storage import cargar_datos, cargar_recursos, cargar_categorias, cargar_clientes, cargar_consumos, cargar_facturas
+from database.storage import cargar_factura, cargar_acumulados_ingresos, version_datos
+from services.catalogo_service import obtener_catalogo
+from services import cache_reportes
+from utils import metricas
+from utils.date_utils import normalizar_fecha
 from datetime import datetime
 import os
 
+logger = logging.getLogger(__name__)
+
 def generar_reporte_factura(numero_factura):
     """
     Genera un reporte PDF detallado de una factura específica.
     Incluye: datos generales, detalle por instancia, recursos consumidos y su aporte al cobro.
     """
     try:
-        print(f"\n=== GENERANDO REPORTE DE FACTURA: {numero_factura} ===")
-        
-        # Cargar todos los datos necesarios
-        facturas = cargar_facturas()
-        clientes = cargar_clientes()
-        consumos = cargar_consumos()
-        categorias = cargar_categorias()
-        recursos = cargar_recursos()
-        
-        # Buscar la factura específica
-        factura_data = None
-        for factura in facturas:
-            if factura['numero'] == numero_factura:
-                factura_data = factura
-                break
+        logger.info("=== GENERANDO REPORTE DE FACTURA: %s ===", numero_factura)
+        
+        # La versión se toma antes de leer, para no guardar datos nuevos con una clave vieja
+        version = version_datos('clientes', 'categorias', 'recursos')
+        
+        # Cargar la factura por su número y el catálogo
+        factura_data = cargar_factura(numero_factura)
+        catalogo = obtener_catalogo()
         
         if not factura_data:
-            print(f"❌ Factura {numero_factura} no encontrada")
+            logger.error("❌ Factura %s no encontrada", numero_factura)
             return None
         
-        print(f"✅ Factura encontrada - Cliente: {factura_data['nitCliente']}")
+        logger.debug("✅ Factura encontrada - Cliente: %s", factura_data['nitCliente'])
         
         # Buscar datos del cliente
-        cliente_data = None
-        for cliente in clientes:
-            if cliente['nit'] == factura_data['nitCliente']:
-                cliente_data = cliente
-                break
+        cliente_data = catalogo.clientes.get(factura_data['nitCliente'])
         
-        # Crear archivo PDF
-        filename = f"factura_{numero_factura}.pdf"
-        filepath = os.path.join('database', 'data', filename)
+        # Una factura emitida no cambia: solo se vuelve a generar si cambió el catálogo
+        filepath, en_cache = cache_reportes.buscar(f"factura_{numero_factura}", {'numero_factura': numero_factura}, [version, factura_data])
+        if en_cache:
+            return filepath
         
-        doc = SimpleDocTemplate(filepath, pagesize=letter,
+        # Crear archivo PDF
+        temporal = cache_reportes.ruta_temporal(filepath)
+        doc = SimpleDocTemplate(temporal, pagesize=letter,
                               rightMargin=40, leftMargin=40,
                               topMargin=40, bottomMargin=40)
         elements = []
@@ -119,17 +118,8 @@ def generar_reporte_factura(numero_factura):
             total_general += monto_instancia
             
             # Buscar información de la instancia
-            instancia_info = None
-            config_id = None
-            
-            for cliente in clientes:
-                for instancia in cliente.get('instancias', []):
-                    if str(instancia['id']) == str(id_instancia):
-                        instancia_info = instancia
-                        config_id = instancia['idConfiguracion']
-                        break
-                if instancia_info:
-                    break
+            instancia_info = catalogo.instancias.get(str(id_instancia).strip())
+            config_id = catalogo.configuracion_de_instancia(id_instancia)
             
             # Encabezado de instancia
             instancia_header = f"Instancia: {instancia_info['nombre'] if instancia_info else id_instancia} (ID: {id_instancia})"
@@ -158,42 +148,25 @@ def generar_reporte_factura(numero_factura):
             
             # ========== DETALLE DE RECURSOS Y SU APORTE ==========
             if config_id:
-                # Buscar la configuración
-                config_recursos = None
-                for categoria in categorias:
-                    for config in categoria.get('configuraciones', []):
-                        if str(config['id']) == str(config_id):
-                            config_recursos = config.get('recursos', {})
-                            break
-                    if config_recursos:
-                        break
+                # Recursos de la configuración ya resueltos con su valor por hora
+                config_recursos = catalogo.recursos_por_configuracion.get(config_id)
                 
-                if config_recursos and len(config_recursos) > 0:
+                if config_recursos:
                     elements.append(Paragraph("Detalle de Recursos Consumidos:", styles['Heading4']))
                     
                     recursos_data = [['Recurso', 'Cantidad', 'Costo/Hora', 'Horas', 'Subtotal']]
                     
-                    for recurso_id, cantidad in config_recursos.items():
-                        # Buscar info del recurso
-                        recurso_info = None
-                        for recurso in recursos:
-                            if str(recurso['id']) == str(recurso_id):
-                                recurso_info = recurso
-                                break
+                    for recurso_info, cant, valor_hora in config_recursos:
+                        nombre_recurso = f"{recurso_info['nombre']} ({recurso_info['abreviatura']})"
+                        subtotal = valor_hora * cant * tiempo_total
                         
-                        if recurso_info:
-                            nombre_recurso = f"{recurso_info['nombre']} ({recurso_info['abreviatura']})"
-                            valor_hora = float(recurso_info['valor_x_hora'])
-                            cant = float(cantidad)
-                            subtotal = valor_hora * cant * tiempo_total
-                            
-                            recursos_data.append([
-                                nombre_recurso,
-                                f"{cant:.2f} {recurso_info['metrica']}",
-                                f"Q {valor_hora:.2f}",
-                                f"{tiempo_total:.2f}",
-                                f"Q {subtotal:.2f}"
-                            ])
+                        recursos_data.append([
+                            nombre_recurso,
+                            f"{cant:.2f} {recurso_info['metrica']}",
+                            f"Q {valor_hora:.2f}",
+                            f"{tiempo_total:.2f}",
+                            f"Q {subtotal:.2f}"
+                        ])
                     
                     recursos_table = Table(recursos_data, colWidths=[2*inch, 1*inch, 1*inch, 1*inch, 1.2*inch])
                     recursos_table.setStyle(TableStyle([
@@ -216,23 +189,14 @@ def generar_reporte_factura(numero_factura):
                     elements.append(Paragraph("Aporte Porcentual al Costo de la Instancia:", styles['Heading4']))
                     
                     aporte_data = [['Recurso', 'Porcentaje del Total']]
-                    for recurso_id, cantidad in config_recursos.items():
-                        recurso_info = None
-                        for recurso in recursos:
-                            if str(recurso['id']) == str(recurso_id):
-                                recurso_info = recurso
-                                break
+                    for recurso_info, cant, valor_hora in config_recursos:
+                        subtotal = valor_hora * cant * tiempo_total
+                        porcentaje = (subtotal / monto_instancia * 100) if monto_instancia > 0 else 0
                         
-                        if recurso_info:
-                            valor_hora = float(recurso_info['valor_x_hora'])
-                            cant = float(cantidad)
-                            subtotal = valor_hora * cant * tiempo_total
-                            porcentaje = (subtotal / monto_instancia * 100) if monto_instancia > 0 else 0
-                            
-                            aporte_data.append([
-                                recurso_info['nombre'],
-                                f"{porcentaje:.1f}%"
-                            ])
+                        aporte_data.append([
+                            recurso_info['nombre'],
+                            f"{porcentaje:.1f}%"
+                        ])
                     
                     aporte_table = Table(aporte_data, colWidths=[3*inch, 2*inch])
                     aporte_table.setStyle(TableStyle([
@@ -293,15 +257,18 @@ def generar_reporte_factura(numero_factura):
         elements.append(Paragraph(footer_text, styles['Normal']))
         
         # Construir PDF
-        doc.build(elements)
+        with metricas.medir('reporte_factura', 'render'):
+            doc.build(elements)
+        with metricas.medir('reporte_factura', 'escritura'):
+            cache_reportes.registrar(temporal, filepath)
         
-        print(f"✅ Reporte generado exitosamente: {filepath}")
+        logger.info("✅ Reporte generado exitosamente: %s", filepath)
         return filepath
         
     except Exception as e:
-        print(f"❌ Error generando reporte de factura: {str(e)}")
+        logger.error("❌ Error generando reporte de factura: %s", str(e))
         import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.debug("Traceback: %s", traceback.format_exc())
         return None
 
 
@@ -310,21 +277,21 @@ def generar_analisis_ventas(tipo, fecha_inicio, fecha_fin):
     Genera análisis de ventas por categorías/configuraciones o por recursos.
     """
     try:
-        print(f"\n=== GENERANDO ANÁLISIS DE VENTAS: {tipo} ===")
-        print(f"Período: {fecha_inicio} a {fecha_fin}")
+        logger.info("=== GENERANDO ANÁLISIS DE VENTAS: %s ===", tipo)
+        logger.debug("Período: %s a %s", fecha_inicio, fecha_fin)
         
         if tipo == 'categorias':
             return generar_analisis_categorias(fecha_inicio, fecha_fin)
         elif tipo == 'recursos':
             return generar_analisis_recursos(fecha_inicio, fecha_fin)
         else:
-            print(f"❌ Tipo de análisis no válido: {tipo}")
+            logger.error("❌ Tipo de análisis no válido: %s", tipo)
             return None
             
     except Exception as e:
-        print(f"❌ Error en análisis de ventas: {str(e)}")
+        logger.error("❌ Error en análisis de ventas: %s", str(e))
         import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.debug("Traceback: %s", traceback.format_exc())
         return None
 
 
@@ -334,15 +301,19 @@ def generar_analisis_categorias(fecha_inicio, fecha_fin):
     """
     try:
         # Cargar datos
-        facturas = cargar_facturas()
-        categorias = cargar_categorias()
-        clientes = cargar_clientes()
+        fecha_inicio, fecha_fin = normalizar_fecha(fecha_inicio), normalizar_fecha(fecha_fin)
+        version = version_datos('facturas', 'clientes', 'categorias', 'recursos')
+        catalogo = obtener_catalogo()
         
-        # Crear archivo PDF
-        filename = f"analisis_categorias_{fecha_inicio.replace('/', '-')}_{fecha_fin.replace('/', '-')}.pdf"
-        filepath = os.path.join('database', 'data', filename)
+        filepath, en_cache = cache_reportes.buscar(
+            f"analisis_categorias_{fecha_inicio.replace('/', '-')}_{fecha_fin.replace('/', '-')}",
+            {'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin}, version)
+        if en_cache:
+            return filepath
         
-        doc = SimpleDocTemplate(filepath, pagesize=letter,
+        # Crear archivo PDF
+        temporal = cache_reportes.ruta_temporal(filepath)
+        doc = SimpleDocTemplate(temporal, pagesize=letter,
                               rightMargin=40, leftMargin=40,
                               topMargin=40, bottomMargin=40)
         elements = []
@@ -380,61 +351,49 @@ def generar_analisis_categorias(fecha_inicio, fecha_fin):
         # Calcular ingresos por categoría y configuración
         ingresos_por_categoria = {}
         ingresos_por_configuracion = {}
-        total_ingresos_periodo = 0
         
-        for factura in facturas:
-            monto_factura = float(factura.get('montoTotal', 0))
-            total_ingresos_periodo += monto_factura
+        # Acumulados por instancia de los días del período
+        acumulados = cargar_acumulados_ingresos(fecha_inicio, fecha_fin)
+        total_ingresos_periodo = acumulados['monto']
+        
+        for id_instancia, acumulado in acumulados['instancias'].items():
+            monto = acumulado['monto']
             
-            # Analizar cada detalle de la factura
-            for detalle in factura.get('detalles', []):
-                id_instancia = detalle['idInstancia']
-                monto = float(detalle['monto'])
+            # Buscar la configuración de la instancia y su categoría
+            config_id = catalogo.configuracion_de_instancia(id_instancia)
+            config = catalogo.configuraciones.get(config_id)
+            
+            if config is not None:
+                categoria = catalogo.categoria_por_configuracion[config_id]
                 
-                # Buscar la configuración de la instancia
-                config_id = None
-                for cliente in clientes:
-                    for instancia in cliente.get('instancias', []):
-                        if str(instancia['id']) == str(id_instancia):
-                            config_id = instancia['idConfiguracion']
-                            break
-                    if config_id:
-                        break
+                # Acumular por categoría
+                cat_nombre = categoria['nombre']
+                if cat_nombre not in ingresos_por_categoria:
+                    ingresos_por_categoria[cat_nombre] = {
+                        'monto': 0,
+                        'instancias': 0,
+                        'configuraciones': set()
+                    }
+                ingresos_por_categoria[cat_nombre]['monto'] += monto
+                ingresos_por_categoria[cat_nombre]['instancias'] += acumulado['lineas']
+                ingresos_por_categoria[cat_nombre]['configuraciones'].add(config['nombre'])
                 
-                if config_id:
-                    # Buscar la categoría de la configuración
-                    for categoria in categorias:
-                        for config in categoria.get('configuraciones', []):
-                            if str(config['id']) == str(config_id):
-                                # Acumular por categoría
-                                cat_nombre = categoria['nombre']
-                                if cat_nombre not in ingresos_por_categoria:
-                                    ingresos_por_categoria[cat_nombre] = {
-                                        'monto': 0,
-                                        'instancias': 0,
-                                        'configuraciones': set()
-                                    }
-                                ingresos_por_categoria[cat_nombre]['monto'] += monto
-                                ingresos_por_categoria[cat_nombre]['instancias'] += 1
-                                ingresos_por_categoria[cat_nombre]['configuraciones'].add(config['nombre'])
-                                
-                                # Acumular por configuración
-                                config_nombre = f"{cat_nombre} - {config['nombre']}"
-                                if config_nombre not in ingresos_por_configuracion:
-                                    ingresos_por_configuracion[config_nombre] = {
-                                        'monto': 0,
-                                        'instancias': 0
-                                    }
-                                ingresos_por_configuracion[config_nombre]['monto'] += monto
-                                ingresos_por_configuracion[config_nombre]['instancias'] += 1
-                                break
+                # Acumular por configuración
+                config_nombre = f"{cat_nombre} - {config['nombre']}"
+                if config_nombre not in ingresos_por_configuracion:
+                    ingresos_por_configuracion[config_nombre] = {
+                        'monto': 0,
+                        'instancias': 0
+                    }
+                ingresos_por_configuracion[config_nombre]['monto'] += monto
+                ingresos_por_configuracion[config_nombre]['instancias'] += acumulado['lineas']
         
         # ========== RESUMEN GENERAL ==========
         elements.append(Paragraph("RESUMEN GENERAL", heading_style))
         
         resumen_data = [
             ['Total Ingresos en el Período:', f"Q {total_ingresos_periodo:.2f}"],
-            ['Total Facturas Emitidas:', str(len(facturas))],
+            ['Total Facturas Emitidas:', str(acumulados['facturas'])],
             ['Categorías Activas:', str(len(ingresos_por_categoria))],
             ['Configuraciones Utilizadas:', str(len(ingresos_por_configuracion))]
         ]
@@ -530,15 +489,18 @@ def generar_analisis_categorias(fecha_inicio, fecha_fin):
         elements.append(Paragraph(footer_text, styles['Normal']))
         
         # Construir PDF
-        doc.build(elements)
+        with metricas.medir('analisis_categorias', 'render'):
+            doc.build(elements)
+        with metricas.medir('analisis_categorias', 'escritura'):
+            cache_reportes.registrar(temporal, filepath)
         
-        print(f"✅ Análisis de categorías generado: {filepath}")
+        logger.info("✅ Análisis de categorías generado: %s", filepath)
         return filepath
         
     except Exception as e:
-        print(f"❌ Error generando análisis de categorías: {str(e)}")
+        logger.error("❌ Error generando análisis de categorías: %s", str(e))
         import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.debug("Traceback: %s", traceback.format_exc())
         return None
 
 
@@ -548,17 +510,19 @@ def generar_analisis_recursos(fecha_inicio, fecha_fin):
     """
     try:
         # Cargar datos
-        facturas = cargar_facturas()
-        recursos = cargar_recursos()
-        categorias = cargar_categorias()
-        clientes = cargar_clientes()
-        consumos = cargar_consumos()
+        fecha_inicio, fecha_fin = normalizar_fecha(fecha_inicio), normalizar_fecha(fecha_fin)
+        version = version_datos('facturas', 'clientes', 'categorias', 'recursos')
+        catalogo = obtener_catalogo()
         
-        # Crear archivo PDF
-        filename = f"analisis_recursos_{fecha_inicio.replace('/', '-')}_{fecha_fin.replace('/', '-')}.pdf"
-        filepath = os.path.join('database', 'data', filename)
+        filepath, en_cache = cache_reportes.buscar(
+            f"analisis_recursos_{fecha_inicio.replace('/', '-')}_{fecha_fin.replace('/', '-')}",
+            {'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin}, version)
+        if en_cache:
+            return filepath
         
-        doc = SimpleDocTemplate(filepath, pagesize=letter,
+        # Crear archivo PDF
+        temporal = cache_reportes.ruta_temporal(filepath)
+        doc = SimpleDocTemplate(temporal, pagesize=letter,
                               rightMargin=40, leftMargin=40,
                               topMargin=40, bottomMargin=40)
         elements = []
@@ -595,80 +559,49 @@ def generar_analisis_recursos(fecha_inicio, fecha_fin):
         
         # Calcular ingresos por recurso
         ingresos_por_recurso = {}
-        total_ingresos_periodo = 0
-        total_horas_consumidas = 0
         
-        for factura in facturas:
-            monto_factura = float(factura.get('montoTotal', 0))
-            total_ingresos_periodo += monto_factura
+        # Acumulados por instancia de los días del período
+        acumulados = cargar_acumulados_ingresos(fecha_inicio, fecha_fin)
+        total_ingresos_periodo = acumulados['monto']
+        total_horas_consumidas = acumulados['horas']
+        
+        for id_instancia, acumulado in acumulados['instancias'].items():
+            tiempo_total = acumulado['horas']
+            lineas = acumulado['lineas']
             
-            # Analizar cada detalle de la factura
-            for detalle in factura.get('detalles', []):
-                id_instancia = detalle['idInstancia']
-                tiempo_total = float(detalle['tiempoTotal'])
-                monto = float(detalle['monto'])
-                total_horas_consumidas += tiempo_total
-                
-                # Buscar la configuración de la instancia
-                config_id = None
-                for cliente in clientes:
-                    for instancia in cliente.get('instancias', []):
-                        if str(instancia['id']) == str(id_instancia):
-                            config_id = instancia['idConfiguracion']
-                            break
-                    if config_id:
-                        break
-                
-                if config_id:
-                    # Buscar recursos de la configuración
-                    config_recursos = None
-                    for categoria in categorias:
-                        for config in categoria.get('configuraciones', []):
-                            if str(config['id']) == str(config_id):
-                                config_recursos = config.get('recursos', {})
-                                break
-                        if config_recursos:
-                            break
+            # Recursos de la configuración de la instancia
+            config_id = catalogo.configuracion_de_instancia(id_instancia)
+            config_recursos = catalogo.recursos_por_configuracion.get(config_id)
+            
+            if config_recursos:
+                # Calcular aporte de cada recurso
+                for recurso_info, cant, valor_hora in config_recursos:
+                    ingreso_recurso = valor_hora * cant * tiempo_total
+                    
+                    recurso_nombre = recurso_info['nombre']
+                    if recurso_nombre not in ingresos_por_recurso:
+                        ingresos_por_recurso[recurso_nombre] = {
+                            'monto': 0,
+                            'tipo': recurso_info['tipo_recurso'],
+                            'abreviatura': recurso_info['abreviatura'],
+                            'metrica': recurso_info['metrica'],
+                            'valor_hora': valor_hora,
+                            'horas_totales': 0,
+                            'cantidad_total': 0,
+                            'instancias': 0
+                        }
                     
-                    if config_recursos:
-                        # Calcular aporte de cada recurso
-                        for recurso_id, cantidad in config_recursos.items():
-                            # Buscar info del recurso
-                            recurso_info = None
-                            for recurso in recursos:
-                                if str(recurso['id']) == str(recurso_id):
-                                    recurso_info = recurso
-                                    break
-                            
-                            if recurso_info:
-                                valor_hora = float(recurso_info['valor_x_hora'])
-                                cant = float(cantidad)
-                                ingreso_recurso = valor_hora * cant * tiempo_total
-                                
-                                recurso_nombre = recurso_info['nombre']
-                                if recurso_nombre not in ingresos_por_recurso:
-                                    ingresos_por_recurso[recurso_nombre] = {
-                                        'monto': 0,
-                                        'tipo': recurso_info['tipo_recurso'],
-                                        'abreviatura': recurso_info['abreviatura'],
-                                        'metrica': recurso_info['metrica'],
-                                        'valor_hora': valor_hora,
-                                        'horas_totales': 0,
-                                        'cantidad_total': 0,
-                                        'instancias': 0
-                                    }
-                                
-                                ingresos_por_recurso[recurso_nombre]['monto'] += ingreso_recurso
-                                ingresos_por_recurso[recurso_nombre]['horas_totales'] += tiempo_total
-                                ingresos_por_recurso[recurso_nombre]['cantidad_total'] += cant
-                                ingresos_por_recurso[recurso_nombre]['instancias'] += 1
+                    ingresos_por_recurso[recurso_nombre]['monto'] += ingreso_recurso
+                    ingresos_por_recurso[recurso_nombre]['horas_totales'] += tiempo_total
+                    ingresos_por_recurso[recurso_nombre]['cantidad_total'] += cant * lineas
+                    ingresos_por_recurso[recurso_nombre]['instancias'] += lineas
         
         # ========== RESUMEN GENERAL ==========
         elements.append(Paragraph("RESUMEN GENERAL", heading_style))
         
         resumen_data = [
             ['Total Ingresos en el Período:', f"Q {total_ingresos_periodo:.2f}"],
-            ['Total Facturas Emitidas:', str(len(facturas))],
+            ['Total Facturas Emitidas:', str(acumulados['facturas'])],
             ['Total Horas Consumidas:', f"{total_horas_consumidas:.2f} horas"],
             ['Recursos Diferentes Utilizados:', str(len(ingresos_por_recurso))],
             ['Ingreso Promedio por Hora:', f"Q {total_ingresos_periodo/total_horas_consumidas:.2f}" if total_horas_consumidas > 0 else "Q 0.00"]
@@ -828,13 +761,16 @@ def generar_analisis_recursos(fecha_inicio, fecha_fin):
         elements.append(Paragraph(footer_text, styles['Normal']))
         
         # Construir PDF
-        doc.build(elements)
+        with metricas.medir('analisis_recursos', 'render'):
+            doc.build(elements)
+        with metricas.medir('analisis_recursos', 'escritura'):
+            cache_reportes.registrar(temporal, filepath)
         
-        print(f"✅ Análisis de recursos generado: {filepath}")
+        logger.info("✅ Análisis de recursos generado: %s", filepath)
         return filepath
         
     except Exception as e:
-        print(f"❌ Error generando análisis de recursos: {str(e)}")
+        logger.error("❌ Error generando análisis de recursos: %s", str(e))
         import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.debug("Traceback: %s", traceback.format_exc())
         return None
\ No newline at end of file
@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+import config
+from services.report_service import generar_reporte_factura, generar_analisis_ventas
+from utils import metricas, perfilado
+
+logger = logging.getLogger(__name__)
+
+# Estados posibles de un trabajo
+PENDIENTE = 'pendiente'
+EN_PROCESO = 'en_proceso'
+COMPLETADO = 'completado'
+ERROR = 'error'
+
+# ========== POOL DE PROCESOS ==========
+# El render con ReportLab es CPU puro, así que se hace en procesos aparte y la
+# petición HTTP solo encola el trabajo. El estado de cada trabajo vive en
+# TRABAJOS_DIR/<id>.json para que cualquier worker del servidor pueda consultarlo.
+_pool = None
+_pool_lock = threading.Lock()
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Los procesos heredan (fork) las métricas del principal; se vacían al
+            # arrancar para que extraer() devuelva solo lo medido en el proceso
+            _pool = ProcessPoolExecutor(max_workers=config.REPORTES_WORKERS, initializer=_vaciar_metricas)
+            logger.debug("⚙️ Pool de reportes iniciado con %s procesos", config.REPORTES_WORKERS)
+        return _pool
+
+def _vaciar_metricas():
+    metricas.extraer()
+
+def _reiniciar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+# ========== ESTADO DE LOS TRABAJOS ==========
+def _ruta_trabajo(trabajo_id):
+    return os.path.join(config.TRABAJOS_DIR, f'{trabajo_id}.json')
+
+def _guardar_estado(trabajo):
+    """Escribe el estado con os.replace para que nunca se lea a medias"""
+    os.makedirs(config.TRABAJOS_DIR, exist_ok=True)
+    trabajo['actualizado'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    descriptor, temporal = tempfile.mkstemp(dir=config.TRABAJOS_DIR, prefix='.', suffix='.tmp')
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+        json.dump(trabajo, f, ensure_ascii=False)
+    os.replace(temporal, _ruta_trabajo(trabajo['id']))
+
+def obtener_trabajo(trabajo_id):
+    """Devuelve el estado del trabajo o None si no existe"""
+    # Los IDs son hexadecimales; cualquier otra cosa no puede ser un trabajo
+    if not trabajo_id or not all(c in '0123456789abcdef' for c in trabajo_id):
+        return None
+    try:
+        with open(_ruta_trabajo(trabajo_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _marcar(trabajo_id, estado, **campos):
+    trabajo = obtener_trabajo(trabajo_id)
+    if trabajo is None:
+        return
+    # Un trabajo terminado no vuelve atrás (p. ej. si el callback llega tarde)
+    if trabajo['estado'] in (COMPLETADO, ERROR):
+        return
+    trabajo.update(campos, estado=estado)
+    _guardar_estado(trabajo)
+
+# ========== EJECUCIÓN ==========
+def _ejecutar_trabajo(trabajo_id, tipo, parametros, perfil=None):
+    """
+    Corre dentro de un proceso del pool. Devuelve (pdf_path, métricas medidas en
+    el proceso) para que el proceso principal las sume a las de /metrics.
+    `perfil` = (id, modo) perfila el render cuando la petición lo pidió.
+    """
+    _marcar(trabajo_id, EN_PROCESO)
+    try:
+        with _perfilar_si(perfil, f'reporte {tipo} {trabajo_id}'), metricas.medir(f'reporte_{tipo}', 'total'):
+            if tipo == 'factura':
+                pdf_path = generar_reporte_factura(parametros.get('numero_factura'))
+            else:
+                pdf_path = generar_analisis_ventas(parametros.get('tipo'), parametros.get('fecha_inicio'), parametros.get('fecha_fin'))
+    except Exception as e:
+        _marcar(trabajo_id, ERROR, error=str(e))
+        return None, metricas.extraer()
+
+    if pdf_path:
+        _marcar(trabajo_id, COMPLETADO, pdf_path=os.path.abspath(pdf_path))
+    else:
+        _marcar(trabajo_id, ERROR, error='No se pudo generar el reporte')
+    return pdf_path, metricas.extraer()
+
+def _perfilar_si(perfil, descripcion):
+    if perfil is None:
+        return nullcontext()
+    perfil_id, modo = perfil
+    return perfilado.perfilar(perfil_id, modo, descripcion)
+
+def _al_terminar(trabajo_id):
+    def callback(futuro):
+        # Cubre los casos en que el proceso murió sin poder marcar el error
+        excepcion = futuro.exception() if not futuro.cancelled() else None
+        if futuro.cancelled() or excepcion is not None:
+            _marcar(trabajo_id, ERROR, error=str(excepcion) if excepcion else 'Trabajo cancelado')
+            return
+        _, medidas = futuro.result()
+        metricas.combinar(medidas)
+    return callback
+
+def encolar_reporte(tipo, parametros, perfil=None):
+    """
+    Registra el trabajo, lo envía al pool y devuelve su estado inicial sin esperar el PDF.
+    `perfil` = (id, modo) perfila el render dentro del proceso del pool.
+    """
+    trabajo = {
+        'id': uuid.uuid4().hex,
+        'tipo': tipo,
+        'parametros': parametros,
+        'estado': PENDIENTE,
+        'pdf_path': None,
+        'error': None,
+        'creado': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    }
+    _guardar_estado(trabajo)
+
+    try:
+        futuro = _obtener_pool().submit(_ejecutar_trabajo, trabajo['id'], tipo, parametros, perfil)
+    except Exception as e:
+        # Un pool roto (proceso muerto) no acepta más trabajos; se recrea una vez
+        logger.warning("⚠️ Pool de reportes no disponible (%s), reiniciando...", e)
+        _reiniciar_pool()
+        futuro = _obtener_pool().submit(_ejecutar_trabajo, trabajo['id'], tipo, parametros, perfil)
+    futuro.add_done_callback(_al_terminar(trabajo['id']))
+
+    logger.debug("📨 Reporte encolado: %s (%s)", trabajo['id'], tipo)
+    return trabajo
@@ -0,0 +1,44 @@
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+
+# Los tests escriben en un directorio temporal propio. config lee estas
+# variables al importarse, así que se fijan antes de importar el backend.
+_DATOS = tempfile.mkdtemp(prefix='ipc2-tests-')
+os.environ['ALMACENAMIENTO'] = 'xml'
+os.environ['XML_DATA_DIR'] = os.path.join(_DATOS, 'xml')
+os.environ['SQLITE_PATH'] = os.path.join(_DATOS, 'ipc2.sqlite3')
+os.environ['TRABAJOS_DIR'] = os.path.join(_DATOS, 'trabajos')
+os.environ['REPORTES_CACHE_DIR'] = os.path.join(_DATOS, 'reportes')
+os.environ['PERFILES_DIR'] = os.path.join(_DATOS, 'perfiles')
+# Dos procesos aunque la máquina tenga un solo núcleo, para probar el motor paralelo de verdad
+os.environ['FACTURACION_WORKERS'] = '2'
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Archivos de ejemplo del proyecto
+MUESTRA_CONFIGURACION = os.path.join(os.path.dirname(BACKEND_DIR), 'Pueba_config.xml')
+MUESTRA_CONSUMOS = os.path.join(os.path.dirname(BACKEND_DIR), 'prueba_consumo.xml')
+
+@pytest.fixture(scope='session', autouse=True)
+def _limpiar_datos():
+    yield
+    shutil.rmtree(_DATOS, ignore_errors=True)
+
+@pytest.fixture
+def cargar_muestra():
+    """Vacía el almacenamiento y carga los archivos de ejemplo por los servicios de carga"""
+    from database.storage import reset_database
+    from services.config_service import procesar_configuracion_stream
+    from services.consumo_service import procesar_consumo_stream
+
+    def cargar():
+        reset_database()
+        with open(MUESTRA_CONFIGURACION, 'rb') as f:
+            procesar_configuracion_stream(f)
+        with open(MUESTRA_CONSUMOS, 'rb') as f:
+            procesar_consumo_stream(f)
+    return cargar
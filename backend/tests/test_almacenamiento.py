@@ -0,0 +1,97 @@
+import pytest
+from database import xml_storage, sqlite_storage
+from database.models import Recurso, Configuracion, Categoria, Cliente, Instancia, Consumo, Factura
+
+RECURSOS = [
+    Recurso('1', 'Núcleo', 'CPU', 'núcleos', 'Hardware', 12.5),
+    Recurso('2', 'Memoria', 'RAM', 'GiB', 'Hardware', 3.75),
+]
+CATEGORIAS = [
+    Categoria('10', 'Cómputo', 'Servidores', 'web', [
+        Configuracion('100', 'Pequeña', 'Dos núcleos', {'1': '2', '2': '4'}),
+        Configuracion('101', 'Grande', 'Ocho núcleos', {'1': '8', '2': '32'}),
+    ]),
+]
+CLIENTES = [
+    Cliente('1234-5', 'Empresa & Cía', 'empresa', 'clave', 'Zona 1', 'a@b.gt', [
+        Instancia('7', '100', 'web', '01/10/2024', 'Vigente'),
+        Instancia('8', '101', 'bd', '01/10/2024', 'Cancelada', '20/10/2024'),
+    ]),
+]
+CONSUMOS = [
+    Consumo('1234-5', '7', 1.5, '05/10/2024 10:00'),
+    Consumo('1234-5', '8', 2.25, '12/11/2024 08:30'),
+    Consumo('1234-5', '7', 0.5, 'fecha ilegible'),
+]
+
+@pytest.fixture(params=['xml', 'sqlite'])
+def almacenamiento(request):
+    modulo = xml_storage if request.param == 'xml' else sqlite_storage
+    modulo.reset_database()
+    return modulo
+
+def _guardar_configuracion(modulo):
+    modulo.guardar_recursos(RECURSOS)
+    modulo.guardar_categorias(CATEGORIAS)
+    modulo.guardar_clientes(CLIENTES)
+
+def test_configuracion_ida_y_vuelta(almacenamiento):
+    _guardar_configuracion(almacenamiento)
+    assert almacenamiento.cargar_recursos() == [r.a_dict() for r in RECURSOS]
+    assert almacenamiento.cargar_categorias() == [c.a_dict() for c in CATEGORIAS]
+    assert almacenamiento.cargar_clientes() == [c.a_dict() for c in CLIENTES]
+    assert almacenamiento.cargar_huellas('cliente') == {c.nit: c.huella() for c in CLIENTES}
+
+def test_consumos_y_facturas_ida_y_vuelta(almacenamiento):
+    almacenamiento.guardar_consumos(CONSUMOS)
+    consumos = almacenamiento.cargar_consumos()
+    assert [(c.nit_cliente, c.id_instancia, c.tiempo, c.fecha_hora) for c in consumos] == \
+        [(c.nit_cliente, c.id_instancia, c.tiempo, c.fecha_hora) for c in CONSUMOS]
+    assert len({c.id for c in consumos}) == len(CONSUMOS)
+    assert [c.fecha_hora for c in almacenamiento.cargar_consumos('01/10/2024', '31/10/2024')] == ['05/10/2024 10:00']
+
+    numero = f'FACT-20241031-{almacenamiento.reservar_secuencia("facturas"):08d}'
+    factura = Factura(numero, '1234-5', '31/10/2024', 18.75,
+                      [{'id_instancia': '7', 'tiempo_total': 1.5, 'monto': 18.75}])
+    almacenamiento.guardar_facturacion([factura], {numero: [consumos[0].id]})
+
+    assert [Factura.desde_dict(f) for f in almacenamiento.cargar_facturas()] == [factura]
+    assert Factura.desde_dict(almacenamiento.cargar_factura(numero)) == factura
+    assert almacenamiento.cargar_factura('no-existe') is None
+    assert almacenamiento.cargar_numeros_factura('1234-5') == [numero]
+    assert almacenamiento.cargar_consumos_facturados() == {consumos[0].id: numero}
+    assert almacenamiento.cargar_consumos_facturados('01/11/2024', '30/11/2024') == {}
+    assert almacenamiento.cargar_acumulados_ingresos('31/10/2024', '31/10/2024')['monto'] == pytest.approx(18.75)
+
+def test_importar_y_exportar_entre_backends():
+    xml_storage.reset_database()
+    _guardar_configuracion(xml_storage)
+    xml_storage.guardar_consumos(CONSUMOS)
+    consumo = xml_storage.cargar_consumos()[1]
+    factura = Factura('FACT-20241130-00000001', '1234-5', '30/11/2024', 393.75,
+                      [{'id_instancia': '8', 'tiempo_total': 2.25, 'monto': 393.75}])
+    xml_storage.guardar_facturacion([factura], {factura.numero_factura: [consumo.id]})
+
+    sqlite_storage.importar_desde_xml()
+    sqlite_storage.exportar_a_xml()
+
+    for modulo in (sqlite_storage, xml_storage):
+        assert modulo.cargar_recursos() == [r.a_dict() for r in RECURSOS]
+        assert modulo.cargar_clientes() == [c.a_dict() for c in CLIENTES]
+        assert [Factura.desde_dict(f) for f in modulo.cargar_facturas()] == [factura]
+        consumos = modulo.cargar_consumos()
+        assert [c.fecha_hora for c in consumos] == [c.fecha_hora for c in CONSUMOS]
+        assert modulo.cargar_consumos_facturados() == {consumos[1].id: factura.numero_factura}
+
+def test_carga_de_consumos_se_guarda_solo_al_confirmar(almacenamiento):
+    carga = almacenamiento.iniciar_carga_consumos()
+    almacenamiento.agregar_a_carga_consumos(carga, CONSUMOS[:2])
+    almacenamiento.agregar_a_carga_consumos(carga, CONSUMOS[2:])
+    assert almacenamiento.cargar_consumos() == []
+    assert almacenamiento.confirmar_carga_consumos(carga) == len(CONSUMOS)
+    assert len(almacenamiento.cargar_consumos()) == len(CONSUMOS)
+
+    descartada = almacenamiento.iniciar_carga_consumos()
+    almacenamiento.agregar_a_carga_consumos(descartada, CONSUMOS)
+    almacenamiento.descartar_carga_consumos(descartada)
+    assert len(almacenamiento.cargar_consumos()) == len(CONSUMOS)
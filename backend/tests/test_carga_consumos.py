@@ -0,0 +1,25 @@
+import io
+from database.storage import reset_database, cargar_consumos
+from services.consumo_service import procesar_consumo_stream
+
+CONSUMO = '''<consumo nitCliente="12345-6" idInstancia="1">
+    <tiempo>1.5</tiempo>
+    <fechahora>15/10/2024 08:30</fechahora>
+  </consumo>'''
+
+def _documento(consumos, cierre='</listadoConsumos>'):
+    return f'<?xml version="1.0"?>\n<listadoConsumos>\n{consumos}\n{cierre}'.encode('utf-8')
+
+def test_carga_valida_guarda_todos_los_lotes():
+    reset_database()
+    resultado = procesar_consumo_stream(io.BytesIO(_documento(CONSUMO * 5)), tamano_lote=2)
+    assert 'error' not in resultado
+    assert resultado['consumos_guardados'] == 5
+    assert len(cargar_consumos()) == 5
+
+def test_carga_invalida_no_guarda_nada():
+    reset_database()
+    resultado = procesar_consumo_stream(io.BytesIO(_documento(CONSUMO * 5, '</otraEtiqueta>')), tamano_lote=2)
+    assert 'error' in resultado
+    assert resultado['consumos_guardados'] == 0
+    assert cargar_consumos() == []
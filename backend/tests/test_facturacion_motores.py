@@ -0,0 +1,44 @@
+import pytest
+from database.storage import cargar_consumos, cargar_facturas
+from services.catalogo_service import obtener_catalogo
+from services.facturacion_service import generar_facturas, calcular_cuentas_clientes
+from services.facturacion_vectorizada import calcular_cuentas_vectorizado, NUMPY_DISPONIBLE
+from services.facturacion_paralela import calcular_cuentas_paralelo
+
+def _cuentas(cuentas):
+    """Cuentas comparables sin depender del orden de los clientes"""
+    return sorted(
+        (nit, round(total, 2), tuple((d['id_instancia'], d['tiempo_total'], d['monto']) for d in detalles))
+        for nit, total, detalles in cuentas
+    )
+
+def test_motores_calculan_las_mismas_cuentas(cargar_muestra):
+    cargar_muestra()
+    consumos = cargar_consumos()
+    catalogo = obtener_catalogo()
+    assert consumos
+
+    estandar = _cuentas(calcular_cuentas_clientes(consumos, catalogo))
+    assert estandar and all(total > 0 for _, total, _ in estandar)
+    assert _cuentas(calcular_cuentas_paralelo(consumos, catalogo, 2)) == estandar
+    if NUMPY_DISPONIBLE:
+        assert _cuentas(calcular_cuentas_vectorizado(consumos, catalogo)) == estandar
+
+@pytest.mark.parametrize('motor', ['vectorizado', 'paralelo'])
+def test_facturacion_da_los_mismos_totales_con_cada_motor(cargar_muestra, motor):
+    if motor == 'vectorizado' and not NUMPY_DISPONIBLE:
+        pytest.skip('numpy no está instalado')
+
+    totales = {}
+    for motor_usado in ('estandar', motor):
+        cargar_muestra()
+        resultado = generar_facturas('01/01/2020', '31/12/2030', motor_usado)
+        assert 'error' not in resultado
+        assert resultado['facturas_generadas'] > 0
+        totales[motor_usado] = sorted((f['nitCliente'], f['montoTotal']) for f in cargar_facturas())
+    assert totales[motor] == totales['estandar']
+
+def test_facturacion_no_repite_consumos(cargar_muestra):
+    cargar_muestra()
+    assert generar_facturas('01/01/2020', '31/12/2030')['facturas_generadas'] > 0
+    assert generar_facturas('01/01/2020', '31/12/2030')['facturas_generadas'] == 0
@@ -0,0 +1,47 @@
+import os
+
+# ========== CANDADOS ENTRE PROCESOS ==========
+# Un candado exclusivo sobre "<ruta>.lock" (flock en POSIX, msvcrt en Windows).
+# Lo usan los almacenamientos para serializar escrituras y la facturación para
+# que dos corridas no facturen los mismos consumos.
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+class _BloqueoArchivo:
+    def __init__(self, ruta):
+        self.ruta_bloqueo = ruta + '.lock'
+        self._archivo = None
+    
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.ruta_bloqueo), exist_ok=True)
+        self._archivo = open(self.ruta_bloqueo, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_EX)
+        else:
+            self._archivo.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._archivo.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK se rinde tras 10 intentos; se sigue esperando
+                    continue
+        return self
+    
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+            else:
+                self._archivo.seek(0)
+                msvcrt.locking(self._archivo.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._archivo.close()
+        return False
+
+def bloqueo_archivo(ruta):
+    """Candado exclusivo entre procesos para escribir ruta (archivo o directorio de un log)"""
+    return _BloqueoArchivo(ruta)
@@ -1 +1,26 @@
- 
+def marca_tiempo(fecha_hora):
+    """'DD/MM/AAAA HH:MM' -> AAAAMMDDHHMM como entero (0 si no se puede leer)"""
+    try:
+        return int(fecha_hora[6:10] + fecha_hora[3:5] + fecha_hora[0:2] + (fecha_hora[11:13] or '00') + (fecha_hora[14:16] or '00'))
+    except (ValueError, TypeError):
+        return 0
+
+def rango_marcas(fecha_inicio, fecha_fin):
+    """Marcas inclusivas desde el inicio del primer día hasta el final del último ('DD/MM/AAAA')"""
+    return marca_tiempo(fecha_inicio[:10] + ' 00:00'), marca_tiempo(fecha_fin[:10] + ' 23:59')
+
+def mes_de_fecha(fecha):
+    """'DD/MM/AAAA ...' -> 'AAAA-MM', o None si la fecha no se puede leer"""
+    if not marca_tiempo(fecha):
+        return None
+    return f"{fecha[6:10]}-{fecha[3:5]}"
+
+def dia_de_fecha(fecha):
+    """'DD/MM/AAAA ...' -> AAAAMMDD como entero (0 si la fecha no se puede leer)"""
+    return marca_tiempo((fecha or '')[:10] + ' 00:00') // 10000
+
+def normalizar_fecha(fecha):
+    """Acepta 'AAAA-MM-DD' (formularios HTML) o 'DD/MM/AAAA' y devuelve 'DD/MM/AAAA'"""
+    if fecha and len(fecha) == 10 and fecha[4] == '-' and fecha[7] == '-':
+        return f"{fecha[8:10]}/{fecha[5:7]}/{fecha[0:4]}"
+    return fecha
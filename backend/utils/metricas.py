@@ -0,0 +1,129 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# ========== MÉTRICAS EN MEMORIA ==========
+# Contadores e histogramas del proceso, expuestos en /metrics con el formato
+# de texto de Prometheus. Cada serie se identifica por su nombre y sus
+# etiquetas. Los procesos de los pools (reportes) miden por su cuenta y
+# devuelven lo medido con extraer(); el proceso principal lo suma con combinar().
+
+# Límites superiores de las cubetas de los histogramas de duración, en segundos
+CUBETAS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+DESCRIPCIONES = {
+    'ipc2_etapa_segundos': ('histogram', 'Duración de cada etapa (parseo, carga, cálculo, render, escritura) por operación'),
+    'ipc2_registros_total': ('counter', 'Registros procesados por operación y tipo'),
+    'ipc2_reportes_cache_total': ('counter', 'Búsquedas en la caché de reportes PDF por resultado'),
+    'ipc2_peticiones_total': ('counter', 'Peticiones HTTP atendidas por ruta, método y código'),
+    'ipc2_peticion_segundos': ('histogram', 'Duración de las peticiones HTTP por ruta'),
+}
+
+_lock = threading.Lock()
+_contadores = {}
+_histogramas = {}
+
+def _clave(nombre, etiquetas):
+    return nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+def contar(nombre, valor=1, **etiquetas):
+    """Suma `valor` al contador `nombre` con las etiquetas dadas"""
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+
+def observar(nombre, valor, **etiquetas):
+    """Registra una observación en el histograma `nombre`"""
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        histograma = _histogramas.get(clave)
+        if histograma is None:
+            histograma = _histogramas[clave] = [[0] * len(CUBETAS_SEGUNDOS), 0.0, 0]
+        indice = bisect_left(CUBETAS_SEGUNDOS, valor)
+        if indice < len(CUBETAS_SEGUNDOS):
+            histograma[0][indice] += 1
+        histograma[1] += valor
+        histograma[2] += 1
+
+@contextmanager
+def medir(operacion, etapa):
+    """Mide la duración del bloque como una etapa de la operación"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar('ipc2_etapa_segundos', time.perf_counter() - inicio, operacion=operacion, etapa=etapa)
+
+# ========== ENTRE PROCESOS ==========
+def extraer():
+    """Devuelve lo medido hasta ahora y lo borra (para enviarlo desde un proceso del pool)"""
+    with _lock:
+        datos = {
+            'contadores': list(_contadores.items()),
+            'histogramas': [(clave, [list(h[0]), h[1], h[2]]) for clave, h in _histogramas.items()]
+        }
+        _contadores.clear()
+        _histogramas.clear()
+    return datos
+
+def combinar(datos):
+    """Suma lo extraído en otro proceso a las métricas de este"""
+    with _lock:
+        for (nombre, etiquetas), valor in datos.get('contadores', []):
+            clave = (nombre, tuple(tuple(par) for par in etiquetas))
+            _contadores[clave] = _contadores.get(clave, 0) + valor
+        for (nombre, etiquetas), (cubetas, suma, cuenta) in datos.get('histogramas', []):
+            clave = (nombre, tuple(tuple(par) for par in etiquetas))
+            histograma = _histogramas.setdefault(clave, [[0] * len(CUBETAS_SEGUNDOS), 0.0, 0])
+            histograma[0] = [a + b for a, b in zip(histograma[0], cubetas)]
+            histograma[1] += suma
+            histograma[2] += cuenta
+
+# ========== FORMATO PROMETHEUS ==========
+def _etiquetas_texto(etiquetas):
+    if not etiquetas:
+        return ''
+    pares = ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in etiquetas)
+    return '{' + pares + '}'
+
+def exportar_prometheus(medidores=None):
+    """
+    Texto en el formato de exposición de Prometheus. `medidores` agrega
+    valores leídos en el momento: {nombre: (tipo, descripción, [(etiquetas_dict, valor)])}.
+    """
+    with _lock:
+        contadores = sorted(_contadores.items())
+        histogramas = sorted((clave, [list(h[0]), h[1], h[2]]) for clave, h in _histogramas.items())
+
+    lineas = []
+    encabezados = set()
+    def encabezado(nombre, tipo=None, ayuda=None):
+        if nombre in encabezados:
+            return
+        encabezados.add(nombre)
+        tipo_descrito, ayuda_descrita = DESCRIPCIONES.get(nombre, (tipo, ayuda))
+        if ayuda or ayuda_descrita:
+            lineas.append(f'# HELP {nombre} {ayuda or ayuda_descrita}')
+        lineas.append(f'# TYPE {nombre} {tipo or tipo_descrito or "untyped"}')
+
+    for (nombre, etiquetas), valor in contadores:
+        encabezado(nombre, 'counter')
+        lineas.append(f'{nombre}{_etiquetas_texto(etiquetas)} {valor}')
+
+    for (nombre, etiquetas), (cubetas, suma, cuenta) in histogramas:
+        encabezado(nombre, 'histogram')
+        acumulado = 0
+        for limite, cantidad in zip(CUBETAS_SEGUNDOS, cubetas):
+            acumulado += cantidad
+            lineas.append(f'{nombre}_bucket{_etiquetas_texto(etiquetas + (("le", str(limite)),))} {acumulado}')
+        lineas.append(f'{nombre}_bucket{_etiquetas_texto(etiquetas + (("le", "+Inf"),))} {cuenta}')
+        lineas.append(f'{nombre}_sum{_etiquetas_texto(etiquetas)} {suma}')
+        lineas.append(f'{nombre}_count{_etiquetas_texto(etiquetas)} {cuenta}')
+
+    for nombre, (tipo, ayuda, valores) in (medidores or {}).items():
+        encabezado(nombre, tipo, ayuda)
+        for etiquetas, valor in valores:
+            lineas.append(f'{nombre}{_etiquetas_texto(tuple(sorted((k, str(v)) for k, v in etiquetas.items())))} {valor}')
+
+    return '\n'.join(lineas) + '\n'
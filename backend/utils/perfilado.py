@@ -0,0 +1,146 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+import config
+
+logger = logging.getLogger(__name__)
+
+# ========== PERFILADO BAJO DEMANDA ==========
+# Una petición se perfila solo si PERFILADO_HABILITADO está activo y la pide
+# con la cabecera X-Perfilar o el parámetro ?perfilar=. Cada perfil queda en
+# PERFILES_DIR con el ID de la petición:
+#   cprofile -> <id>.prof (pstats, para snakeviz o pstats) y <id>.txt (resumen)
+#   muestreo -> <id>.folded (pilas colapsadas, listas para flamegraph.pl o speedscope)
+
+MODOS = ('cprofile', 'muestreo')
+CABECERA = 'X-Perfilar'
+PARAMETRO = 'perfilar'
+
+# Funciones listadas en el resumen de texto de cprofile
+FUNCIONES_RESUMEN = 40
+
+# cProfile no admite dos perfiles activos a la vez en el mismo hilo; por
+# simplicidad se perfila una petición a la vez en cada proceso
+_lock_cprofile = threading.Lock()
+
+def modo_solicitado(valor):
+    """Convierte el valor de la cabecera o del parámetro en un modo, o None si no pide perfil"""
+    if valor is None:
+        return None
+    valor = valor.strip().lower()
+    if valor in ('', '0', 'false', 'no'):
+        return None
+    if valor in MODOS:
+        return valor
+    return 'cprofile'
+
+def id_perfil(sugerido=None):
+    """Usa el ID de petición recibido si es seguro como nombre de archivo; si no, genera uno"""
+    if sugerido and re.fullmatch(r'[A-Za-z0-9_-]{1,64}', sugerido):
+        return sugerido
+    return uuid.uuid4().hex
+
+class Perfilador:
+    """Perfila lo que ocurra en el hilo actual entre iniciar() y detener()"""
+
+    def __init__(self, perfil_id, modo='cprofile', descripcion=''):
+        self.perfil_id = perfil_id
+        self.modo = modo
+        self.descripcion = descripcion
+        self._perfil = None
+        self._muestras = Counter()
+        self._detener_muestreo = threading.Event()
+        self._hilo_muestreo = None
+        self._inicio = None
+
+    def iniciar(self):
+        self._inicio = time.perf_counter()
+        if self.modo == 'muestreo':
+            objetivo = threading.get_ident()
+            self._hilo_muestreo = threading.Thread(target=self._muestrear, args=(objetivo,), daemon=True)
+            self._hilo_muestreo.start()
+            return True
+        if not _lock_cprofile.acquire(blocking=False):
+            logger.warning("⚠️ Perfil %s omitido: ya hay otro cprofile en curso", self.perfil_id)
+            return False
+        self._perfil = cProfile.Profile()
+        self._perfil.enable()
+        return True
+
+    def detener(self):
+        """Detiene el perfil, lo guarda y devuelve las rutas escritas"""
+        duracion = time.perf_counter() - self._inicio if self._inicio else 0.0
+        if self._hilo_muestreo is not None:
+            self._detener_muestreo.set()
+            self._hilo_muestreo.join()
+            self._hilo_muestreo = None
+            return self._guardar_muestras(duracion)
+        if self._perfil is not None:
+            self._perfil.disable()
+            perfil, self._perfil = self._perfil, None
+            _lock_cprofile.release()
+            return self._guardar_cprofile(perfil, duracion)
+        return []
+
+    # ========== MUESTREO ==========
+    def _muestrear(self, objetivo):
+        """Toma la pila del hilo perfilado cada PERFILADO_INTERVALO segundos"""
+        while not self._detener_muestreo.wait(config.PERFILADO_INTERVALO):
+            frame = sys._current_frames().get(objetivo)
+            if frame is None:
+                break
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append(f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})')
+                frame = frame.f_back
+            # Formato colapsado: de la raíz a la hoja, separadas por ';'
+            self._muestras[';'.join(reversed(pila))] += 1
+
+    def _guardar_muestras(self, duracion):
+        ruta = self._ruta('folded')
+        with open(ruta, 'w', encoding='utf-8') as f:
+            for pila, cantidad in self._muestras.most_common():
+                f.write(f'{pila} {cantidad}\n')
+        logger.info("🔬 Perfil %s (%s, %.3fs, %s muestras): %s",
+                    self.perfil_id, self.descripcion, duracion, sum(self._muestras.values()), ruta)
+        return [ruta]
+
+    # ========== CPROFILE ==========
+    def _guardar_cprofile(self, perfil, duracion):
+        ruta_prof = self._ruta('prof')
+        perfil.dump_stats(ruta_prof)
+
+        resumen = io.StringIO()
+        resumen.write(f'# {self.descripcion}\n# duración: {duracion:.3f}s\n\n')
+        pstats.Stats(perfil, stream=resumen).sort_stats('cumulative').print_stats(FUNCIONES_RESUMEN)
+        ruta_txt = self._ruta('txt')
+        with open(ruta_txt, 'w', encoding='utf-8') as f:
+            f.write(resumen.getvalue())
+
+        logger.info("🔬 Perfil %s (%s, %.3fs): %s", self.perfil_id, self.descripcion, duracion, ruta_prof)
+        return [ruta_prof, ruta_txt]
+
+    def _ruta(self, extension):
+        os.makedirs(config.PERFILES_DIR, exist_ok=True)
+        return os.path.join(config.PERFILES_DIR, f'{self.perfil_id}.{extension}')
+
+@contextmanager
+def perfilar(perfil_id, modo='cprofile', descripcion=''):
+    """Perfila el bloque y guarda el resultado al salir, aunque falle"""
+    perfilador = Perfilador(perfil_id, modo, descripcion)
+    activo = perfilador.iniciar()
+    try:
+        yield perfilador
+    finally:
+        if activo:
+            perfilador.detener()
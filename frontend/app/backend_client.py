@@ -0,0 +1,81 @@
+import threading
+import zlib
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+# ========== SESIÓN COMPARTIDA CON EL BACKEND ==========
+# Todas las vistas usan la misma sesión, así las conexiones con Flask se
+# mantienen abiertas (keep-alive) y se reutilizan entre peticiones en vez de
+# abrir una conexión TCP nueva en cada una. Cada llamada lleva un timeout
+# para que un backend lento no deje colgado al worker de Django.
+_sesion = None
+_sesion_lock = threading.Lock()
+
+def _crear_sesion():
+    # Solo GET y HEAD se reintentan ante errores de lectura o 502/503/504; un
+    # POST solo se reintenta si la conexión falló antes de enviar nada
+    reintentos = Retry(
+        total=settings.BACKEND_REINTENTOS_GET,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False
+    )
+    adaptador = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.BACKEND_POOL_CONEXIONES,
+        max_retries=reintentos
+    )
+    sesion = requests.Session()
+    sesion.mount('http://', adaptador)
+    sesion.mount('https://', adaptador)
+    return sesion
+
+def obtener_sesion():
+    global _sesion
+    with _sesion_lock:
+        if _sesion is None:
+            _sesion = _crear_sesion()
+        return _sesion
+
+def _timeout(larga):
+    lectura = settings.BACKEND_TIMEOUT_LECTURA_LARGA if larga else settings.BACKEND_TIMEOUT_LECTURA
+    return (settings.BACKEND_TIMEOUT_CONEXION, lectura)
+
+def get(ruta, larga=False, **kwargs):
+    """GET a BACKEND_URL + ruta; con larga=True espera la respuesta por más tiempo"""
+    kwargs.setdefault('timeout', _timeout(larga))
+    return obtener_sesion().get(f'{settings.BACKEND_URL}{ruta}', **kwargs)
+
+def post(ruta, larga=False, **kwargs):
+    """POST a BACKEND_URL + ruta; con larga=True espera la respuesta por más tiempo"""
+    kwargs.setdefault('timeout', _timeout(larga))
+    return obtener_sesion().post(f'{settings.BACKEND_URL}{ruta}', **kwargs)
+
+# ========== CARGA DE ARCHIVOS ==========
+# Tamaño de cada parte leída del archivo subido
+TAMANO_PARTE_CARGA = 256 * 1024
+
+def _partes_gzip(partes):
+    """Comprime las partes a medida que pasan, sin juntar el archivo completo"""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = formato gzip
+    for parte in partes:
+        comprimido = compresor.compress(parte)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+def enviar_archivo(ruta, archivo, content_type='application/xml'):
+    """
+    Reenvía un archivo subido a Django (UploadedFile) por partes, con
+    Transfer-Encoding: chunked y gzip si BACKEND_COMPRIMIR_CARGAS. Ni Django
+    ni el backend tienen el archivo completo en memoria.
+    """
+    partes = archivo.chunks(TAMANO_PARTE_CARGA)
+    headers = {'Content-Type': content_type}
+    if settings.BACKEND_COMPRIMIR_CARGAS:
+        partes = _partes_gzip(partes)
+        headers['Content-Encoding'] = 'gzip'
+    return post(ruta, larga=True, data=partes, headers=headers)
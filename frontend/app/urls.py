@@ -10,6 +10,8 @@ urlpatterns = [
     path('reset/', views.reset_sistema, name='reset_sistema'),
     path('facturacion/', views.facturacion, name='facturacion'),
     path('reportes/', views.reportes, name='reportes'),
+    path('reportes/estado/<str:trabajo_id>/', views.estado_reporte, name='estado_reporte'),
+    path('reportes/descargar/<str:trabajo_id>/', views.descargar_reporte, name='descargar_reporte'),
     path('ayuda/', views.ayuda, name='ayuda'),
     # NUEVAS RUTAS PARA CREAR DATOS
     path('crear/recurso/', views.crear_recurso, name='crear_recurso'),
@@ -1,8 +1,7 @@
-import requests
 import json
 from django.shortcuts import render
-from django.http import JsonResponse
-from django.conf import settings
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from . import backend_client
 
 def home(request):
     return render(request, 'home.html')
@@ -10,14 +9,10 @@ def home(request):
 def configuracion(request):
     if request.method == 'POST' and request.FILES.get('archivo_xml'):
         archivo = request.FILES['archivo_xml']
-        xml_data = archivo.read().decode('utf-8')
         
         try:
-            response = requests.post(
-                f'{settings.BACKEND_URL}/configuracion',
-                data=xml_data,
-                headers={'Content-Type': 'application/xml'}
-            )
+            # El archivo se reenvía por partes, sin leerlo completo
+            response = backend_client.enviar_archivo('/configuracion', archivo)
             resultado = response.json()
             return JsonResponse(resultado)
         except Exception as e:
@@ -39,8 +34,8 @@ def crear_recurso(request):
             print(f"🎯 CREAR RECURSO - Datos recibidos: {data}")
             
             # Enviar al backend Flask
-            response = requests.post(
-                f'{settings.BACKEND_URL}/crear/recurso',
+            response = backend_client.post(
+                '/crear/recurso',
                 json=data,
                 headers={'Content-Type': 'application/json'}
             )
@@ -63,8 +58,8 @@ def crear_configuracion(request):
             
             print(f"🎯 CREAR CONFIGURACION - Datos recibidos: {data}")
             
-            response = requests.post(
-                f'{settings.BACKEND_URL}/crear/configuracion',
+            response = backend_client.post(
+                '/crear/configuracion',
                 json=data,
                 headers={'Content-Type': 'application/json'}
             )
@@ -87,8 +82,8 @@ def crear_categoria(request):
             
             print(f"🎯 CREAR CATEGORIA - Datos recibidos: {data}")
             
-            response = requests.post(
-                f'{settings.BACKEND_URL}/crear/categoria',
+            response = backend_client.post(
+                '/crear/categoria',
                 json=data,
                 headers={'Content-Type': 'application/json'}
             )
@@ -111,8 +106,8 @@ def crear_cliente(request):
             
             print(f"🎯 CREAR CLIENTE - Datos recibidos: {data}")
             
-            response = requests.post(
-                f'{settings.BACKEND_URL}/crear/cliente',
+            response = backend_client.post(
+                '/crear/cliente',
                 json=data,
                 headers={'Content-Type': 'application/json'}
             )
@@ -130,16 +125,12 @@ def crear_cliente(request):
 def consumo(request):
     if request.method == 'POST' and request.FILES.get('archivo_xml'):
         archivo = request.FILES['archivo_xml']
-        xml_data = archivo.read().decode('utf-8')
         
         try:
-            response = requests.post(
-                f'{settings.BACKEND_URL}/consumo',
-                data=xml_data,
-                headers={'Content-Type': 'application/xml'}
-            )
+            # El archivo se reenvía por partes, sin leerlo completo
+            response = backend_client.enviar_archivo('/consumo', archivo)
             resultado = response.json()
-            return JsonResponse(resultado)
+            return JsonResponse(resultado, status=response.status_code)
         except Exception as e:
             return JsonResponse({'error': str(e)})
     
@@ -147,13 +138,28 @@ def consumo(request):
 
 def consultar_datos(request):
     tipo = request.GET.get('tipo', 'configuraciones')
+    # Paginación y filtros (limite, cursor, nit, fecha_inicio, campos...) pasan tal cual al backend
+    parametros = {clave: valor for clave, valor in request.GET.items() if clave != 'tipo'}
     
     try:
-        response = requests.get(f'{settings.BACKEND_URL}/consultar/{tipo}')
-        print(f"🔍 CONSULTA - Tipo: {tipo}, Status: {response.status_code}")
-        print(f"🔍 CONSULTA - Datos: {response.text[:500]}...")  # Primeros 500 chars
-        datos = response.json()
-        return JsonResponse({'datos': datos})
+        response = backend_client.get(f'/consultar/{tipo}', params=parametros, stream=True)
+        print(f"🔍 CONSULTA - Tipo: {tipo}, Parámetros: {parametros}, Status: {response.status_code}")
+        
+        # El cuerpo se reenvía por bloques sin parsearlo ni volver a serializarlo.
+        # Una página ya viene como {'datos': [...], 'siguiente': ...}; la lista
+        # completa se envuelve en {'datos': ...} como antes.
+        def cuerpo():
+            # close() devuelve la conexión a la sesión aunque el navegador corte antes
+            try:
+                if not parametros:
+                    yield b'{"datos": '
+                yield from response.iter_content(chunk_size=64 * 1024)
+                if not parametros:
+                    yield b'}'
+            finally:
+                response.close()
+        
+        return StreamingHttpResponse(cuerpo(), status=response.status_code, content_type='application/json')
     except Exception as e:
         print(f"🔍 CONSULTA - Error: {e}")
         return JsonResponse({'error': str(e)})
@@ -162,7 +168,7 @@ def consultar_datos(request):
 def reset_sistema(request):
     if request.method == 'POST':
         try:
-            response = requests.post(f'{settings.BACKEND_URL}/reset')
+            response = backend_client.post('/reset')
             return JsonResponse(response.json())
         except Exception as e:
             return JsonResponse({'error': str(e)})
@@ -178,8 +184,9 @@ def facturacion(request):
         print(f"🎯 FRONTEND - Fecha inicio: '{fecha_inicio}', Fecha fin: '{fecha_fin}'")
         
         try:
-            response = requests.post(
-                f'{settings.BACKEND_URL}/facturacion',
+            response = backend_client.post(
+                '/facturacion',
+                larga=True,
                 json={'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin},
                 headers={'Content-Type': 'application/json'}
             )
@@ -203,16 +210,16 @@ def reportes(request):
         
         if tipo_reporte == 'factura':
             numero_factura = request.POST.get('numero_factura')
-            response = requests.post(
-                f'{settings.BACKEND_URL}/reporte/factura',
+            response = backend_client.post(
+                '/reporte/factura',
                 json={'numero_factura': numero_factura}
             )
         elif tipo_reporte == 'ventas':
             tipo_analisis = request.POST.get('tipo_analisis')
             fecha_inicio = request.POST.get('fecha_inicio')
             fecha_fin = request.POST.get('fecha_fin')
-            response = requests.post(
-                f'{settings.BACKEND_URL}/reporte/ventas',
+            response = backend_client.post(
+                '/reporte/ventas',
                 json={
                     'tipo': tipo_analisis,
                     'fecha_inicio': fecha_inicio,
@@ -222,4 +229,25 @@ def reportes(request):
         
         return JsonResponse(response.json())
     
-    return render(request, 'reportes.html')
\ No newline at end of file
+    return render(request, 'reportes.html')
+
+# Los reportes se generan en segundo plano en el backend; estas vistas
+# consultan el estado del trabajo y descargan el PDF terminado
+def estado_reporte(request, trabajo_id):
+    try:
+        response = backend_client.get(f'/reporte/trabajo/{trabajo_id}')
+        return JsonResponse(response.json(), status=response.status_code)
+    except Exception as e:
+        return JsonResponse({'error': str(e)})
+
+def descargar_reporte(request, trabajo_id):
+    try:
+        response = backend_client.get(f'/reporte/trabajo/{trabajo_id}/pdf')
+        if response.status_code != 200:
+            return JsonResponse(response.json(), status=response.status_code)
+    except Exception as e:
+        return JsonResponse({'error': str(e)})
+    
+    descarga = HttpResponse(response.content, content_type='application/pdf')
+    descarga['Content-Disposition'] = response.headers.get('Content-Disposition', f'attachment; filename="{trabajo_id}.pdf"')
+    return descarga
@@ -64,4 +64,14 @@ USE_TZ = True
 STATIC_URL = '/static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-BACKEND_URL = 'http://127.0.0.1:5000'
\ No newline at end of file
+BACKEND_URL = 'http://127.0.0.1:5000'
+# Conexiones con el backend (ver app/backend_client.py). Los tiempos están en
+# segundos; la lectura larga es para cargas de XML y facturación.
+BACKEND_TIMEOUT_CONEXION = 3
+BACKEND_TIMEOUT_LECTURA = 30
+BACKEND_TIMEOUT_LECTURA_LARGA = 300
+BACKEND_POOL_CONEXIONES = 20
+BACKEND_REINTENTOS_GET = 3
+
+# Comprimir con gzip los XML que se reenvían al backend
+BACKEND_COMPRIMIR_CARGAS = True